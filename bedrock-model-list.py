@@ -5,16 +5,367 @@ Generate BEDROCK_AWS_MODELS string for LibreChat by testing model availability
 with different prefixes (us., global., or no prefix).
 """
 
+import os
+import re
 import sys
+import csv
 import json
+import time
+import random
+import shutil
 import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-def test_model_with_prefix(bedrock_client, model_id, prefix="", strict=False, debug=False):
+# Prefixes are tried in this order for every model
+PREFIXES = ['us.', 'global.', '']
+
+# Outcome of a single model/prefix probe
+# latency is the time to the first streamed chunk (strict) or to the full
+# response (loose) in seconds, None if the model didn't answer
+ProbeResult = namedtuple('ProbeResult', ['working_id', 'error_code', 'latency'], defaults=[None])
+
+# Error codes that are a definite answer about a model/prefix pair and may be
+# cached. Throttling, timeouts and network errors are transient and are not.
+CACHEABLE_ERRORS = {
+    None,
+    'Skipped',
+    'ResourceNotFoundException',
+    'ValidationException',
+    'AccessDeniedException',
+    'ModelStreamingNotSupportedException',
+}
+
+# Fixed benchmark prompt: long enough to measure streaming throughput,
+# deterministic enough to produce similar output lengths across models
+BENCHMARK_PROMPT = "Count from 1 to 100, separated by commas. Do not write anything else."
+BENCHMARK_MAX_TOKENS = 400
+BENCHMARK_METRICS = ['connect', 'first_chunk', 'total', 'tokens_per_sec', 'chunk_interval']
+
+# Embedding benchmark defaults: the RAG API's embedding model, chunk sizes
+# around CHUNK_SIZE in .env.ochat and its default CHUNK_OVERLAP
+EMBED_MODEL = 'amazon.titan-embed-text-v2:0'
+EMBED_CHUNK_SIZES = [500, 1000, 1500, 3000, 5000]
+EMBED_CONCURRENCY = [1, 4, 8, 16]
+EMBED_CHUNK_OVERLAP = 100
+# Separators tried in order when splitting text, like langchain's RecursiveCharacterTextSplitter
+CHUNK_SEPARATORS = ['\n\n', '\n', '. ', ' ', '']
+TEXT_EXTENSIONS = ('.txt', '.md', '.rst', '.csv', '.json', '.html', '.htm', '.xml', '.tex', '.py')
+
+# Title tuning: LibreChat asks the titleModel for a short title after the
+# first message of every conversation. The corpus mixes the kinds of first
+# messages our users send, including non-English ones.
+TITLE_PROMPT = ("Please generate a concise title of 5 words or less for the conversation below, in the language "
+                "of the conversation, with no punctuation and in title case. Never mention the word title or the "
+                "language. Reply with the title only.\n\nUser: {message}")
+TITLE_CORPUS = [
+    "Can you help me write a cover letter for a postdoc position in computational biology?",
+    "Explain the difference between a t-test and a Mann-Whitney U test, and when should I use each?",
+    "My Python script fails with 'KeyError: date' when I read a CSV with pandas, what am I doing wrong?",
+    "Summarize the main arguments for and against remote work in three bullet points.",
+    "Wie berechne ich die Standardabweichung in Excel für mehrere Spalten?",
+    "¿Cuáles son los síntomas más comunes de la deficiencia de vitamina D?",
+    "Write a SLURM batch script that runs 20 array jobs with 4 GPUs each.",
+    "What should I pack for a week-long field trip to the Oregon coast in October?",
+    "Draft a polite email to my department chair asking for an extension on my grant report.",
+    "hi",
+]
+TITLE_MAX_TOKENS = 32
+TITLE_MAX_WORDS = 12
+# Title models whose p95 is within this fraction of the fastest one count as equally fast
+TITLE_P95_TOLERANCE = 0.05
+
+# Errors that leave a probe undecided; the model is re-queued with backoff
+RETRYABLE_ERRORS = {
+    'ThrottlingException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+# Outcomes that say nothing about the model itself: throttling or the probe budget being used up
+UNDECIDED_ERRORS = RETRYABLE_ERRORS | {'BudgetExceeded'}
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'our-chat', 'bedrock-probes.json'
+)
+
+
+class BudgetExceeded(Exception):
+    """Raised when the scheduler's total call budget is used up."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProbeScheduler:
+    """
+    Rate limits runtime invocations shared by all probe workers so probing
+    doesn't eat into the account quota that live LibreChat users rely on.
+    Every invocation takes a token from its region's bucket (max_rps) and
+    from its model's bucket (model_rps) and counts against max_calls.
+    A rate or budget of 0 means unlimited.
+    """
+
+    def __init__(self, max_rps=0, model_rps=0, max_calls=0, max_retries=4, backoff_base=1.0, backoff_max=30.0):
+        self.max_rps = max_rps
+        self.model_rps = model_rps
+        self.max_calls = max_calls
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.calls = 0
+        self.errors = {}
+
+    def _bucket(self, key, rate):
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(rate)
+            return self.buckets[key]
+
+    def acquire(self, region, model_id):
+        """Wait for a slot to invoke model_id in region; raise BudgetExceeded when out of calls."""
+        with self.lock:
+            if self.max_calls and self.calls >= self.max_calls:
+                raise BudgetExceeded(f"call budget of {self.max_calls} used up")
+            self.calls += 1
+        if self.max_rps:
+            self._bucket(('region', region), self.max_rps).acquire()
+        if self.model_rps:
+            self._bucket(('model', region, strip_prefix(model_id)), self.model_rps).acquire()
+
+    def record(self, error_code):
+        if error_code in RETRYABLE_ERRORS:
+            with self.lock:
+                self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+    def backoff(self, attempt):
+        """Seconds to wait before retry number `attempt` (0-based): exponential with full jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class ProbeCache:
+    """
+    On-disk JSON cache of probe outcomes keyed by region, model ID, prefix
+    and strict/loose mode (plus the API if not InvokeModel). Entries older
+    than ttl seconds are ignored. Only definite answers (see
+    CACHEABLE_ERRORS) are stored. The cache also remembers which foundation
+    models each region listed and, separately, which models --apply has
+    already decided on, so --apply can tell new models apart.
+    """
+
+    def __init__(self, path, ttl, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        self.catalog = {}
+        self.applied = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.entries = data.get('probes', {})
+                self.catalog = data.get('catalog', {})
+                self.applied = data.get('applied', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable probe cache {path}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def key(region, model_id, prefix, strict, api='invoke'):
+        mode = 'strict' if strict else 'loose'
+        if api != 'invoke':
+            mode = f"{mode}-{api}"
+        return f"{region}|{model_id}|{prefix}|{mode}"
+
+    def get(self, region, model_id, prefix, strict, api='invoke'):
+        """Return the cached ProbeResult or None if missing, expired or refreshing."""
+        with self.lock:
+            entry = None if self.refresh else self.entries.get(self.key(region, model_id, prefix, strict, api))
+            if entry is None or time.time() - entry['timestamp'] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return ProbeResult(entry['working_id'], entry['error_code'], entry.get('latency'))
+
+    def put(self, region, model_id, prefix, strict, result, api='invoke'):
+        if result.error_code not in CACHEABLE_ERRORS:
+            return
+        with self.lock:
+            self.entries[self.key(region, model_id, prefix, strict, api)] = {
+                'working_id': result.working_id,
+                'error_code': result.error_code,
+                'latency': result.latency,
+                'timestamp': time.time(),
+            }
+
+    def known_models(self, region):
+        """Model IDs seen in an earlier listing of the region, None if the region was never listed."""
+        with self.lock:
+            known = self.catalog.get(region)
+            return set(known) if known is not None else None
+
+    def remember_models(self, region, model_ids):
+        with self.lock:
+            self.catalog[region] = sorted(set(model_ids))
+
+    def applied_models(self, region):
+        """Model IDs --apply has decided on in the region, None if --apply never ran there."""
+        with self.lock:
+            applied = self.applied.get(region)
+            return set(applied) if applied is not None else None
+
+    def remember_applied(self, region, model_ids, listed):
+        """Add decided model IDs, forgetting models the region no longer lists."""
+        with self.lock:
+            kept = set(self.applied.get(region, [])) & set(listed)
+            self.applied[region] = sorted(kept | set(model_ids))
+
+    def save(self):
+        """Atomically write the cache, dropping expired entries."""
+        now = time.time()
+        with self.lock:
+            entries = {k: v for k, v in self.entries.items() if now - v['timestamp'] <= self.ttl}
+            catalog = dict(self.catalog)
+            applied = dict(self.applied)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'probes': entries, 'catalog': catalog, 'applied': applied}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _chat_body(prompt, max_tokens):
+    return {"messages": [{"role": "user", "content": prompt}], "max_tokens": max_tokens}
+
+
+# One entry per provider (or model family, matched by the longest prefix of
+# the base model ID). Each adapter builds the InvokeModel body and tells a
+# stream reader which chunk is the last one. None marks models that can't be
+# tested with a text prompt (embedding, rerank and image models). Providers
+# without an entry get the generic chat body.
+Adapter = namedtuple('Adapter', ['build', 'is_last_chunk'])
+
+PROVIDER_ADAPTERS = {
+    'anthropic': Adapter(
+        lambda prompt, max_tokens: {"max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}],
+                                    "anthropic_version": "bedrock-2023-05-31"},
+        lambda chunk: chunk.get('type') == 'message_stop'),
+    'meta': Adapter(
+        lambda prompt, max_tokens: {"prompt": prompt, "max_gen_len": max_tokens},
+        lambda chunk: chunk.get('stop_reason') is not None),
+    'amazon.nova': Adapter(
+        lambda prompt, max_tokens: {"messages": [{"role": "user", "content": [{"text": prompt}]}],
+                                    "inferenceConfig": {"maxTokens": max_tokens}},
+        lambda chunk: 'messageStop' in chunk),
+    'amazon': Adapter(
+        lambda prompt, max_tokens: {"inputText": prompt, "textGenerationConfig": {"maxTokenCount": max_tokens}},
+        lambda chunk: chunk.get('completionReason') is not None),
+    'ai21': Adapter(
+        lambda prompt, max_tokens: {"prompt": prompt, "maxTokens": max_tokens},
+        lambda chunk: False),
+    'cohere': Adapter(
+        lambda prompt, max_tokens: {"prompt": prompt, "max_tokens": max_tokens},
+        lambda chunk: chunk.get('is_finished', False)),
+    'mistral': Adapter(
+        lambda prompt, max_tokens: {"prompt": prompt, "max_tokens": max_tokens},
+        lambda chunk: any(o.get('stop_reason') for o in chunk.get('outputs', []))),
+    'deepseek': Adapter(
+        lambda prompt, max_tokens: {"prompt": prompt, "max_tokens": max_tokens},
+        lambda chunk: any(c.get('stop_reason') for c in chunk.get('choices', []))),
+    'openai': Adapter(
+        lambda prompt, max_tokens: {"messages": [{"role": "user", "content": prompt}],
+                                    "max_completion_tokens": max_tokens},
+        lambda chunk: any(c.get('finish_reason') for c in chunk.get('choices', []))),
+    'amazon.titan-embed': None,
+    'amazon.titan-image': None,
+    'amazon.nova-canvas': None,
+    'amazon.nova-reel': None,
+    'amazon.rerank': None,
+    'cohere.embed': None,
+    'cohere.rerank': None,
+    'stability': None,
+}
+
+GENERIC_ADAPTER = Adapter(_chat_body, lambda chunk: any(c.get('finish_reason') for c in chunk.get('choices', [])))
+
+# Probes only need the model to start answering
+PROBE_PROMPT = "Hi"
+PROBE_MAX_TOKENS = 1
+
+# Probe bodies are serialized once instead of on every call
+PROBE_BODIES = {
+    key: json.dumps(adapter.build(PROBE_PROMPT, PROBE_MAX_TOKENS))
+    for key, adapter in list(PROVIDER_ADAPTERS.items()) + [('', GENERIC_ADAPTER)]
+    if adapter is not None
+}
+
+# Request arguments for probing through the unified Converse API
+CONVERSE_PROBE = {
+    'messages': [{"role": "user", "content": [{"text": PROBE_PROMPT}]}],
+    'inferenceConfig': {"maxTokens": PROBE_MAX_TOKENS},
+}
+
+
+def find_adapter(base_model_id):
+    """
+    Return (key, adapter) for the longest PROVIDER_ADAPTERS key the base model
+    ID starts with, ('', GENERIC_ADAPTER) for unknown providers, or (key, None)
+    for models that can't be tested with a text prompt.
+    """
+    best_key = ''
+    for key in PROVIDER_ADAPTERS:
+        if (base_model_id == key or base_model_id.startswith(f"{key}.") or base_model_id.startswith(f"{key}-")) \
+                and len(key) > len(best_key):
+            best_key = key
+    if 'embed' in base_model_id:
+        return best_key, None
+    return best_key, PROVIDER_ADAPTERS[best_key] if best_key else GENERIC_ADAPTER
+
+
+def strip_prefix(model_id):
+    """Return the base model ID without a us./global. inference profile prefix."""
+    if model_id.startswith('us.') or model_id.startswith('global.'):
+        return model_id.split('.', 1)[1]
+    return model_id
+
+
+def probe_with_prefix(bedrock_client, model_id, prefix="", strict=False, debug=False, api='invoke'):
     """
     Test if a model works with the given prefix.
-    Returns the working model ID or None if it doesn't work.
+    Returns a ProbeResult with the working model ID (or None if it doesn't
+    work) and the Bedrock error code that decided the outcome (None on success).
+    With api='converse' the model is called through Converse/ConverseStream
+    instead of InvokeModel, which needs no provider-specific body.
     """
     # Check if model_id already has a prefix (us. or global.)
     if model_id.startswith('us.') or model_id.startswith('global.'):
@@ -27,114 +378,61 @@ def test_model_with_prefix(bedrock_client, model_id, prefix="", strict=False, de
         test_model_id = f"{prefix}{model_id}" if prefix else model_id
         base_model_id = model_id
 
-    # Prepare a minimal test payload based on model provider
-    provider = base_model_id.split('.')[0].lower()
+    # Pick the pre-serialized minimal test payload for the model provider
+    adapter_key, adapter = find_adapter(base_model_id)
 
     if debug:
-        print(f"  [DEBUG] Testing {test_model_id} (provider: {provider}, strict: {strict})", file=sys.stderr)
+        print(f"  [DEBUG] Testing {test_model_id} (adapter: {adapter_key or 'generic'}, strict: {strict}, api: {api})", file=sys.stderr)
 
-    try:
-        # Prepare test body based on provider
-        if provider == 'anthropic':
-            body = json.dumps({
-                "max_tokens": 10,
-                "messages": [{"role": "user", "content": "Hi"}],
-                "anthropic_version": "bedrock-2023-05-31",
-            })
-        elif provider == 'meta':
-            body = json.dumps({
-                "prompt": "Hi",
-                "max_gen_len": 10,
-            })
-        elif provider == 'amazon':
-            if 'embed' in base_model_id or 'titan-embed' in base_model_id:
-                # Skip embedding models - they require different testing
-                return None
-            elif 'image' in base_model_id:
-                # Skip image generation models
-                return None
-            elif 'nova' in base_model_id:
-                # Amazon Nova models use messages format (like OpenAI/Anthropic)
-                body = json.dumps({
-                    "messages": [{"role": "user", "content": [{"text": "Hi"}]}],
-                    "inferenceConfig": {
-                        "maxTokens": 10,
-                    }
-                })
-            else:
-                # Amazon Titan models use inputText format
-                body = json.dumps({
-                    "inputText": "Hi",
-                    "textGenerationConfig": {
-                        "maxTokenCount": 10,
-                    }
-                })
-        elif provider == 'ai21':
-            body = json.dumps({
-                "prompt": "Hi",
-                "maxTokens": 10,
-            })
-        elif provider == 'cohere':
-            if 'embed' in base_model_id:
-                # Skip embedding models
-                return None
-            body = json.dumps({
-                "prompt": "Hi",
-                "max_tokens": 10,
-            })
-        elif provider == 'mistral':
-            body = json.dumps({
-                "prompt": "Hi",
-                "max_tokens": 10,
-            })
-        elif provider == 'stability':
-            # Skip image generation models
-            return None
-        elif provider == 'openai':
-            body = json.dumps({
-                "messages": [{"role": "user", "content": "Hi"}],
-                "max_tokens": 10,
-            })
-        else:
-            # Generic attempt with messages format (most common)
-            body = json.dumps({
-                "messages": [{"role": "user", "content": "Hi"}],
-                "max_tokens": 10,
-            })
+    if adapter is None:
+        return ProbeResult(None, 'Skipped')
 
+    try:
         # Try to invoke the model
+        start = time.monotonic()
         if strict:
             # In strict mode, try streaming which is what LibreChat actually uses
-            response = bedrock_client.invoke_model_with_response_stream(
-                body=body,
-                modelId=test_model_id,
-                accept="application/json",
-                contentType="application/json"
-            )
-            # Try to read at least one event from the stream
-            event_stream = response.get('body')
-            for event in event_stream:
-                if 'chunk' in event:
-                    # Got a response chunk, model works
-                    if debug:
-                        print(f"    [RESULT] Got streaming response - model works!", file=sys.stderr)
-                    return test_model_id
+            if api == 'converse':
+                response = bedrock_client.converse_stream(modelId=test_model_id, **CONVERSE_PROBE)
+                event_stream = response.get('stream')
+            else:
+                response = bedrock_client.invoke_model_with_response_stream(
+                    body=PROBE_BODIES[adapter_key],
+                    modelId=test_model_id,
+                    accept="application/json",
+                    contentType="application/json"
+                )
+                event_stream = response.get('body')
+            # Try to read at least one event from the stream, then hang up so
+            # the pooled connection is released right away
+            try:
+                for event in event_stream:
+                    if event:
+                        # Got a response event, model works
+                        if debug:
+                            print(f"    [RESULT] Got streaming response - model works!", file=sys.stderr)
+                        return ProbeResult(test_model_id, None, time.monotonic() - start)
+            finally:
+                event_stream.close()
             # If no chunks, still check if we got past the initial request
             if debug:
                 print(f"    [RESULT] Streaming invocation succeeded (no chunks yet, but request went through)", file=sys.stderr)
-            return test_model_id
+            return ProbeResult(test_model_id, None, time.monotonic() - start)
         else:
             # Regular invoke (faster)
-            response = bedrock_client.invoke_model(
-                body=body,
-                modelId=test_model_id,
-                accept="application/json",
-                contentType="application/json"
-            )
+            if api == 'converse':
+                bedrock_client.converse(modelId=test_model_id, **CONVERSE_PROBE)
+            else:
+                bedrock_client.invoke_model(
+                    body=PROBE_BODIES[adapter_key],
+                    modelId=test_model_id,
+                    accept="application/json",
+                    contentType="application/json"
+                )
             # If we got here, the model invocation succeeded
             if debug:
                 print(f"    [RESULT] Regular invocation succeeded - model works!", file=sys.stderr)
-            return test_model_id
+            return ProbeResult(test_model_id, None, time.monotonic() - start)
 
     except ClientError as e:
         error_code = e.response['Error']['Code']
@@ -148,7 +446,7 @@ def test_model_with_prefix(bedrock_client, model_id, prefix="", strict=False, de
             # Model doesn't exist with this prefix - try next prefix
             if debug:
                 print(f"    [RESULT] ResourceNotFoundException - model not found, trying next prefix", file=sys.stderr)
-            return None
+            return ProbeResult(None, error_code)
         elif error_code == 'ValidationException':
             # Check if it's a "model not found" type validation error
             # Look for specific patterns that indicate wrong prefix/model not available
@@ -166,51 +464,60 @@ def test_model_with_prefix(bedrock_client, model_id, prefix="", strict=False, de
             if any(pattern in error_message_lower for pattern in not_found_patterns):
                 if debug:
                     print(f"    [RESULT] ValidationException with 'not found' pattern - rejecting prefix", file=sys.stderr)
-                return None
+                return ProbeResult(None, error_code)
             # In strict mode, ValidationException is more suspect - could be wrong prefix
             if strict:
                 if debug:
                     print(f"    [RESULT] ValidationException in strict mode (streaming) - might be wrong prefix, skipping", file=sys.stderr)
-                return None
+                return ProbeResult(None, error_code)
             # Otherwise it's probably just our test payload format - model exists
             if debug:
                 print(f"    [RESULT] ValidationException (non-strict) - assuming model exists", file=sys.stderr)
-            return test_model_id
+            return ProbeResult(test_model_id, error_code)
         elif error_code == 'AccessDeniedException':
             # Model exists but no access - count it as working for config
             if debug:
                 print(f"    [RESULT] AccessDeniedException - model exists but no access (OK for config)", file=sys.stderr)
-            return test_model_id
-        elif error_code == 'ThrottlingException':
-            # Throttled but model exists
+            return ProbeResult(test_model_id, error_code)
+        elif error_code in RETRYABLE_ERRORS:
+            # Throttled or temporarily unavailable - says nothing about the prefix,
+            # the scheduler re-queues the model instead of counting it as a pass
             if debug:
-                print(f"    [RESULT] ThrottlingException - model exists but throttled (OK)", file=sys.stderr)
-            return test_model_id
+                print(f"    [RESULT] {error_code} - undecided, will retry later", file=sys.stderr)
+            return ProbeResult(None, error_code)
         elif error_code == 'ModelStreamingNotSupportedException':
             # Model exists but doesn't support streaming - still valid
             if debug:
                 print(f"    [RESULT] ModelStreamingNotSupportedException - model exists but no streaming", file=sys.stderr)
-            return test_model_id
+            return ProbeResult(test_model_id, error_code)
         else:
             # Other errors - be more strict in strict mode
             if 'not found' in error_message_lower or 'does not exist' in error_message_lower:
                 if debug:
                     print(f"    [RESULT] Other error with 'not found' pattern - rejecting", file=sys.stderr)
-                return None
+                return ProbeResult(None, error_code)
             if strict:
                 # In strict mode, unknown errors = model probably doesn't work
                 if debug:
                     print(f"    [RESULT] Other error in strict mode - rejecting to be safe", file=sys.stderr)
-                return None
+                return ProbeResult(None, error_code)
             # In normal mode, be lenient
             if debug:
                 print(f"    [RESULT] Other error (non-strict) - assuming model exists but request failed", file=sys.stderr)
-            return test_model_id
+            return ProbeResult(test_model_id, error_code)
     except Exception as e:
         # Any other error - skip
         if debug:
             print(f"    [EXCEPTION] {type(e).__name__}: {e}", file=sys.stderr)
-        return None
+        return ProbeResult(None, type(e).__name__)
+
+
+def test_model_with_prefix(bedrock_client, model_id, prefix="", strict=False, debug=False, api='invoke'):
+    """
+    Test if a model works with the given prefix.
+    Returns the working model ID or None if it doesn't work.
+    """
+    return probe_with_prefix(bedrock_client, model_id, prefix, strict=strict, debug=debug, api=api).working_id
 
 
 def get_foundation_models(region='us-west-2'):
@@ -224,6 +531,60 @@ def get_foundation_models(region='us-west-2'):
         sys.exit(1)
 
 
+def get_inference_profiles(region='us-west-2'):
+    """Get all system-defined inference profiles from Bedrock (paginated)."""
+    try:
+        bedrock = boto3.client(service_name='bedrock', region_name=region)
+        paginator = bedrock.get_paginator('list_inference_profiles')
+        profiles = []
+        for page in paginator.paginate(typeEquals='SYSTEM_DEFINED'):
+            profiles.extend(page.get('inferenceProfileSummaries', []))
+        return profiles
+    except Exception as e:
+        print(f"Error listing inference profiles: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def build_profile_index(profiles):
+    """
+    Map each base model ID to the set of prefixes ('us.', 'global.') for
+    which an inference profile exists, e.g.
+    {'anthropic.claude-sonnet-4-6': {'us.', 'global.'}}
+    """
+    index = {}
+    for profile in profiles:
+        profile_prefix, _, base_model_id = profile.get('inferenceProfileId', '').partition('.')
+        prefix = f"{profile_prefix}."
+        if prefix in PREFIXES and base_model_id:
+            index.setdefault(base_model_id, set()).add(prefix)
+    return index
+
+
+def resolve_from_metadata(model_summary, profile_index):
+    """
+    Work out the model ID to use from list_foundation_models /
+    list_inference_profiles metadata alone, using the same prefix order as
+    the probes. Returns (working_id, prefix), (None, None) for models that
+    can't be used for chat (embedding, image), or None if the metadata
+    doesn't settle it and the model has to be probed.
+    """
+    model_id = model_summary.get('modelId', '')
+    output_modalities = model_summary.get('outputModalities')
+    if output_modalities and 'TEXT' not in output_modalities:
+        return None, None
+    if 'embed' in model_id:
+        return None, None
+
+    profile_prefixes = profile_index.get(model_id, set())
+    inference_types = model_summary.get('inferenceTypesSupported', [])
+    for prefix in PREFIXES:
+        if prefix and prefix in profile_prefixes:
+            return f"{prefix}{model_id}", prefix
+        if not prefix and 'ON_DEMAND' in inference_types:
+            return model_id, prefix
+    return None
+
+
 def filter_models(models, ignore_list):
     """Filter out models that start with any string in ignore_list."""
     if not ignore_list:
@@ -243,28 +604,138 @@ def filter_models(models, ignore_list):
     return filtered
 
 
-def find_working_models(models, bedrock_runtime_client, verbose=False, strict=False, debug=False):
+def create_runtime_client(region='us-west-2', jobs=1):
+    """
+    Create one bedrock-runtime client shared by all probe workers.
+    boto3 clients are thread-safe; the connection pool is sized to the
+    number of workers so parallel probes don't wait for a free connection.
+    botocore's own retries are off: throttled probes are re-queued by
+    probe_models so every call goes through the ProbeScheduler.
+    """
+    return boto3.client(
+        service_name='bedrock-runtime',
+        region_name=region,
+        config=Config(max_pool_connections=max(10, jobs), retries={'total_max_attempts': 1})
+    )
+
+
+def probe_model(bedrock_runtime_client, model_id, strict=False, debug=False, cache=None, api='invoke', scheduler=None,
+                prefixes=PREFIXES):
+    """
+    Try each of `prefixes` in order and return (working_id, prefix, latency, error_code).
+    Returns (None, None, None, None) if the model doesn't work with any prefix.
+    If a prefix probe is throttled (see RETRYABLE_ERRORS) or the scheduler's
+    budget is used up, the model is undecided and (None, None, None, error_code)
+    is returned so the caller can re-queue it.
+    If a ProbeCache is given, fresh cached outcomes are used instead of
+    invoking the model and new outcomes are recorded.
+    """
+    region = bedrock_runtime_client.meta.region_name
+    for prefix in prefixes:
+        result = cache.get(region, model_id, prefix, strict, api) if cache else None
+        if result is None:
+            if scheduler:
+                try:
+                    scheduler.acquire(region, model_id)
+                except BudgetExceeded:
+                    return None, None, None, 'BudgetExceeded'
+            result = probe_with_prefix(bedrock_runtime_client, model_id, prefix, strict=strict, debug=debug, api=api)
+            if scheduler:
+                scheduler.record(result.error_code)
+            if cache:
+                cache.put(region, model_id, prefix, strict, result, api)
+        elif debug:
+            print(f"  [CACHE] {prefix}{model_id}: {result.error_code or 'OK'}", file=sys.stderr)
+        if result.working_id:
+            return result.working_id, prefix, result.latency, None
+        if result.error_code in RETRYABLE_ERRORS:
+            return None, None, None, result.error_code
+    return None, None, None, None
+
+
+def probe_models(models, bedrock_runtime_client, strict=False, debug=False, jobs=1, cache=None, profile_index=None,
+                 api='invoke', scheduler=None):
+    """
+    Resolve every model summary and return one dict per model, in input order:
+    {'model_id', 'working_id', 'prefix', 'latency', 'source', 'error_code'}.
+    With jobs > 1 models are probed in parallel.
+    If a profile_index (see build_profile_index) is given, models are resolved
+    from metadata first and only probed when the metadata isn't conclusive.
+    Models whose probes were throttled are re-queued after a jittered
+    exponential backoff, up to scheduler.max_retries rounds; if they are
+    still undecided, error_code says why and they count as not working.
+    """
+    def probe(model_summary):
+        model_id = model_summary.get('modelId', '')
+        source = 'metadata'
+        error_code = None
+        resolved = resolve_from_metadata(model_summary, profile_index) if profile_index is not None else None
+        if resolved is not None:
+            working_id, prefix = resolved
+            latency = None
+        else:
+            source = 'probe'
+            working_id, prefix, latency, error_code = probe_model(bedrock_runtime_client, model_id, strict=strict,
+                                                                  debug=debug, cache=cache, api=api,
+                                                                  scheduler=scheduler)
+        return {
+            'model_id': model_id,
+            'working_id': working_id,
+            'prefix': prefix,
+            'latency': latency,
+            'source': source,
+            'error_code': error_code,
+        }
+
+    results = [None] * len(models)
+    pending = list(range(len(models)))
+    max_retries = scheduler.max_retries if scheduler else 0
+    executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        for attempt in range(max_retries + 1):
+            batch = [models[i] for i in pending]
+            # executor.map yields results in submission order
+            for i, result in zip(pending, executor.map(probe, batch) if executor else map(probe, batch)):
+                results[i] = result
+            pending = [i for i in pending if results[i]['error_code'] in RETRYABLE_ERRORS]
+            if not pending or attempt == max_retries:
+                break
+            delay = scheduler.backoff(attempt)
+            if debug:
+                print(f"  [SCHEDULER] {len(pending)} throttled models re-queued, retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+    finally:
+        if executor:
+            executor.shutdown()
+    return results
+
+
+def find_working_models(models, bedrock_runtime_client, verbose=False, strict=False, debug=False, jobs=1, cache=None,
+                        profile_index=None, api='invoke', scheduler=None):
     """
     Test each model with different prefixes and return list of working model IDs.
     If strict=True, use streaming to validate (like LibreChat does).
+    With jobs > 1 models are probed in parallel; results are still reported
+    and returned in the order of the input list.
     """
     working_models = []
 
-    for model_summary in models:
-        model_id = model_summary.get('modelId', '')
+    for result in probe_models(models, bedrock_runtime_client, strict, debug, jobs, cache, profile_index, api, scheduler):
+        model_id = result['model_id']
+        working_id = result['working_id']
+        prefix = result['prefix']
 
         if verbose:
             print(f"Testing {model_id}...", file=sys.stderr)
 
-        # Try prefixes in order: us., global., no prefix
-        for prefix in ['us.', 'global.', '']:
-            working_id = test_model_with_prefix(bedrock_runtime_client, model_id, prefix, strict=strict, debug=debug)
-            if working_id:
-                if verbose:
-                    prefix_str = f"with prefix '{prefix}'" if prefix else "without prefix"
-                    print(f"  ✓ {model_id} works {prefix_str} -> {working_id}", file=sys.stderr)
-                working_models.append(working_id)
-                break
+        if working_id:
+            if verbose:
+                prefix_str = f"with prefix '{prefix}'" if prefix else "without prefix"
+                print(f"  ✓ {model_id} works {prefix_str} -> {working_id} ({result['source']})", file=sys.stderr)
+            working_models.append(working_id)
+        elif result['error_code']:
+            if verbose:
+                print(f"  ? {model_id} undecided ({result['error_code']}), not included", file=sys.stderr)
         else:
             if verbose:
                 print(f"  ✗ {model_id} doesn't work with any prefix", file=sys.stderr)
@@ -272,6 +743,948 @@ def find_working_models(models, bedrock_runtime_client, verbose=False, strict=Fa
     return working_models
 
 
+def probe_region(region, ignore_list, strict=False, debug=False, jobs=1, cache=None, resolve='probe', api='invoke',
+                 scheduler=None):
+    """List, filter and probe all foundation models of one region (see probe_models)."""
+    listed = get_foundation_models(region)
+    if cache:
+        cache.remember_models(region, [m.get('modelId', '') for m in listed])
+    models = filter_models(listed, ignore_list)
+    profile_index = build_profile_index(get_inference_profiles(region)) if resolve == 'metadata' else None
+    bedrock_runtime = create_runtime_client(region, jobs)
+    return probe_models(models, bedrock_runtime, strict, debug, jobs, cache, profile_index, api, scheduler)
+
+
+def probe_regions(regions, ignore_list, strict=False, debug=False, jobs=1, cache=None, resolve='probe', api='invoke',
+                  scheduler=None):
+    """Probe all regions concurrently and return {region: probe_region results}."""
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = {
+            region: executor.submit(probe_region, region, ignore_list, strict, debug, jobs, cache, resolve, api, scheduler)
+            for region in regions
+        }
+        return {region: future.result() for region, future in futures.items()}
+
+
+def select_best_regions(results_by_region, regions):
+    """
+    Combine per-region probe results into one entry per model:
+    {'model_id', 'working_id', 'best_region', 'latency', 'regions': {region: {'working_id', 'latency'}}}.
+    The best region is the working one with the lowest first-byte latency;
+    if no latency was measured (metadata or cached results without timing)
+    the first working region in the given order is used. Models keep the
+    order in which they first appear, scanning regions in the given order.
+    """
+    choices = {}
+    for region in regions:
+        for result in results_by_region.get(region, []):
+            if not result['working_id']:
+                continue
+            choice = choices.setdefault(result['model_id'], {'model_id': result['model_id'], 'regions': {}})
+            choice['regions'][region] = {'working_id': result['working_id'], 'latency': result['latency']}
+
+    for choice in choices.values():
+        working = list(choice['regions'].items())
+        timed = [item for item in working if item[1]['latency'] is not None]
+        best_region, best = min(timed, key=lambda item: item[1]['latency']) if timed else working[0]
+        choice['best_region'] = best_region
+        choice['working_id'] = best['working_id']
+        choice['latency'] = best['latency']
+
+    return list(choices.values())
+
+
+def print_region_report(region_choices, regions):
+    """Print a table of working regions, prefixes and latencies per model to stderr."""
+    def cell(info):
+        if info is None:
+            return '-'
+        prefix = info['working_id'].split('.', 1)[0] + '.' if info['working_id'].startswith(('us.', 'global.')) else ''
+        latency = f"{info['latency'] * 1000:.0f}ms" if info['latency'] is not None else 'n/a'
+        return f"{prefix or '(none)'} {latency}"
+
+    width = max([len(c['model_id']) for c in region_choices] + [5])
+    print(f"{'MODEL':<{width}}  " + '  '.join(f"{r:<16}" for r in regions) + "  BEST", file=sys.stderr)
+    for choice in region_choices:
+        cells = '  '.join(f"{cell(choice['regions'].get(r)):<16}" for r in regions)
+        print(f"{choice['model_id']:<{width}}  {cells}  {choice['best_region']}", file=sys.stderr)
+    print("", file=sys.stderr)
+
+
+def benchmark_invocation(bedrock_client, model_id, prompt=BENCHMARK_PROMPT, max_tokens=BENCHMARK_MAX_TOKENS, api='invoke'):
+    """
+    Stream one response and return its timings in seconds:
+    connect (until the response headers arrived), first_chunk, total,
+    chunk_interval (mean gap between chunks), output_tokens and
+    tokens_per_sec (output tokens over the time after the first chunk).
+    On failure only {'error': <error code>} is returned.
+    """
+    _, adapter = find_adapter(strip_prefix(model_id))
+    if adapter is None:
+        return {'error': 'Skipped'}
+
+    start = time.monotonic()
+    first_chunk = last_chunk = None
+    chunks = 0
+    output_tokens = None
+    try:
+        if api == 'converse':
+            response = bedrock_client.converse_stream(
+                modelId=model_id,
+                messages=[{"role": "user", "content": [{"text": prompt}]}],
+                inferenceConfig={"maxTokens": max_tokens},
+            )
+            event_stream = response.get('stream')
+        else:
+            response = bedrock_client.invoke_model_with_response_stream(
+                body=json.dumps(adapter.build(prompt, max_tokens)),
+                modelId=model_id,
+                accept="application/json",
+                contentType="application/json"
+            )
+            event_stream = response.get('body')
+        connect = time.monotonic() - start
+        try:
+            for event in event_stream:
+                if api == 'converse':
+                    if 'metadata' in event:
+                        output_tokens = event['metadata'].get('usage', {}).get('outputTokens')
+                        break
+                    if 'contentBlockDelta' not in event:
+                        continue
+                elif 'chunk' not in event:
+                    continue
+                last_chunk = time.monotonic() - start
+                if first_chunk is None:
+                    first_chunk = last_chunk
+                chunks += 1
+                if api == 'converse':
+                    continue
+                try:
+                    payload = json.loads(event['chunk']['bytes'])
+                except (KeyError, ValueError):
+                    continue
+                # Bedrock appends the token counts to the last chunk of every stream
+                metrics = payload.get('amazon-bedrock-invocationMetrics')
+                if metrics:
+                    output_tokens = metrics.get('outputTokenCount')
+                if metrics or adapter.is_last_chunk(payload):
+                    break
+        finally:
+            event_stream.close()
+        total = (last_chunk if last_chunk is not None else time.monotonic() - start)
+    except ClientError as e:
+        return {'error': e.response['Error']['Code']}
+    except Exception as e:
+        return {'error': type(e).__name__}
+
+    if first_chunk is None:
+        return {'error': 'NoChunks'}
+    generation_time = total - first_chunk
+    return {
+        'connect': connect,
+        'first_chunk': first_chunk,
+        'total': total,
+        'chunk_interval': (last_chunk - first_chunk) / (chunks - 1) if chunks > 1 else None,
+        'output_tokens': output_tokens,
+        'tokens_per_sec': output_tokens / generation_time if output_tokens and generation_time > 0 else None,
+    }
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers, None if empty."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize_benchmark(model_id, region, runs):
+    """Reduce the runs of one model to p50/p95/p99 per metric plus error counts."""
+    ok_runs = [run for run in runs if 'error' not in run]
+    errors = {}
+    for run in runs:
+        if 'error' in run:
+            errors[run['error']] = errors.get(run['error'], 0) + 1
+    summary = {
+        'model': model_id,
+        'region': region,
+        'runs': len(runs),
+        'errors': sum(errors.values()),
+        'error_codes': ' '.join(f"{code}:{count}" for code, count in sorted(errors.items())),
+    }
+    tokens = [run['output_tokens'] for run in ok_runs if run['output_tokens'] is not None]
+    summary['output_tokens_p50'] = percentile(tokens, 50)
+    for metric in BENCHMARK_METRICS:
+        values = [run[metric] for run in ok_runs if run[metric] is not None]
+        for pct in (50, 95, 99):
+            summary[f"{metric}_p{pct}"] = percentile(values, pct)
+    return summary
+
+
+def run_benchmark(model_regions, repeat=5, jobs=1, verbose=False, api='invoke'):
+    """
+    Benchmark each (model_id, region) pair with `repeat` sequential streamed
+    invocations. Models run one at a time so they don't compete for
+    bandwidth or quota and skew each other's latency.
+    Returns one summary dict per model (see summarize_benchmark).
+    """
+    clients = {}
+    summaries = []
+    for model_id, region in model_regions:
+        if region not in clients:
+            clients[region] = create_runtime_client(region, jobs)
+        if verbose:
+            print(f"Benchmarking {model_id} in {region} ({repeat} runs)...", file=sys.stderr)
+        runs = [benchmark_invocation(clients[region], model_id, api=api) for _ in range(repeat)]
+        summaries.append(summarize_benchmark(model_id, region, runs))
+    return summaries
+
+
+def write_benchmark_report(summaries, path):
+    """Write benchmark summaries as CSV (*.csv) or JSON (anything else)."""
+    with open(path, 'w', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()) if summaries else ['model'])
+            writer.writeheader()
+            writer.writerows(summaries)
+        else:
+            json.dump(summaries, f, indent=2)
+
+
+def print_benchmark_table(summaries):
+    """Print models ranked by median time to first chunk."""
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else '-'
+
+    def rate(value):
+        return f"{value:.1f}" if value is not None else '-'
+
+    ranked = sorted(summaries, key=lambda s: (s['first_chunk_p50'] is None, s['first_chunk_p50'] or 0))
+    width = max([len(s['model']) for s in ranked] + [5])
+    print(f"{'RANK':>4}  {'MODEL':<{width}}  {'REGION':<12} {'TTFT p50':>9} {'p95':>6} {'p99':>6} "
+          f"{'TOTAL p50':>10} {'TOK/S p50':>10} {'CHUNK ms':>9} {'ERR':>4}")
+    for rank, s in enumerate(ranked, 1):
+        print(f"{rank:>4}  {s['model']:<{width}}  {s['region']:<12} {ms(s['first_chunk_p50']):>9} "
+              f"{ms(s['first_chunk_p95']):>6} {ms(s['first_chunk_p99']):>6} {ms(s['total_p50']):>10} "
+              f"{rate(s['tokens_per_sec_p50']):>10} {ms(s['chunk_interval_p50']):>9} {s['errors']:>4}")
+
+
+def read_corpus(path):
+    """
+    Return [(name, text)] for a file or all text files and PDFs below a
+    directory. PDFs need pypdf, like the RAG API they are read page by page.
+    """
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                       if name.lower().endswith(TEXT_EXTENSIONS + ('.pdf',)))
+    documents = []
+    for file_path in paths:
+        if file_path.lower().endswith('.pdf'):
+            try:
+                import pypdf
+            except ImportError:
+                print('pypdf missing, to install run:\n python3 -m pip install --upgrade pypdf')
+                sys.exit(1)
+            text = '\n\n'.join(page.extract_text() or '' for page in pypdf.PdfReader(file_path).pages)
+        else:
+            with open(file_path, encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        if text.strip():
+            documents.append((os.path.relpath(file_path, path) if file_path != path else file_path, text))
+    return documents
+
+
+def split_text(text, chunk_size, overlap=0, separators=CHUNK_SEPARATORS):
+    """
+    Split text into chunks of at most chunk_size characters at the coarsest
+    separator that works (paragraphs, lines, sentences, words), repeating up
+    to `overlap` characters of whole pieces from the end of a chunk at the
+    start of the next one.
+    """
+    separator = next((s for s in separators if s == '' or s in text), '')
+    pieces = text.split(separator) if separator else list(text)
+    finer = separators[separators.index(separator) + 1:] if separator else []
+
+    # current holds the pieces of the chunk being built, length their joined length
+    chunks, current, length = [], [], 0
+    for piece in pieces:
+        if len(piece) > chunk_size:
+            if current:
+                chunks.append(separator.join(current))
+                current, length = [], 0
+            chunks.extend(split_text(piece, chunk_size, overlap, finer) if finer else
+                          [piece[i:i + chunk_size] for i in range(0, len(piece), chunk_size)])
+            continue
+        if current and length + len(separator) + len(piece) > chunk_size:
+            chunks.append(separator.join(current))
+            # Carry the trailing pieces that fit into the overlap over to the next chunk
+            while current and (length > overlap or length + len(separator) + len(piece) > chunk_size):
+                length -= len(current.pop(0))
+                length = length - len(separator) if current else 0
+        length += len(piece) + (len(separator) if current else 0)
+        current.append(piece)
+    if current:
+        chunks.append(separator.join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def embedding_body(model_id, text):
+    """InvokeModel body for one chunk: Titan takes inputText, Cohere a list of texts."""
+    base_model_id = strip_prefix(model_id)
+    if base_model_id.startswith('cohere.embed'):
+        return {'texts': [text], 'input_type': 'search_document', 'truncate': 'END'}
+    if base_model_id.startswith('amazon.titan-embed-text-v2'):
+        return {'inputText': text, 'dimensions': 1024, 'normalize': True}
+    return {'inputText': text}
+
+
+def embed_chunk(bedrock_client, model_id, text, scheduler):
+    """
+    Embed one chunk, retrying throttled calls with the scheduler's backoff.
+    Returns {'latency' (including backoff), 'throttled', 'tokens', 'error'}.
+    """
+    body = json.dumps(embedding_body(model_id, text))
+    start = time.monotonic()
+    throttled = 0
+    for attempt in range(scheduler.max_retries + 1):
+        try:
+            response = bedrock_client.invoke_model(body=body, modelId=model_id, accept="application/json",
+                                                   contentType="application/json")
+            payload = json.loads(response['body'].read())
+            return {'latency': time.monotonic() - start, 'throttled': throttled,
+                    'tokens': payload.get('inputTextTokenCount'), 'error': None}
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code not in RETRYABLE_ERRORS:
+                return {'latency': time.monotonic() - start, 'throttled': throttled, 'tokens': None,
+                        'error': error_code}
+            scheduler.record(error_code)
+            throttled += 1
+            if attempt < scheduler.max_retries:
+                time.sleep(scheduler.backoff(attempt))
+        except Exception as e:
+            return {'latency': time.monotonic() - start, 'throttled': throttled, 'tokens': None,
+                    'error': type(e).__name__}
+    return {'latency': time.monotonic() - start, 'throttled': throttled, 'tokens': None, 'error': 'ThrottlingException'}
+
+
+def run_embedding_case(bedrock_client, model_id, documents, chunk_size, overlap, concurrency, scheduler):
+    """
+    Chunk the documents at chunk_size and embed all chunks with `concurrency`
+    parallel calls. Returns the throughput and latency summary of the case.
+    """
+    chunks = [(index, chunk) for index, (_, text) in enumerate(documents)
+              for chunk in split_text(text, chunk_size, overlap)]
+
+    # When the first chunk of every document was sent and the last one embedded
+    started, finished = {}, {}
+    lock = threading.Lock()
+
+    def embed(item):
+        index, chunk = item
+        with lock:
+            started.setdefault(index, time.monotonic())
+        result = embed_chunk(bedrock_client, model_id, chunk, scheduler)
+        with lock:
+            finished[index] = time.monotonic()
+        return result
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(embed, chunks))
+    wall = time.monotonic() - start
+
+    ok = [r for r in results if not r['error']]
+    calls = len(results) + sum(r['throttled'] for r in results)
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    latencies = [r['latency'] for r in ok]
+    tokens = [r['tokens'] for r in ok if r['tokens']]
+    return {
+        'model': model_id,
+        'chunk_size': chunk_size,
+        'concurrency': concurrency,
+        'documents': len(documents),
+        'chunks': len(chunks),
+        'wall_seconds': wall,
+        'documents_per_sec': len(documents) / wall if wall else None,
+        'chunks_per_sec': len(ok) / wall if wall else None,
+        'tokens_per_sec': sum(tokens) / wall if wall and tokens else None,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'slowest_document_seconds': max(finished[i] - started[i] for i in finished) if finished else None,
+        'throttled': sum(r['throttled'] for r in results),
+        'throttle_rate': sum(r['throttled'] for r in results) / calls if calls else 0,
+        'errors': sum(errors.values()),
+        'error_codes': ' '.join(f"{code}:{count}" for code, count in sorted(errors.items())),
+    }
+
+
+def recommend_embedding_settings(summaries, max_throttle_rate=0.01, tolerance=0.8):
+    """
+    Pick the concurrency and CHUNK_SIZE for the RAG API. Cases that failed
+    chunks or were throttled more than max_throttle_rate are out. Per chunk
+    size, the concurrency is the lowest that reaches 90% of that size's best
+    throughput. Bigger chunks always need fewer calls, but retrieve less
+    precisely, so the chunk size is the smallest one whose throughput is
+    within `tolerance` of the fastest. Returns the summary of the chosen case
+    or None.
+    """
+    healthy = [s for s in summaries if not s['errors'] and s['throttle_rate'] <= max_throttle_rate
+               and s['documents_per_sec']]
+    if not healthy:
+        return None
+    knees = []
+    for chunk_size in sorted({s['chunk_size'] for s in healthy}):
+        cases = sorted((s for s in healthy if s['chunk_size'] == chunk_size), key=lambda s: s['concurrency'])
+        best = max(s['documents_per_sec'] for s in cases)
+        knees.append(next(s for s in cases if s['documents_per_sec'] >= 0.9 * best))
+    fastest = max(s['documents_per_sec'] for s in knees)
+    return next(s for s in knees if s['documents_per_sec'] >= tolerance * fastest)
+
+
+def print_embedding_table(summaries, recommendation, max_throttle_rate=0.01):
+    def number(value, digits=1):
+        return f"{value:.{digits}f}" if value is not None else '-'
+
+    print(f"{'CHUNK':>6} {'CONC':>5} {'DOCS':>5} {'CHUNKS':>7} {'DOCS/s':>8} {'CHUNKS/s':>9} {'TOK/s':>8} "
+          f"{'P50 ms':>7} {'P95 ms':>7} {'SLOWEST s':>10} {'THROTTLED':>11} {'ERR':>4}")
+    for s in summaries:
+        mark = ' <' if s is recommendation else ''
+        print(f"{s['chunk_size']:>6} {s['concurrency']:>5} {s['documents']:>5} {s['chunks']:>7} "
+              f"{number(s['documents_per_sec'], 2):>8} {number(s['chunks_per_sec']):>9} "
+              f"{number(s['tokens_per_sec'], 0):>8} {number(s['latency_p50'] and s['latency_p50'] * 1000, 0):>7} "
+              f"{number(s['latency_p95'] and s['latency_p95'] * 1000, 0):>7} "
+              f"{number(s['slowest_document_seconds']):>10} {s['throttled']:>4} ({s['throttle_rate']:>4.0%}) "
+              f"{s['errors']:>4}{mark}")
+    print()
+    if recommendation:
+        print(f"Recommended: CHUNK_SIZE={recommendation['chunk_size']} with {recommendation['concurrency']} parallel "
+              f"embedding calls ({recommendation['documents_per_sec']:.2f} documents/s, "
+              f"p95 {recommendation['latency_p95'] * 1000:.0f} ms per chunk)")
+    else:
+        print(f"No setting embedded all chunks with at most {max_throttle_rate:.0%} throttled calls, "
+              f"try lower --embed-concurrency or ask AWS for a higher quota")
+
+
+def run_embedding_benchmark(region, model_id, corpus, chunk_sizes, concurrency_levels, overlap=EMBED_CHUNK_OVERLAP,
+                            max_chunks=0, max_retries=4, verbose=False):
+    """
+    Benchmark every chunk size and concurrency combination on the same
+    documents; returns the case summaries. With max_chunks only the first
+    documents of the corpus are used, up to that many chunks at the
+    smallest chunk size.
+    """
+    documents = read_corpus(corpus)
+    if not documents:
+        print(f"No text files or PDFs found in {corpus}", file=sys.stderr)
+        sys.exit(1)
+    if max_chunks:
+        selected, chunks = [], 0
+        for document in documents:
+            chunks += len(split_text(document[1], min(chunk_sizes), overlap))
+            if selected and chunks > max_chunks:
+                break
+            selected.append(document)
+        documents = selected
+    client = create_runtime_client(region, max(concurrency_levels))
+    summaries = []
+    for chunk_size in chunk_sizes:
+        for concurrency in concurrency_levels:
+            scheduler = ProbeScheduler(max_retries=max_retries, backoff_base=0.2, backoff_max=5)
+            if verbose:
+                print(f"Embedding {len(documents)} documents with {model_id} at CHUNK_SIZE={chunk_size}, "
+                      f"{concurrency} in parallel...", file=sys.stderr)
+            summaries.append(run_embedding_case(client, model_id, documents, chunk_size, overlap, concurrency,
+                                                scheduler))
+    return summaries
+
+
+def generate_title(bedrock_client, model_id, message, max_tokens=TITLE_MAX_TOKENS):
+    """
+    Ask model_id for a title the way LibreChat does, through the Converse
+    API. Returns {'latency', 'input_tokens', 'output_tokens', 'title'} or
+    {'error': <error code>}.
+    """
+    start = time.monotonic()
+    try:
+        response = bedrock_client.converse(
+            modelId=model_id,
+            messages=[{"role": "user", "content": [{"text": TITLE_PROMPT.format(message=message)}]}],
+            inferenceConfig={"maxTokens": max_tokens},
+        )
+    except ClientError as e:
+        return {'error': e.response['Error']['Code']}
+    except Exception as e:
+        return {'error': type(e).__name__}
+    latency = time.monotonic() - start
+    # Reasoning models put their thoughts in reasoningContent blocks, only text counts as a title
+    text = ' '.join(block['text'] for block in response.get('output', {}).get('message', {}).get('content', [])
+                    if 'text' in block)
+    usage = response.get('usage', {})
+    return {
+        'latency': latency,
+        'input_tokens': usage.get('inputTokens'),
+        'output_tokens': usage.get('outputTokens'),
+        'title': text.strip().strip('"\'*#').strip(),
+    }
+
+
+def is_usable_title(title, max_words=TITLE_MAX_WORDS):
+    return bool(title) and '\n' not in title and len(title.split()) <= max_words
+
+
+def summarize_titles(model_id, region, runs):
+    """Reduce the title runs of one model to latency percentiles, output tokens and the share of usable titles."""
+    ok_runs = [run for run in runs if 'error' not in run]
+    errors = {}
+    for run in runs:
+        if 'error' in run:
+            errors[run['error']] = errors.get(run['error'], 0) + 1
+    latencies = [run['latency'] for run in ok_runs]
+    output_tokens = [run['output_tokens'] for run in ok_runs if run['output_tokens'] is not None]
+    return {
+        'model': model_id,
+        'region': region,
+        'runs': len(runs),
+        'errors': sum(errors.values()),
+        'error_codes': ' '.join(f"{code}:{count}" for code, count in sorted(errors.items())),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'output_tokens_mean': sum(output_tokens) / len(output_tokens) if output_tokens else None,
+        'usable': sum(1 for run in ok_runs if is_usable_title(run['title'])) / len(runs) if runs else 0,
+        'example': next((run['title'] for run in ok_runs if is_usable_title(run['title'])), ''),
+    }
+
+
+def run_title_benchmark(model_regions, rounds=1, max_tokens=TITLE_MAX_TOKENS, verbose=False):
+    """
+    Generate a title for every message of TITLE_CORPUS `rounds` times with
+    each (model_id, region) pair. Models run one at a time, like
+    run_benchmark. Returns one summary dict per model (see summarize_titles).
+    """
+    clients = {}
+    summaries = []
+    for model_id, region in model_regions:
+        if region not in clients:
+            clients[region] = create_runtime_client(region)
+        if verbose:
+            print(f"Generating {rounds * len(TITLE_CORPUS)} titles with {model_id} in {region}...", file=sys.stderr)
+        runs = [generate_title(clients[region], model_id, message, max_tokens)
+                for _ in range(rounds) for message in TITLE_CORPUS]
+        summaries.append(summarize_titles(model_id, region, runs))
+    return summaries
+
+
+def pick_title_model(summaries, min_usable=0.9, tolerance=TITLE_P95_TOLERANCE):
+    """
+    The model with the lowest p95 latency among those that answered every
+    request and gave usable titles for at least min_usable of them. Models
+    whose p95 is at most `tolerance` (relative, 0.05 = 5%) above the fastest
+    count as tied; among those fewer output tokens (cost) win, then the
+    lower exact p95. None if no model qualifies.
+    """
+    qualified = [s for s in summaries if not s['errors'] and s['usable'] >= min_usable and s['latency_p95'] is not None]
+    if not qualified:
+        return None
+    fastest = min(s['latency_p95'] for s in qualified)
+    tied = [s for s in qualified if s['latency_p95'] <= fastest * (1 + tolerance)]
+    return min(tied, key=lambda s: (s['output_tokens_mean'] or 0, s['latency_p95']))
+
+
+def print_title_table(summaries, choice, tolerance=TITLE_P95_TOLERANCE):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else '-'
+
+    ranked = sorted(summaries, key=lambda s: (s['latency_p95'] is None, s['latency_p95'] or 0))
+    width = max([len(s['model']) for s in ranked] + [5])
+    print(f"{'RANK':>4}  {'MODEL':<{width}}  {'P50 ms':>7} {'P95 ms':>7} {'OUT TOK':>8} {'USABLE':>7} {'ERR':>4}  EXAMPLE")
+    for rank, s in enumerate(ranked, 1):
+        tokens = f"{s['output_tokens_mean']:.1f}" if s['output_tokens_mean'] is not None else '-'
+        mark = ' <' if s is choice else '  '
+        print(f"{rank:>4}  {s['model']:<{width}}  {ms(s['latency_p50']):>7} {ms(s['latency_p95']):>7} {tokens:>8} "
+              f"{s['usable']:>7.0%} {s['errors']:>4}{mark}{(s['example'] or s['error_codes'])[:40]}")
+    print(f"Ranked by p95; models within {tolerance:.0%} of the fastest p95 count as tied, "
+          f"fewer output tokens win")
+
+
+def set_yaml_value(path, keys, value):
+    """
+    Set the scalar at the key path `keys` (e.g. ['endpoints', 'bedrock',
+    'titleModel']) of a YAML file by editing only that line, so comments,
+    quoting and layout survive (a YAML library would drop the comments).
+    The key is added below its parent if missing. Returns the old value
+    or None. Raises KeyError if the parent mapping doesn't exist.
+    """
+    with open(path) as f:
+        lines = f.readlines()
+    key_line = re.compile(r'^(\s*)([\w.-]+):(\s*)(.*?)\s*$')
+    scalar = re.compile(r'''^('[^']*'|"[^"]*"|[^#'"]*?)(\s+#.*)?$''')
+    stack = []
+    parent_index = child_indent = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        match = key_line.match(line.rstrip('\n'))
+        if not match:
+            continue
+        path_here = [key for _, key in stack] + [match.group(2)]
+        if path_here == keys[:-1]:
+            parent_index = i
+        elif path_here[:-1] == keys[:-1] and child_indent is None:
+            child_indent = match.group(1)
+        if path_here == keys:
+            old = scalar.match(match.group(4))
+            old_value, comment = (old.group(1), old.group(2) or '') if old else (match.group(4), '')
+            if old_value.strip('\'"') == value:
+                return value
+            quote = old_value[0] if old_value[:1] in ('"', "'") else ''
+            lines[i] = f"{match.group(1)}{match.group(2)}:{match.group(3) or ' '}{quote}{value}{quote}{comment}\n"
+            break
+        stack.append((indent, match.group(2)))
+    else:
+        if parent_index is None:
+            raise KeyError('.'.join(keys[:-1]))
+        parent = lines[parent_index]
+        indent = child_indent if child_indent is not None else parent[:len(parent) - len(parent.lstrip())] + '  '
+        lines.insert(parent_index + 1, f"{indent}{keys[-1]}: '{value}'\n")
+        old_value = None
+
+    tmp_path = os.path.join(os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+    return old_value.strip('\'"') if old_value is not None else None
+
+
+def save_cache(cache):
+    if cache:
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Could not write probe cache {cache.path}: {e}", file=sys.stderr)
+
+
+def read_env_models(path):
+    """Return the model IDs of the last active BEDROCK_AWS_MODELS line in a .env file."""
+    models = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('BEDROCK_AWS_MODELS='):
+                value = line.split('=', 1)[1].strip().strip('"\'')
+                models = [m.strip() for m in value.split(',') if m.strip()]
+    return models
+
+
+def write_env_models(path, models):
+    """
+    Atomically replace the last active BEDROCK_AWS_MODELS line in a .env file
+    (or append one), keeping every other line, the file mode and the quoting.
+    """
+    with open(path) as f:
+        lines = f.readlines()
+    index = None
+    for i, line in enumerate(lines):
+        if line.strip().startswith('BEDROCK_AWS_MODELS='):
+            index = i
+    value = ','.join(models)
+    if index is None:
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.append(f"BEDROCK_AWS_MODELS={value}\n")
+    else:
+        old_value = lines[index].split('=', 1)[1].strip()
+        quote = old_value[0] if old_value[:1] in ('"', "'") else ''
+        lines[index] = f"BEDROCK_AWS_MODELS={quote}{value}{quote}\n"
+
+    tmp_path = os.path.join(os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    shutil.copymode(path, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_env_models(configured, listed_models, known_models, results, first_models, ignore_list):
+    """
+    Work out the new BEDROCK_AWS_MODELS list for --apply.
+    configured: current list from the .env file; listed_models: model IDs
+    from list_foundation_models; known_models: IDs an earlier --apply decided on
+    (None = all listed models are new); results: {base model ID: probe_models
+    result} for every re-probed model. --first models are kept untested.
+    Returns (new_list, added, removed, changed) where changed holds
+    (old_id, new_id) pairs of models whose prefix moved.
+    """
+    first_set = set(first_models)
+    updated = []
+    removed = []
+    changed = []
+    for model_id in configured:
+        if model_id in first_set:
+            updated.append(model_id)
+            continue
+        result = results.get(strip_prefix(model_id))
+        if result and result['working_id']:
+            updated.append(result['working_id'])
+            if result['working_id'] != model_id:
+                changed.append((model_id, result['working_id']))
+        elif result and result['error_code']:
+            # Undecided (throttled, out of budget) - keep it rather than guess
+            updated.append(model_id)
+        else:
+            removed.append(model_id)
+
+    configured_bases = {strip_prefix(m) for m in configured}
+    added = []
+    for model_id in listed_models:
+        if model_id in configured_bases or (known_models is not None and model_id in known_models):
+            continue
+        if any(model_id.startswith(prefix) for prefix in ignore_list):
+            continue
+        result = results.get(model_id)
+        if result and result['working_id'] and result['working_id'] not in updated:
+            updated.append(result['working_id'])
+            added.append(result['working_id'])
+
+    # --first models go to the front, in their given order
+    updated = first_models + [m for m in updated if m not in first_set]
+    added.extend(m for m in first_models if m not in configured)
+
+    deduplicated = []
+    for model_id in updated:
+        if model_id not in deduplicated:
+            deduplicated.append(model_id)
+    return deduplicated, added, removed, changed
+
+
+def apply_to_env_file(path, region, ignore_list, first_models, strict=False, debug=False, jobs=1, cache=None,
+                      resolve='probe', api='invoke', scheduler=None, verbose=False):
+    """
+    Re-probe only the models configured in the .env file plus models that
+    no earlier --apply has decided on, print the difference and rewrite
+    BEDROCK_AWS_MODELS in place. New models that stay undecided (throttled,
+    out of budget) are probed again on the next run. Returns the new model list.
+    """
+    configured = read_env_models(path)
+    summaries = {m.get('modelId', ''): m for m in get_foundation_models(region)}
+    listed = list(summaries)
+    known = cache.applied_models(region) if cache else None
+
+    configured_bases = {strip_prefix(m) for m in configured if m not in first_models}
+    new_models = [m for m in listed if m not in configured_bases and (known is None or m not in known)
+                  and not any(m.startswith(prefix) for prefix in ignore_list)]
+    to_probe = sorted(configured_bases) + new_models
+
+    if verbose:
+        print(f"{path}: {len(configured)} configured models, {len(new_models)} new in {region}"
+              + (" (no earlier listing, treating all as new)" if known is None else ""), file=sys.stderr)
+        skipped = [m for m in listed if m not in to_probe]
+        print(f"Re-probing {len(to_probe)} models, skipping {len(skipped)} known or ignored models", file=sys.stderr)
+
+    if cache:
+        # Configured models must be checked for real, not answered from the cache
+        cache.refresh = True
+    profile_index = build_profile_index(get_inference_profiles(region)) if resolve == 'metadata' else None
+    bedrock_runtime = create_runtime_client(region, jobs)
+    results = {
+        r['model_id']: r
+        for r in probe_models([summaries.get(m, {'modelId': m}) for m in to_probe], bedrock_runtime, strict, debug,
+                              jobs, cache, profile_index, api, scheduler)
+    }
+
+    updated, added, removed, changed = update_env_models(configured, listed, known, results, first_models, ignore_list)
+
+    for old_id, new_id in changed:
+        print(f"~ {old_id} -> {new_id}", file=sys.stderr)
+    for model_id in removed:
+        print(f"- {model_id}", file=sys.stderr)
+    for model_id in added:
+        print(f"+ {model_id}", file=sys.stderr)
+    for model_id in new_models:
+        if not results[model_id]['working_id'] and results[model_id]['error_code']:
+            print(f"? {model_id} undecided ({results[model_id]['error_code']}), retried on the next --apply",
+                  file=sys.stderr)
+
+    if updated != configured:
+        write_env_models(path, updated)
+        print(f"Updated BEDROCK_AWS_MODELS in {path}: {len(added)} added, {len(removed)} removed, "
+              f"{len(changed)} changed", file=sys.stderr)
+    else:
+        print(f"BEDROCK_AWS_MODELS in {path} is up to date", file=sys.stderr)
+
+    if cache:
+        # Only models with a definite answer count as known, undecided ones are probed again next time
+        decided = [m for m, r in results.items() if r['working_id'] or not r['error_code']]
+        cache.remember_applied(region, decided, listed)
+    return updated
+
+
+# Upper bounds (seconds) of the monitor's first-chunk latency histogram
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ModelHealthMetrics:
+    """Thread-safe store of monitor results, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.up = {}
+        self.probes = {}
+        self.errors = {}
+        self.histograms = {}
+        self.suggestions = {}
+        self.last_cycle = 0
+
+    def observe(self, model_id, result, suggestion=None):
+        with self.lock:
+            self.probes[model_id] = self.probes.get(model_id, 0) + 1
+            if result.error_code:
+                key = (model_id, result.error_code)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if result.error_code not in UNDECIDED_ERRORS:
+                # Throttling or an exhausted budget says nothing about the model, keep its last state
+                self.up[model_id] = 1 if result.working_id else 0
+            if result.latency is not None:
+                counts, total, count = self.histograms.get(model_id, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+                counts = [c + (result.latency <= bound) for c, bound in zip(counts, LATENCY_BUCKETS)]
+                self.histograms[model_id] = (counts, total + result.latency, count + 1)
+            if suggestion:
+                self.suggestions[model_id] = suggestion
+            elif result.working_id:
+                self.suggestions.pop(model_id, None)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP bedrock_model_up Whether the configured model answered the last probe (1) or not (0).')
+            lines.append('# TYPE bedrock_model_up gauge')
+            for model_id, value in sorted(self.up.items()):
+                lines.append(f'bedrock_model_up{{model="{_label(model_id)}"}} {value}')
+            lines.append('# HELP bedrock_probes_total Probes sent per model.')
+            lines.append('# TYPE bedrock_probes_total counter')
+            for model_id, value in sorted(self.probes.items()):
+                lines.append(f'bedrock_probes_total{{model="{_label(model_id)}"}} {value}')
+            lines.append('# HELP bedrock_probe_errors_total Failed probes per model and Bedrock error code.')
+            lines.append('# TYPE bedrock_probe_errors_total counter')
+            for (model_id, code), value in sorted(self.errors.items()):
+                lines.append(f'bedrock_probe_errors_total{{model="{_label(model_id)}",code="{_label(code)}"}} {value}')
+            lines.append('# HELP bedrock_probe_latency_seconds Time to the first streamed chunk.')
+            lines.append('# TYPE bedrock_probe_latency_seconds histogram')
+            for model_id, (counts, total, count) in sorted(self.histograms.items()):
+                label = _label(model_id)
+                for bound, value in zip(LATENCY_BUCKETS, counts):
+                    lines.append(f'bedrock_probe_latency_seconds_bucket{{model="{label}",le="{bound}"}} {value}')
+                lines.append(f'bedrock_probe_latency_seconds_bucket{{model="{label}",le="+Inf"}} {count}')
+                lines.append(f'bedrock_probe_latency_seconds_sum{{model="{label}"}} {total}')
+                lines.append(f'bedrock_probe_latency_seconds_count{{model="{label}"}} {count}')
+            lines.append('# HELP bedrock_model_suggested_id Working model ID for a configured model that stopped working.')
+            lines.append('# TYPE bedrock_model_suggested_id gauge')
+            for model_id, suggestion in sorted(self.suggestions.items()):
+                lines.append(f'bedrock_model_suggested_id{{model="{_label(model_id)}",suggested="{_label(suggestion)}"}} 1')
+            lines.append('# HELP bedrock_monitor_last_cycle_timestamp_seconds When the last probe cycle finished.')
+            lines.append('# TYPE bedrock_monitor_last_cycle_timestamp_seconds gauge')
+            lines.append(f'bedrock_monitor_last_cycle_timestamp_seconds {self.last_cycle}')
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(metrics, host='127.0.0.1', port=9464):
+    """Serve metrics.render() on /metrics in a background thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            data = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def monitor_models(env_path, region, interval=300, jobs=1, scheduler=None, suggest=False, metrics=None,
+                   verbose=False, debug=False, cycles=0):
+    """
+    Probe every model configured in BEDROCK_AWS_MODELS of env_path each
+    `interval` seconds with a minimal streaming request and record the
+    outcome in `metrics`. The .env file is re-read every cycle. If suggest
+    is set, a model that stops working is probed with the other prefixes
+    and the working ID is published as a suggestion. Runs forever unless
+    `cycles` is given.
+    """
+    metrics = metrics or ModelHealthMetrics()
+    bedrock_runtime = create_runtime_client(region, jobs)
+    last_state = {}
+
+    def check(model_id):
+        if scheduler:
+            try:
+                scheduler.acquire(region, model_id)
+            except BudgetExceeded:
+                return model_id, ProbeResult(None, 'BudgetExceeded'), None
+        result = probe_with_prefix(bedrock_runtime, model_id, strict=True, debug=debug)
+        suggestion = None
+        if suggest and not result.working_id and result.error_code not in UNDECIDED_ERRORS:
+            base_model_id = strip_prefix(model_id)
+            # The configured prefix just failed, only the others can be a suggestion
+            failed_prefix = model_id[:len(model_id) - len(base_model_id)]
+            suggestion, _, _, _ = probe_model(bedrock_runtime, base_model_id, strict=True, debug=debug,
+                                              scheduler=scheduler,
+                                              prefixes=[p for p in PREFIXES if p != failed_prefix])
+        return model_id, result, suggestion
+
+    cycle = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            models = read_env_models(env_path)
+            for model_id, result, suggestion in executor.map(check, models):
+                metrics.observe(model_id, result, suggestion)
+                state = 'up' if result.working_id else (result.error_code or 'down')
+                # Log every state change (and the initial state), or everything with --verbose
+                changed = last_state.get(model_id) != state and result.error_code not in UNDECIDED_ERRORS
+                if verbose or changed:
+                    latency = f" {result.latency * 1000:.0f}ms" if result.latency is not None else ''
+                    hint = f", try {suggestion}" if suggestion else ''
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {model_id}: {state}{latency}{hint}", file=sys.stderr)
+                if result.error_code not in UNDECIDED_ERRORS:
+                    last_state[model_id] = state
+            with metrics.lock:
+                metrics.last_cycle = time.time()
+            cycle += 1
+            if cycles and cycle >= cycles:
+                return metrics
+            time.sleep(interval)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Generate BEDROCK_AWS_MODELS string for LibreChat configuration'
@@ -294,6 +1707,14 @@ def main():
         default='us-west-2',
         help='AWS region to test models in (default: us-west-2)'
     )
+    parser.add_argument(
+        '--regions',
+        type=str,
+        default='',
+        help='Comma-separated AWS regions to probe concurrently (e.g. us-west-2,us-east-1); '
+             'reports the working regions per model and picks the lowest-latency one; '
+             'BEDROCK_AWS_MODELS only lists the models that work in BEDROCK_AWS_DEFAULT_REGION'
+    )
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -311,54 +1732,336 @@ def main():
     )
     parser.add_argument(
         '--format',
-        choices=['env', 'list', 'yaml'],
+        choices=['env', 'list', 'yaml', 'json'],
         default='env',
-        help='Output format: env (BEDROCK_AWS_MODELS=...), list (one per line), or yaml'
+        help='Output format: env (BEDROCK_AWS_MODELS=...), list (one per line), yaml, or json (with per-region details)'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=8,
+        help='Number of models to probe in parallel (default: 8, use 1 to probe sequentially)'
+    )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help=f'Probe result cache file (default: {DEFAULT_CACHE_PATH})'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=168,
+        help='Hours a cached probe result stays valid (default: 168 = one week)'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore cached probe results and re-test every model (the cache is still updated)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither read nor write the probe result cache'
+    )
+    parser.add_argument(
+        '--resolve',
+        choices=['probe', 'metadata'],
+        default='probe',
+        help='How to find the prefix: probe (invoke each model/prefix) or metadata '
+             '(use inference profile listings, only probe models they do not settle)'
+    )
+    parser.add_argument(
+        '--api',
+        choices=['invoke', 'converse'],
+        default='invoke',
+        help='Bedrock API used for probes and benchmarks: invoke (InvokeModel with a provider-specific body) '
+             'or converse (the unified Converse/ConverseStream API)'
+    )
+    parser.add_argument(
+        '--apply',
+        type=str,
+        default='',
+        metavar='PATH',
+        help='Update BEDROCK_AWS_MODELS in this .env file in place: only re-probe the configured models '
+             'and models that are new since the last run, print the difference and keep the existing order'
+    )
+    parser.add_argument(
+        '--monitor',
+        type=str,
+        default='',
+        metavar='PATH',
+        help='Run as a health monitor for the models in BEDROCK_AWS_MODELS of this .env file and '
+             'export Prometheus metrics on http://--metrics-host:--metrics-port/metrics'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=300,
+        help='Seconds between monitor probe cycles (default: 300)'
+    )
+    parser.add_argument(
+        '--metrics-host',
+        type=str,
+        default='127.0.0.1',
+        help='Address of the monitor metrics endpoint (default: 127.0.0.1)'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=9464,
+        help='Port of the monitor metrics endpoint (default: 9464)'
+    )
+    parser.add_argument(
+        '--suggest',
+        action='store_true',
+        help='In monitor mode, probe the other prefixes of a failing model and publish the working ID'
+    )
+    parser.add_argument(
+        '--max-rps',
+        type=float,
+        default=10,
+        help='Max model invocations per second per region while probing (default: 10, 0 = unlimited)'
+    )
+    parser.add_argument(
+        '--model-rps',
+        type=float,
+        default=2,
+        help='Max invocations per second of any single model while probing (default: 2, 0 = unlimited)'
+    )
+    parser.add_argument(
+        '--max-calls',
+        type=int,
+        default=0,
+        help='Stop invoking models after this many probe calls; undecided models are left out (default: 0 = no limit)'
+    )
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=4,
+        help='How often throttled models are re-queued with exponential backoff (default: 4)'
+    )
+    parser.add_argument(
+        '--benchmark',
+        action='store_true',
+        help='After finding the working models, measure time to first chunk, total stream time '
+             'and tokens/sec for each of them and print a ranked table instead of BEDROCK_AWS_MODELS'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of benchmark runs per model (default: 5)'
+    )
+    parser.add_argument(
+        '--benchmark-output',
+        type=str,
+        default='',
+        help='Also write the benchmark percentiles to this file (.csv for CSV, otherwise JSON)'
+    )
+    parser.add_argument(
+        '--embed-benchmark',
+        type=str,
+        default='',
+        metavar='CORPUS',
+        help='Benchmark the RAG embedding model instead of probing: chunk the text files and PDFs in this '
+             'directory at every --chunk-sizes, embed them at every --embed-concurrency and recommend '
+             'CHUNK_SIZE and a concurrency'
+    )
+    parser.add_argument(
+        '--embed-model',
+        type=str,
+        default=EMBED_MODEL,
+        help=f'Embedding model to benchmark, EMBEDDINGS_MODEL in .env (default: {EMBED_MODEL})'
+    )
+    parser.add_argument(
+        '--chunk-sizes',
+        type=str,
+        default=','.join(str(size) for size in EMBED_CHUNK_SIZES),
+        help=f"Comma-separated CHUNK_SIZE values in characters (default: {','.join(map(str, EMBED_CHUNK_SIZES))})"
+    )
+    parser.add_argument(
+        '--chunk-overlap',
+        type=int,
+        default=EMBED_CHUNK_OVERLAP,
+        help=f'CHUNK_OVERLAP in characters (default: {EMBED_CHUNK_OVERLAP})'
+    )
+    parser.add_argument(
+        '--embed-concurrency',
+        type=str,
+        default=','.join(str(n) for n in EMBED_CONCURRENCY),
+        help=f"Comma-separated numbers of parallel embedding calls (default: {','.join(map(str, EMBED_CONCURRENCY))})"
+    )
+    parser.add_argument(
+        '--max-chunks',
+        type=int,
+        default=2000,
+        help='Only embed the first documents of the corpus, up to this many chunks at the smallest chunk size '
+             '(default: 2000, 0 = all)'
+    )
+    parser.add_argument(
+        '--title-tune',
+        type=str,
+        default='',
+        metavar='PATH',
+        help='After finding the working models, generate titles for a fixed corpus of first messages with each '
+             'of them and set endpoints.bedrock.titleModel in this librechat.yaml to the fastest model with '
+             'usable titles, keeping its comments'
+    )
+    parser.add_argument(
+        '--title-candidates',
+        type=str,
+        default='',
+        help='Comma-separated substrings, only working models containing one are tried as titleModel '
+             '(e.g. "haiku,nova-micro,nova-lite,llama")'
+    )
+    parser.add_argument(
+        '--title-rounds',
+        type=int,
+        default=2,
+        help=f'Passes over the {len(TITLE_CORPUS)} corpus messages per title candidate (default: 2)'
+    )
+    parser.add_argument(
+        '--title-max-tokens',
+        type=int,
+        default=TITLE_MAX_TOKENS,
+        help=f'Output token limit of a title request (default: {TITLE_MAX_TOKENS})'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help="With --title-tune, print the ranking but don't change the YAML file"
+    )
+    parser.add_argument(
+        '--max-throttle-rate',
+        type=float,
+        default=0.01,
+        help='Highest fraction of throttled embedding calls a recommended setting may have (default: 0.01)'
     )
 
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    if args.max_retries < 0:
+        parser.error('--max-retries must not be negative')
+    if args.apply and (',' in args.regions or args.benchmark):
+        parser.error('--apply works on a single region and cannot be combined with --benchmark')
+    if args.title_tune and args.benchmark:
+        parser.error('--title-tune cannot be combined with --benchmark')
+    if args.title_tune and not os.path.exists(args.title_tune):
+        parser.error(f'{args.title_tune} does not exist')
+    if args.title_rounds < 1:
+        parser.error('--title-rounds must be at least 1')
+    try:
+        chunk_sizes = [int(size) for size in args.chunk_sizes.split(',') if size.strip()]
+        concurrency_levels = [int(n) for n in args.embed_concurrency.split(',') if n.strip()]
+    except ValueError:
+        parser.error('--chunk-sizes and --embed-concurrency take comma-separated numbers')
+    if args.embed_benchmark and (not chunk_sizes or not concurrency_levels or min(chunk_sizes + concurrency_levels) < 1):
+        parser.error('--chunk-sizes and --embed-concurrency must be positive')
+
     # Strict mode is default, --loose disables it
     strict_mode = not args.loose
 
     # Parse ignore list
     ignore_list = [s.strip() for s in args.ignore.split(',') if s.strip()]
 
+    regions = [r.strip() for r in args.regions.split(',') if r.strip()] or [args.region]
+
+    if args.embed_benchmark:
+        summaries = run_embedding_benchmark(regions[0], args.embed_model, args.embed_benchmark, chunk_sizes,
+                                            concurrency_levels, args.chunk_overlap, args.max_chunks,
+                                            args.max_retries, args.verbose)
+        if args.benchmark_output:
+            write_benchmark_report(summaries, args.benchmark_output)
+        print_embedding_table(summaries, recommend_embedding_settings(summaries, args.max_throttle_rate),
+                              args.max_throttle_rate)
+        return
+
     if args.verbose:
         mode = "LOOSE (lenient)" if args.loose else "STRICT (streaming validation)"
         print(f"Testing mode: {mode}", file=sys.stderr)
-        print(f"Fetching models from region: {args.region}", file=sys.stderr)
+        print(f"Fetching models from region(s): {', '.join(regions)}", file=sys.stderr)
+        print(f"Parallel probes: {args.jobs}", file=sys.stderr)
+        print(f"Rate limits: {args.max_rps or 'unlimited'} calls/s per region, {args.model_rps or 'unlimited'} calls/s per model", file=sys.stderr)
         if ignore_list:
             print(f"Ignoring models starting with: {ignore_list}", file=sys.stderr)
         if args.first:
             print(f"Will place first: {args.first}", file=sys.stderr)
         print("", file=sys.stderr)
 
-    # Get all foundation models
-    models = get_foundation_models(args.region)
+    cache = None if args.no_cache else ProbeCache(args.cache, args.cache_ttl * 3600, refresh=args.refresh)
+    scheduler = ProbeScheduler(args.max_rps, args.model_rps, args.max_calls, args.max_retries)
+    region_choices = None
 
-    if args.verbose:
-        print(f"Found {len(models)} total models", file=sys.stderr)
+    if args.monitor:
+        metrics = ModelHealthMetrics()
+        start_metrics_server(metrics, args.metrics_host, args.metrics_port)
+        print(f"Monitoring {args.monitor} every {args.interval:g}s, "
+              f"metrics on http://{args.metrics_host}:{args.metrics_port}/metrics", file=sys.stderr)
+        try:
+            monitor_models(args.monitor, regions[0], args.interval, args.jobs, scheduler, args.suggest, metrics,
+                           args.verbose, args.debug)
+        except KeyboardInterrupt:
+            pass
+        return
 
-    # Filter models
-    filtered_models = filter_models(models, ignore_list)
+    if args.apply:
+        first_models = [m.strip() for m in args.first.split(',') if m.strip()]
+        working_models = apply_to_env_file(args.apply, regions[0], ignore_list, first_models, strict_mode, args.debug,
+                                           args.jobs, cache, args.resolve, args.api, scheduler, args.verbose)
+        save_cache(cache)
+        print(f"BEDROCK_AWS_MODELS={','.join(working_models)}")
+        return
 
-    if args.verbose:
-        print(f"Testing {len(filtered_models)} models after filtering", file=sys.stderr)
-        print("", file=sys.stderr)
+    if len(regions) > 1:
+        # Probe every region concurrently and keep the fastest working region per model
+        results_by_region = probe_regions(regions, ignore_list, strict_mode, args.debug, args.jobs, cache, args.resolve,
+                                          args.api, scheduler)
+        region_choices = select_best_regions(results_by_region, regions)
+        print_region_report(region_choices, regions)
+        working_models = [choice['working_id'] for choice in region_choices]
+    else:
+        # Get all foundation models
+        models = get_foundation_models(regions[0])
+        if cache:
+            cache.remember_models(regions[0], [m.get('modelId', '') for m in models])
 
-    # Create bedrock-runtime client for testing
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=args.region
-    )
+        if args.verbose:
+            print(f"Found {len(models)} total models", file=sys.stderr)
 
-    # Find working models
-    working_models = find_working_models(filtered_models, bedrock_runtime, args.verbose, strict_mode, args.debug)
+        # Filter models
+        filtered_models = filter_models(models, ignore_list)
+
+        if args.verbose:
+            print(f"Testing {len(filtered_models)} models after filtering", file=sys.stderr)
+            print("", file=sys.stderr)
+
+        # Create one pooled bedrock-runtime client shared by all probe workers
+        bedrock_runtime = create_runtime_client(regions[0], args.jobs)
+
+        profile_index = None
+        if args.resolve == 'metadata':
+            profile_index = build_profile_index(get_inference_profiles(regions[0]))
+            if args.verbose:
+                print(f"Found inference profiles for {len(profile_index)} models", file=sys.stderr)
+
+        # Find working models
+        working_models = find_working_models(filtered_models, bedrock_runtime, args.verbose, strict_mode, args.debug, args.jobs,
+                                             cache, profile_index, args.api, scheduler)
+
+    save_cache(cache)
 
     if args.verbose:
         print("", file=sys.stderr)
         print(f"Found {len(working_models)} working models", file=sys.stderr)
+        if cache:
+            print(f"Probe cache: {cache.hits} hits, {cache.misses} misses ({cache.path})", file=sys.stderr)
+        throttled = ', '.join(f"{count} {code}" for code, count in sorted(scheduler.errors.items()))
+        print(f"Model invocations: {scheduler.calls}" + (f" ({throttled})" if throttled else ''), file=sys.stderr)
         print("", file=sys.stderr)
 
     # Put --first models at the beginning if specified
@@ -394,16 +2097,104 @@ def main():
             final_models.append(model)
     working_models = final_models
 
+    if args.benchmark:
+        best_region = {choice['working_id']: choice['best_region'] for choice in region_choices or []}
+        model_regions = [(model, best_region.get(model, regions[0])) for model in working_models]
+        summaries = run_benchmark(model_regions, args.repeat, args.jobs, args.verbose, args.api)
+        if args.benchmark_output:
+            write_benchmark_report(summaries, args.benchmark_output)
+        print_benchmark_table(summaries)
+        return
+
+    if args.title_tune:
+        best_region = {choice['working_id']: choice['best_region'] for choice in region_choices or []}
+        patterns = [p.strip() for p in args.title_candidates.split(',') if p.strip()]
+        candidates = [model for model in working_models if not patterns or any(p in model for p in patterns)]
+        if not candidates:
+            print("No working model matches --title-candidates", file=sys.stderr)
+            sys.exit(1)
+        summaries = run_title_benchmark([(model, best_region.get(model, regions[0])) for model in candidates],
+                                        args.title_rounds, args.title_max_tokens, args.verbose)
+        if args.benchmark_output:
+            write_benchmark_report(summaries, args.benchmark_output)
+        choice = pick_title_model(summaries)
+        print_title_table(summaries, choice)
+        if not choice:
+            print("\nNo model answered every title request with usable titles, "
+                  f"{args.title_tune} is unchanged", file=sys.stderr)
+            sys.exit(1)
+        print(f"\ntitleModel: {choice['model']} (p95 {choice['latency_p95'] * 1000:.0f} ms, "
+              f"{choice['output_tokens_mean'] or 0:.1f} output tokens)", file=sys.stderr)
+        if args.dry_run:
+            return
+        try:
+            old_model = set_yaml_value(args.title_tune, ['endpoints', 'bedrock', 'titleModel'], choice['model'])
+        except KeyError:
+            print(f"{args.title_tune} has no endpoints.bedrock section, add titleModel: '{choice['model']}' there",
+                  file=sys.stderr)
+            sys.exit(1)
+        if old_model == choice['model']:
+            print(f"titleModel in {args.title_tune} is up to date", file=sys.stderr)
+        else:
+            print(f"Updated titleModel in {args.title_tune}: {old_model} -> {choice['model']}", file=sys.stderr)
+        return
+
+    # With several regions, the default region is the one that is fastest for most models
+    best_regions = []
+    if region_choices:
+        wins = {region: 0 for region in regions}
+        for choice in region_choices:
+            wins[choice['best_region']] += 1
+        best_regions = sorted((r for r in regions if wins[r]), key=lambda r: -wins[r])
+
+    # BEDROCK_AWS_DEFAULT_REGION is a single region, so only emit the models (with the
+    # ID) that work there; --first models are kept as given
+    other_region_models = []
+    if best_regions:
+        in_default = {choice['working_id']: choice['regions'].get(best_regions[0]) for choice in region_choices}
+        best_region = {choice['working_id']: choice['best_region'] for choice in region_choices}
+        default_models = []
+        for model in working_models:
+            if model not in in_default:
+                default_models.append(model)
+            elif in_default[model]:
+                default_models.append(in_default[model]['working_id'])
+            else:
+                other_region_models.append(f"{model} ({best_region[model]})")
+        working_models = list(dict.fromkeys(default_models))
+    other_region_note = (f"# Not working in {best_regions[0]}, only in other regions: {', '.join(other_region_models)}"
+                         if other_region_models else '')
+
     # Output in requested format
     if args.format == 'env':
         print(f"BEDROCK_AWS_MODELS={','.join(working_models)}")
+        if best_regions:
+            print(f"BEDROCK_AWS_DEFAULT_REGION={best_regions[0]}")
+        if other_region_note:
+            print(other_region_note)
     elif args.format == 'list':
         for model in working_models:
             print(model)
+        if other_region_note:
+            print(other_region_note[2:], file=sys.stderr)
     elif args.format == 'yaml':
         print("BEDROCK_AWS_MODELS:")
         for model in working_models:
             print(f"  - {model}")
+        if other_region_note:
+            print(other_region_note)
+        if best_regions:
+            print("availableRegions:")
+            for region in best_regions:
+                print(f"  - \"{region}\"")
+    elif args.format == 'json':
+        output = {
+            'BEDROCK_AWS_MODELS': working_models,
+            'regions': region_choices or [],
+        }
+        if best_regions:
+            output['BEDROCK_AWS_DEFAULT_REGION'] = best_regions[0]
+        print(json.dumps(output, indent=2))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,195 @@
+#! /usr/bin/env python3
+
+import os, sys, json, glob, argparse, datetime
+try:
+    import pymongo
+except:
+    print('pymongo missing, to install run:\n python3 -m pip install --upgrade pymongo')
+    sys.exit(1)
+
+from purge_old_messages import CACHE_DIR, add_connection_arguments, connect, format_bytes
+
+"""
+ # Storage and index report for the LibreChat database. Collects collStats
+ # and $indexStats, flags unused indexes and missing indexes for the query
+ # shapes LibreChat runs on every page load, and shows the growth since
+ # the previous snapshot.
+"""
+
+COLLECTIONS=['messages', 'conversations', 'files', 'transactions']
+# Query shapes LibreChat runs constantly: the messages of a conversation
+# and the conversation list of a user
+HOT_QUERIES={
+    'messages': [('conversationId', 'createdAt')],
+    'conversations': [('user', 'updatedAt')],
+}
+DEFAULT_SNAPSHOT_DIR=os.path.join(CACHE_DIR, 'mongo-snapshots')
+
+
+def collect_stats(collection):
+    """collStats and $indexStats of one collection as a plain dict."""
+    try:
+        stats = collection.database.command('collStats', collection.name)
+    except pymongo.errors.OperationFailure:
+        stats = {}
+    usage = {}
+    try:
+        for row in collection.aggregate([{'$indexStats': {}}]):
+            usage[row['name']] = {'ops': row['accesses']['ops'], 'since': row['accesses']['since'].isoformat()}
+    except pymongo.errors.OperationFailure:
+        pass
+
+    indexes = {}
+    for name, info in collection.index_information().items():
+        indexes[name] = {
+            'key': [[field, direction] for field, direction in info['key']],
+            'unique': bool(info.get('unique')),
+            'ttl': info.get('expireAfterSeconds'),
+            'size': stats.get('indexSizes', {}).get(name, 0),
+            'ops': usage.get(name, {}).get('ops'),
+            'since': usage.get(name, {}).get('since'),
+        }
+    return {
+        'documents': stats.get('count', 0),
+        'size': stats.get('size', 0),
+        'storage_size': stats.get('storageSize', 0),
+        'index_size': stats.get('totalIndexSize', 0),
+        'avg_document_size': stats.get('avgObjSize', 0),
+        'indexes': indexes,
+    }
+
+
+def advise(name, stats, now, min_age_hours=24):
+    """Return a list of findings: unused indexes and missing indexes for the hot query shapes."""
+    findings = []
+    for index_name, index in stats['indexes'].items():
+        # _id, unique and TTL indexes do their work without showing up in ops
+        if index_name == '_id_' or index['unique'] or index['ttl'] is not None or index['ops'] is None:
+            continue
+        since = datetime.datetime.fromisoformat(index['since'])
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        age_hours = (now - since).total_seconds() / 3600
+        if index['ops'] == 0 and age_hours >= min_age_hours:
+            findings.append({'type': 'unused', 'collection': name, 'index': index_name, 'size': index['size'],
+                             'message': f"{index_name} not used in {age_hours:.0f}h, "
+                                        f"{format_bytes(index['size'])} could be dropped"})
+
+    for fields in HOT_QUERIES.get(name, []):
+        if not any([field for field, _ in index['key'][:len(fields)]] == list(fields)
+                   for index in stats['indexes'].values()):
+            key = ', '.join(f"{field}: 1" for field in fields)
+            findings.append({'type': 'missing', 'collection': name, 'fields': list(fields),
+                             'message': f"no index for {' + '.join(fields)}, "
+                                        f"run db.{name}.createIndex({{{key}}})"})
+    return findings
+
+
+def load_previous_snapshot(directory, database):
+    paths = sorted(glob.glob(os.path.join(directory, f"{database}-*.json")))
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
+def save_snapshot(directory, report):
+    os.makedirs(directory, exist_ok=True)
+    stamp = report['time'].replace(':', '').replace('-', '').split('.')[0]
+    path = os.path.join(directory, f"{report['database']}-{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def growth(current, previous):
+    """Per-day growth of documents, data and index size since the previous snapshot."""
+    if not previous:
+        return {}
+    days = (datetime.datetime.fromisoformat(current['time']) -
+            datetime.datetime.fromisoformat(previous['time'])).total_seconds() / 86400
+    if days <= 0:
+        return {}
+    rates = {}
+    for name, stats in current['collections'].items():
+        before = previous['collections'].get(name)
+        if before:
+            rates[name] = {field: round((stats[field] - before[field]) / days, 1)
+                           for field in ('documents', 'size', 'index_size')}
+    return {'days': round(days, 2), 'per_day': rates}
+
+
+def print_report(report):
+    print(f"{'COLLECTION':<16} {'DOCUMENTS':>12} {'DATA':>10} {'STORAGE':>10} {'INDEXES':>10} "
+          f"{'AVG DOC':>8} {'DOCS/DAY':>10} {'DATA/DAY':>10}")
+    rates = report.get('growth', {}).get('per_day', {})
+    for name, stats in report['collections'].items():
+        rate = rates.get(name)
+        docs_day = f"{rate['documents']:+.0f}" if rate else '-'
+        data_day = ('+' if rate['size'] >= 0 else '-') + format_bytes(abs(rate['size'])) if rate else '-'
+        print(f"{name:<16} {stats['documents']:>12} {format_bytes(stats['size']):>10} "
+              f"{format_bytes(stats['storage_size']):>10} {format_bytes(stats['index_size']):>10} "
+              f"{format_bytes(stats['avg_document_size']):>8} {docs_day:>10} {data_day:>10}")
+    if report.get('growth'):
+        print(f"(growth over the last {report['growth']['days']} days)")
+
+    print(f"\n{'COLLECTION':<16} {'INDEX':<32} {'SIZE':>10} {'OPS':>10}  KEY")
+    for name, stats in report['collections'].items():
+        for index_name, index in stats['indexes'].items():
+            key = ', '.join(f"{field}:{direction}" for field, direction in index['key'])
+            flags = ' unique' if index['unique'] else ''
+            flags += f" ttl={index['ttl']}s" if index['ttl'] is not None else ''
+            ops = index['ops'] if index['ops'] is not None else '?'
+            print(f"{name:<16} {index_name:<32} {format_bytes(index['size']):>10} {ops:>10}  {key}{flags}")
+
+    if report['findings']:
+        print()
+        for finding in report['findings']:
+            print(f"{finding['type'].upper():<8} {finding['collection']}: {finding['message']}")
+    else:
+        print("\nNo index problems found.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Storage and index report for the LibreChat MongoDB with unused and missing index advice')
+    add_connection_arguments(parser)
+    parser.add_argument('--collections', type=str, default=','.join(COLLECTIONS),
+                        help=f"Comma-separated collections to report (default: {','.join(COLLECTIONS)})")
+    parser.add_argument('--format', choices=['table', 'json'], default='table',
+                        help='Print a human readable table or JSON (default: table)')
+    parser.add_argument('--json', type=str, default='', help='Also write the JSON report to this file')
+    parser.add_argument('--snapshot-dir', type=str, default=DEFAULT_SNAPSHOT_DIR,
+                        help=f'Where snapshots for growth rates are kept (default: {DEFAULT_SNAPSHOT_DIR})')
+    parser.add_argument('--no-snapshot', action='store_true', help="Don't save this run as a snapshot")
+    parser.add_argument('--min-age', type=float, default=24,
+                        help='Only flag indexes as unused if their usage counters are this many hours old, '
+                             'they reset when mongod restarts (default: 24)')
+    args = parser.parse_args()
+
+    db = connect(args)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    report = {'database': db.name, 'time': now.isoformat(), 'collections': {}, 'findings': []}
+    for name in [c.strip() for c in args.collections.split(',') if c.strip()]:
+        stats = collect_stats(db[name])
+        report['collections'][name] = stats
+        report['findings'].extend(advise(name, stats, now, args.min_age))
+
+    previous = load_previous_snapshot(args.snapshot_dir, db.name)
+    report['growth'] = growth(report, previous)
+    if not args.no_snapshot:
+        save_snapshot(args.snapshot_dir, report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.format == 'json':
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if any(finding['type'] == 'missing' for finding in report['findings']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+#! /usr/bin/env python3
+
+import os, re, sys, glob, gzip, json, math, mmap, time, select, argparse, datetime
+
+"""
+ # Per-route latency, status and bytes from the nginx access logs, in the
+ # 'ourchat' log_format of nginx-ourchat.conf. Logs are read as a stream
+ # (plain files through mmap, rotated .gz files through gzip) and the
+ # percentiles come from fixed-size sketches, so memory stays bounded no
+ # matter how many lines are read. Streamed chat replies are reported with
+ # their time to first byte, as their request time is the stream length.
+"""
+
+DEFAULT_LOGS='/var/log/nginx/access.log*'
+# $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent, the prefix
+# shared by the 'combined' and 'ourchat' formats, followed by the key=value timings
+LINE=re.compile(rb'^\S+ \S+ \S+ \[[^\]]*\] "(?P<request>[^"]*)" (?P<status>\d{3}) (?P<bytes>\d+|-)'
+                rb'(?: "(?:[^"\\]|\\.)*" "(?:[^"\\]|\\.)*")?(?P<rest>.*)$')
+FIELD=re.compile(rb'(\w+)=(?:"([^"]*)"|(\S+))')
+# Path segments that are IDs: ObjectIds, UUIDs, numbers and long tokens
+ID_SEGMENT=re.compile(r'^(?:[0-9a-f]{24}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+|'
+                      r'[A-Za-z0-9_-]{32,})$', re.IGNORECASE)
+# Chat routes answering with a server-sent event stream, for logs without ct=
+STREAM_ROUTES=re.compile(r'^POST /api/(?:agents/chat|ask|edit|assistants/chat)(?:/|$)')
+OTHER_ROUTE='(other)'
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch in the style of DDSketch: values are
+    counted in logarithmic buckets, so any quantile is within `accuracy`
+    (1% by default) of the true value. With more than `max_buckets` buckets
+    the lowest ones are merged, which only costs accuracy at the fast end.
+    """
+
+    def __init__(self, accuracy=0.01, max_buckets=1024, min_value=1e-4):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.min_value = min_value
+        self.buckets = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value < self.min_value:
+            self.zero += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        while len(self.buckets) > self.max_buckets:
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # The middle of the bucket (gamma^(key-1), gamma^key]
+                return min(2 * self.gamma ** key / (self.gamma + 1), self.max)
+        return self.max
+
+
+class RouteStats:
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.statuses = {}
+        self.streams = 0
+        self.request_time = QuantileSketch()
+        self.upstream_header_time = QuantileSketch()
+
+    def add(self, status, size, request_time, header_time, stream):
+        self.count += 1
+        self.bytes += size
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.streams += stream
+        if request_time is not None:
+            self.request_time.add(request_time)
+        if header_time is not None:
+            self.upstream_header_time.add(header_time)
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.streams += other.streams
+        self.request_time.merge(other.request_time)
+        self.upstream_header_time.merge(other.upstream_header_time)
+
+
+def route_of(method, path):
+    """Group request paths into routes: IDs become :id, everything outside /api by its first segment."""
+    path = path.split('?', 1)[0]
+    segments = path.strip('/').split('/')
+    if segments[0] != 'api':
+        return f"{method} /{segments[0]}" + ('/*' if len(segments) > 1 else '')
+    segments = [':id' if ID_SEGMENT.match(s) else ':file' if '.' in s else s for s in segments]
+    return f"{method} /" + '/'.join(segments)
+
+
+def upstream_seconds(value):
+    """An upstream time, summed if nginx tried several upstreams ("0.004, 0.120"), None for "-"."""
+    total, found = 0.0, False
+    for part in value.replace(b':', b',').split(b','):
+        part = part.strip()
+        if part and part != b'-':
+            total += float(part)
+            found = True
+    return total if found else None
+
+
+class LogStats:
+    """Per-route statistics of access log lines, with at most `max_routes` routes."""
+
+    def __init__(self, max_routes=200):
+        self.max_routes = max_routes
+        self.routes = {}
+        self.lines = 0
+        self.unparsed = 0
+        self.without_timing = 0
+
+    def add_line(self, line):
+        self.lines += 1
+        match = LINE.match(line)
+        if not match:
+            self.unparsed += 1
+            return
+        request = match.group('request').split(b' ')
+        if len(request) < 2:
+            self.unparsed += 1
+            return
+        method, path = request[0].decode('latin-1'), request[1].decode('latin-1')
+        fields = {m.group(1): m.group(2) if m.group(2) is not None else m.group(3)
+                  for m in FIELD.finditer(match.group('rest'))}
+        try:
+            request_time = float(fields[b'rt']) if b'rt' in fields else None
+            header_time = upstream_seconds(fields[b'uht']) if b'uht' in fields else None
+        except ValueError:
+            request_time = header_time = None
+        if request_time is None:
+            self.without_timing += 1
+
+        route = route_of(method, path)
+        if b'ct' in fields:
+            stream = fields[b'ct'].startswith(b'text/event-stream')
+        else:
+            stream = bool(STREAM_ROUTES.match(route))
+        stats = self.routes.get(route)
+        if stats is None:
+            if len(self.routes) >= self.max_routes:
+                route = OTHER_ROUTE
+            stats = self.routes.setdefault(route, RouteStats())
+        size = match.group('bytes')
+        stats.add(int(match.group('status')), int(size) if size != b'-' else 0, request_time, header_time, stream)
+
+    def total(self):
+        total = RouteStats()
+        for stats in self.routes.values():
+            total.merge(stats)
+        return total
+
+
+def rotation_order(path):
+    """Sort key putting rotated logs oldest first: access.log.10.gz, ..., access.log.1, access.log"""
+    match = re.search(r'\.(\d+)(?:\.gz)?$', path)
+    return (-int(match.group(1)) if match else 0, path)
+
+
+def read_lines(path):
+    """Yield the lines of a plain or gzip compressed log, '-' is stdin."""
+    if path == '-':
+        yield from sys.stdin.buffer
+    elif path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            yield from f
+    else:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from iter(mm.readline, b'')
+
+
+def follow_lines(path, poll=0.5):
+    """
+    Yield lines appended to a log like tail -F, starting at its end, and
+    None whenever no new line arrived for `poll` seconds. The log is
+    reopened when logrotate moves or truncates it.
+    """
+    if path == '-':
+        # Read raw chunks, a buffered readline could hold back lines select doesn't know about
+        fd, partial = sys.stdin.fileno(), b''
+        while True:
+            readable, _, _ = select.select([fd], [], [], poll)
+            if not readable:
+                yield None
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+
+    f = open(path, 'rb')
+    f.seek(0, os.SEEK_END)
+    partial = b''
+    while True:
+        line = f.readline()
+        if line:
+            if line.endswith(b'\n'):
+                yield partial + line
+                partial = b''
+            else:
+                partial += line
+            continue
+        yield None
+        time.sleep(poll)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+            f.close()
+            f = open(path, 'rb')
+            partial = b''
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_ms(seconds):
+    return '-' if seconds is None else f"{seconds * 1000:.0f}"
+
+
+def route_report(route, stats):
+    classes = {}
+    for status, count in stats.statuses.items():
+        classes[f"{status // 100}xx"] = classes.get(f"{status // 100}xx", 0) + count
+    return {
+        'route': route, 'requests': stats.count, 'streams': stats.streams, 'bytes': stats.bytes,
+        'statuses': {str(status): count for status, count in sorted(stats.statuses.items())},
+        'status_classes': classes,
+        'request_time': {f"p{q}": stats.request_time.quantile(q / 100) for q in (50, 95, 99)},
+        'upstream_header_time': {f"p{q}": stats.upstream_header_time.quantile(q / 100) for q in (50, 95, 99)},
+        'request_time_max': stats.request_time.max if stats.request_time.count else None,
+    }
+
+
+def report(log_stats, top):
+    routes = sorted(log_stats.routes.items(), key=lambda item: -item[1].count)
+    return {
+        'lines': log_stats.lines, 'unparsed': log_stats.unparsed, 'without_timing': log_stats.without_timing,
+        'total': route_report('TOTAL', log_stats.total()),
+        'routes': [route_report(route, stats) for route, stats in routes[:top]],
+    }
+
+
+def print_report(data, title=''):
+    if title:
+        print(title)
+    width = max([20] + [len(row['route']) for row in data['routes']]) + 2
+    print(f"{'ROUTE':<{width}} {'REQS':>8} {'2xx':>7} {'3xx':>6} {'4xx':>6} {'5xx':>6} {'BYTES':>10} "
+          f"{'P50 ms':>8} {'P95 ms':>8} {'P99 ms':>8} {'TTFB50':>8} {'TTFB95':>8} {'TTFB99':>8}")
+    for row in data['routes'] + [data['total']]:
+        route = row['route'] + (' *' if row['streams'] > row['requests'] / 2 else '')
+        classes, rt, uht = row['status_classes'], row['request_time'], row['upstream_header_time']
+        print(f"{route:<{width}} {row['requests']:>8} {classes.get('2xx', 0):>7} {classes.get('3xx', 0):>6} "
+              f"{classes.get('4xx', 0):>6} {classes.get('5xx', 0):>6} {format_bytes(row['bytes']):>10} "
+              f"{format_ms(rt['p50']):>8} {format_ms(rt['p95']):>8} {format_ms(rt['p99']):>8} "
+              f"{format_ms(uht['p50']):>8} {format_ms(uht['p95']):>8} {format_ms(uht['p99']):>8}")
+    errors = {status: count for status, count in data['total']['statuses'].items() if status >= '400'}
+    if errors:
+        print('Errors: ' + ', '.join(f"{status}={count}" for status, count in errors.items()))
+    if any(row['streams'] for row in data['routes']):
+        print('* streamed replies: P50-P99 is the length of the stream, TTFB the time to the first byte')
+    if data['without_timing'] and data['without_timing'] == data['lines'] - data['unparsed']:
+        print("No request times in this log, enable the 'ourchat' log_format from nginx-ourchat.conf")
+    if data['unparsed']:
+        print(f"{data['unparsed']} of {data['lines']} lines could not be parsed")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Per-route latency percentiles, status codes and bytes from nginx access logs '
+                    '(plain, rotated or gzip compressed), or live with --follow')
+    parser.add_argument('logs', nargs='*', default=[DEFAULT_LOGS],
+                        help=f"Access logs or glob patterns, '-' reads stdin (default: {DEFAULT_LOGS})")
+    parser.add_argument('--follow', '-f', action='store_true',
+                        help='Follow the newest log (or stdin) and print the routes every --interval seconds')
+    parser.add_argument('--interval', type=float, default=10,
+                        help='Seconds per report in follow mode, each covers only its interval (default: 10)')
+    parser.add_argument('--top', type=int, default=25, help='Routes to show, by number of requests (default: 25)')
+    parser.add_argument('--max-routes', type=int, default=200,
+                        help='Routes tracked before new ones are counted as (other) (default: 200)')
+    parser.add_argument('--api-only', action='store_true', help='Only count requests to /api')
+    parser.add_argument('--format', choices=['table', 'json'], default='table',
+                        help='Print a human readable table or JSON (default: table)')
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.logs:
+        matches = glob.glob(os.path.expanduser(pattern)) if pattern != '-' else ['-']
+        if not matches:
+            print(f"No log files match {pattern}", file=sys.stderr)
+        paths.extend(sorted(matches, key=rotation_order))
+    if not paths:
+        sys.exit(1)
+    api_only = re.compile(rb'"\S+ /api[/? ]') if args.api_only else None
+
+    def output(stats, title=''):
+        data = report(stats, args.top)
+        if args.format == 'json':
+            print(json.dumps(dict(data, time=title or None)), flush=True)
+        else:
+            print_report(data, title)
+            print(flush=True)
+
+    if not args.follow:
+        stats = LogStats(args.max_routes)
+        for path in paths:
+            try:
+                for line in read_lines(path):
+                    if not api_only or api_only.search(line):
+                        stats.add_line(line)
+            except (OSError, EOFError) as e:
+                print(f"Error reading {path}: {e}", file=sys.stderr)
+        output(stats)
+        return
+
+    path = paths[-1]
+    print(f"Following {path}, a report every {args.interval:g}s, Ctrl+C to stop", file=sys.stderr)
+    stats = LogStats(args.max_routes)
+    deadline = time.monotonic() + args.interval
+    try:
+        for line in follow_lines(path):
+            if line is not None and (not api_only or api_only.search(line)):
+                stats.add_line(line)
+            if time.monotonic() >= deadline:
+                if stats.lines:
+                    output(stats, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                stats = LogStats(args.max_routes)
+                deadline = time.monotonic() + args.interval
+    except KeyboardInterrupt:
+        pass
+    if stats.lines:
+        output(stats, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,1122 @@
 #! /usr/bin/env python3
 
-import sys, datetime
+import os, io, sys, gzip, json, math, time, hashlib, argparse, datetime, threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse, unquote, quote
+from concurrent.futures import ThreadPoolExecutor
 try:
+    import bson
     import pymongo
+    from bson import json_util
 except:
     print('pymongo missing, to install run:\n python3 -m pip install --upgrade pymongo')
     sys.exit(1)
 
-""" 
- # Some organizations want to purge older messages 
+"""
+ # Some organizations want to purge older messages
  # to stay compliant with their regulatory framework
-"""  
+ #
+ # Documents are deleted in small batches of _id ranges instead of one
+ # large delete_many, so the purge does not stall live chats with oplog
+ # and cache pressure. The last deleted _id of each collection is kept in
+ # a checkpoint file and an interrupted run resumes where it stopped.
+"""
 
 DAYSAGO=180
 PORT='27018'
+COLLECTIONS=['messages', 'files']
+# Collections covered by the retention policy announced in librechat.yaml that
+# MongoDB may expire by itself. files are left to the batched purge: TTL
+# expiry can't remove the uploaded blobs, archive or update Meilisearch.
+# conversations are left to the cascade, which only removes conversations
+# without messages; a createdAt TTL would expire conversations still in use.
+TTL_COLLECTIONS=['messages']
+TTL_INDEX_NAME='createdAt_ttl'
+CACHE_DIR=os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'our-chat')
+DEFAULT_BLOB_FAILURES=os.path.join(CACHE_DIR, 'purge-blob-failures.jsonl')
+DEFAULT_CHECKPOINT=os.path.join(CACHE_DIR, 'purge-checkpoint.json')
 
-client = pymongo.MongoClient(f"mongodb://127.0.0.1:{PORT}")
-# print(client.server_info())
-db = client['LibreChat']
-messages = db['messages']
-files = db['files']
 
-# Calculate the date X days ago from today
-time_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=DAYSAGO)
+class Checkpoint:
+    """
+    Remembers the cutoff date and the last deleted _id per collection.
+    Saved after every batch, removed when the purge is complete.
+    """
 
-# Delete all messages and files where 'createdAt' is older than X days
-messages_result = messages.delete_many({"createdAt": {"$lt": time_ago}})
-files_result = files.delete_many({"createdAt": {"$lt": time_ago}})
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json_util.loads(f.read())
 
-# Output the result of the deletion
-print(f"Deleted {messages_result.deleted_count} messages.")
-print(f"Deleted {files_result.deleted_count} files.")
+    def cutoff(self, days, database):
+        """The cutoff of an unfinished run against the same database, else now - days."""
+        if self.state.get('database') == database and self.state.get('days') == days and self.state.get('cutoff'):
+            return self.state['cutoff'], True
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+        self.state = {'database': database, 'days': days, 'cutoff': cutoff, 'last_id': {}, 'deleted': {}}
+        return cutoff, False
 
+    def last_id(self, collection):
+        return self.state.get('last_id', {}).get(collection)
+
+    def deleted(self, collection):
+        return self.state.get('deleted', {}).get(collection, 0)
+
+    def update(self, collection, last_id, deleted):
+        self.state.setdefault('last_id', {})[collection] = last_id
+        self.state.setdefault('deleted', {})[collection] = deleted
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json_util.dumps(self.state))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.state = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def add_connection_arguments(parser):
+    """The MongoDB connection options shared by the LibreChat database tools."""
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='MongoDB host (default: 127.0.0.1)')
+    parser.add_argument('--port', type=str, default=PORT, help=f'MongoDB port (default: {PORT})')
+    parser.add_argument('--uri', type=str, default='', help='MongoDB connection URI, overrides --host and --port')
+    parser.add_argument('--database', type=str, default='LibreChat', help='Database name (default: LibreChat)')
+
+
+def connect(args):
+    uri = args.uri or f"mongodb://{args.host}:{args.port}"
+    client = pymongo.MongoClient(uri)
+    return client[args.database]
+
+
+class Throttle:
+    """Keeps deletes under max_ops documents per second and pauses `sleep` seconds between batches."""
+
+    def __init__(self, max_ops=0, sleep=0):
+        self.max_ops = max_ops
+        self.sleep = sleep
+        self.start = time.monotonic()
+        self.done = 0
+
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return self.done / elapsed if elapsed else 0
+
+    def record(self, count):
+        self.done += count
+
+    def wait(self):
+        delay = self.sleep
+        if self.max_ops:
+            delay = max(delay, self.done / self.max_ops - (time.monotonic() - self.start))
+        if delay > 0:
+            time.sleep(delay)
+
+
+def batch_cursor(collection, cutoff, last_id, batch_size):
+    """The _ids of the next purge batch: up to batch_size documents older than cutoff after last_id."""
+    query = {"createdAt": {"$lt": cutoff}}
+    if last_id is not None:
+        query["_id"] = {"$gt": last_id}
+    return collection.find(query, {'_id': 1}).sort('_id', 1).limit(batch_size)
+
+
+def purge_collection(collection, cutoff, batch_size=1000, throttle=None, checkpoint=None, verbose=True,
+                     before_delete=None):
+    """
+    Delete all documents of `collection` with createdAt < cutoff in batches
+    of at most `batch_size` documents, walking the _id index upwards. Each
+    batch is one delete_many over an _id range so it is a single short
+    operation, paced by `throttle`. before_delete(collection, filter) is
+    called with the filter of every batch before it is deleted and may
+    return a callable, which is run once the delete succeeded. Returns the
+    number of deleted documents, including those of a resumed earlier run.
+    """
+    name = collection.name
+    throttle = throttle or Throttle()
+    last_id = checkpoint.last_id(name) if checkpoint else None
+    deleted = checkpoint.deleted(name) if checkpoint else 0
+    batch = 0
+
+    while True:
+        ids = [doc['_id'] for doc in batch_cursor(collection, cutoff, last_id, batch_size)]
+        if not ids:
+            break
+        batch_filter = {"_id": {"$gte": ids[0], "$lte": ids[-1]}, "createdAt": {"$lt": cutoff}}
+        after_delete = before_delete(collection, batch_filter) if before_delete else None
+        result = collection.delete_many(batch_filter)
+        if after_delete:
+            after_delete()
+        batch += 1
+        last_id = ids[-1]
+        deleted += result.deleted_count
+        throttle.record(result.deleted_count)
+        if checkpoint:
+            checkpoint.update(name, last_id, deleted)
+        if verbose:
+            print(f"{name}: batch {batch} deleted {result.deleted_count} (total {deleted}, "
+                  f"{throttle.rate():.0f} docs/s)", flush=True)
+        if len(ids) < batch_size:
+            break
+        throttle.wait()
+
+    return deleted
+
+
+def delete_ids(collection, ids, batch_size=1000, throttle=None, verbose=True, before_delete=None):
+    """
+    Delete the documents with the given _ids in batches of `batch_size`,
+    with the before_delete hook of purge_collection. Returns the deleted count.
+    """
+    throttle = throttle or Throttle()
+    deleted = 0
+    for batch, i in enumerate(range(0, len(ids), batch_size), 1):
+        batch_filter = {"_id": {"$in": ids[i:i + batch_size]}}
+        after_delete = before_delete(collection, batch_filter) if before_delete else None
+        result = collection.delete_many(batch_filter)
+        if after_delete:
+            after_delete()
+        deleted += result.deleted_count
+        throttle.record(result.deleted_count)
+        if verbose:
+            print(f"{collection.name}: batch {batch} deleted {result.deleted_count} (total {deleted}, "
+                  f"{throttle.rate():.0f} docs/s)", flush=True)
+        if i + batch_size < len(ids):
+            throttle.wait()
+    return deleted
+
+
+def purge_orphans(db, cutoff, batch_size=1000, throttle=None, verbose=True, before_delete=None):
+    """
+    Cascade stage after the message purge: delete conversations created
+    before `cutoff` that have no messages left, then shared links pointing
+    at conversations that no longer exist. Live conversation IDs come from
+    one streamed $group over messages and every collection is read once,
+    so the cost stays linear without a lookup per conversation.
+    before_delete is passed on to delete_ids. Returns {collection: deleted count}.
+    """
+    live = set()
+    for doc in db['messages'].aggregate([{"$group": {"_id": "$conversationId"}}], allowDiskUse=True):
+        live.add(doc['_id'])
+
+    orphans, remaining = [], set()
+    for doc in db['conversations'].find({}, {'conversationId': 1, 'createdAt': 1}):
+        created = doc.get('createdAt')
+        if doc.get('conversationId') not in live and created is not None and _before(created, cutoff):
+            orphans.append(doc['_id'])
+        else:
+            remaining.add(doc.get('conversationId'))
+    del live
+    totals = {'conversations': delete_ids(db['conversations'], orphans, batch_size, throttle, verbose, before_delete)}
+
+    links = [doc['_id'] for doc in db['sharedlinks'].find({}, {'conversationId': 1})
+             if doc.get('conversationId') and doc['conversationId'] not in remaining]
+    totals['sharedlinks'] = delete_ids(db['sharedlinks'], links, batch_size, throttle, verbose, before_delete)
+    return totals
+
+
+def _before(created, cutoff):
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    if created.tzinfo is None and cutoff.tzinfo is not None:
+        created = created.replace(tzinfo=datetime.timezone.utc)
+    return created < cutoff
+
+
+class BlobRemover:
+    """
+    Removes the uploaded blobs (local files or S3 objects) of `files`
+    records. Local files are unlinked by a pool of `workers` threads, S3
+    objects are removed with delete_objects in batches of 1000 keys. Every
+    blob that could not be removed is appended to `failure_log` as a JSON
+    line, which retry_failed_blobs reads back.
+    """
+
+    S3_BATCH = 1000
+
+    def __init__(self, root, bucket='', endpoint_url='', workers=8, failure_log=DEFAULT_BLOB_FAILURES, verbose=True):
+        self.roots = [os.path.realpath(root), os.path.realpath(os.path.join(root, 'client', 'public'))]
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.workers = workers
+        self.failure_log = failure_log
+        self.verbose = verbose
+        self.s3 = None
+        self.lock = threading.Lock()
+        self.counts = {'removed': 0, 'missing': 0, 'failed': 0, 'skipped': 0}
+
+    def __call__(self, collection, batch_filter):
+        """Read the blobs of a batch before it is deleted; returns the callable that removes them."""
+        docs = list(collection.find(batch_filter, {'filepath': 1, 'source': 1}))
+        return lambda: self.remove(docs)
+
+    def remove(self, docs):
+        local, s3 = [], []
+        for doc in docs:
+            source, filepath = doc.get('source') or 'local', doc.get('filepath')
+            if not filepath:
+                continue
+            if source == 'local':
+                local.append(filepath)
+            elif source == 's3':
+                s3.append(filepath)
+            else:
+                # openai, vectordb, firebase, ... are not managed here
+                self._count('skipped')
+        if local:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(self._remove_local, local))
+        for i in range(0, len(s3), self.S3_BATCH):
+            self._remove_s3(s3[i:i + self.S3_BATCH])
+
+    def local_path(self, filepath):
+        """Resolve a LibreChat filepath (/uploads/..., /images/...) below one of the roots."""
+        relative = filepath.lstrip('/')
+        for root in self.roots:
+            path = os.path.realpath(os.path.join(root, relative))
+            # Never follow a filepath outside of the upload directories
+            if os.path.commonpath([root, path]) == root and os.path.lexists(path):
+                return path
+        return None
+
+    def _remove_local(self, filepath):
+        path = self.local_path(filepath)
+        if path is None:
+            self._count('missing')
+            return
+        try:
+            os.remove(path)
+            self._count('removed')
+        except FileNotFoundError:
+            self._count('missing')
+        except OSError as e:
+            self._fail('local', filepath, str(e))
+
+    def s3_key(self, filepath):
+        """Extract the object key from an S3 URL (virtual-hosted or path style) or a plain key."""
+        url = urlparse(filepath)
+        if not url.scheme:
+            return filepath.lstrip('/')
+        path = unquote(url.path).lstrip('/')
+        if self.bucket and path.startswith(self.bucket + '/') and not (url.hostname or '').startswith(self.bucket + '.'):
+            return path[len(self.bucket) + 1:]
+        return path
+
+    def _remove_s3(self, filepaths):
+        if not self.bucket:
+            for filepath in filepaths:
+                self._fail('s3', filepath, 'no S3 bucket configured (--s3-bucket)')
+            return
+        if self.s3 is None:
+            try:
+                import boto3
+            except:
+                print('boto3 missing, to install run:\n python3 -m pip install --upgrade boto3')
+                sys.exit(1)
+            self.s3 = boto3.client('s3', endpoint_url=self.endpoint_url or None)
+        keys = {self.s3_key(filepath): filepath for filepath in filepaths}
+        try:
+            response = self.s3.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        except Exception as e:
+            for filepath in filepaths:
+                self._fail('s3', filepath, str(e))
+            return
+        errors = response.get('Errors', [])
+        for error in errors:
+            self._fail('s3', keys.get(error['Key'], error['Key']), f"{error.get('Code')}: {error.get('Message')}")
+        self._count('removed', len(keys) - len(errors))
+
+    def _count(self, what, n=1):
+        with self.lock:
+            self.counts[what] += n
+
+    def _fail(self, source, filepath, error):
+        with self.lock:
+            self.counts['failed'] += 1
+            os.makedirs(os.path.dirname(os.path.abspath(self.failure_log)), exist_ok=True)
+            with open(self.failure_log, 'a') as f:
+                f.write(json.dumps({'source': source, 'filepath': filepath, 'error': error,
+                                    'time': datetime.datetime.now(datetime.timezone.utc).isoformat()}) + '\n')
+        if self.verbose:
+            print(f"Could not remove {source} blob {filepath}: {error}", file=sys.stderr)
+
+
+def retry_failed_blobs(remover):
+    """Retry the blobs listed in the failure log, keeping only those that fail again."""
+    if not os.path.exists(remover.failure_log):
+        return
+    with open(remover.failure_log) as f:
+        docs = [json.loads(line) for line in f if line.strip()]
+    os.remove(remover.failure_log)
+    # Each blob once, even if it failed in several runs
+    unique = {(doc['source'], doc['filepath']): doc for doc in docs}
+    remover.remove(unique.values())
+
+
+def open_compressor(raw, compression):
+    """Wrap the binary file `raw` in a gzip or zstd compressing writer that leaves `raw` open."""
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except:
+            print('zstandard missing, to install run:\n python3 -m pip install --upgrade zstandard')
+            sys.exit(1)
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    return gzip.GzipFile(fileobj=raw, mode='wb')
+
+
+def open_decompressor(path):
+    """Open an archive part for binary reading, decompressing by file extension."""
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except:
+            print('zstandard missing, to install run:\n python3 -m pip install --upgrade zstandard')
+            sys.exit(1)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class HashingWriter:
+    """File wrapper computing the sha256 and size of everything written through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+def fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ArchivePart:
+    """One compressed archive file, written to a temporary name and renamed once synced to disk."""
+
+    def __init__(self, path, fmt, compression):
+        self.path = path
+        self.fmt = fmt
+        self.tmp_path = f"{path}.tmp"
+        self.raw = open(self.tmp_path, 'wb')
+        self.hasher = HashingWriter(self.raw)
+        self.stream = open_compressor(self.hasher, compression)
+        self.documents = 0
+        self.first_id = self.last_id = None
+
+    def write(self, doc):
+        if self.fmt == 'bson':
+            self.stream.write(bson.encode(doc))
+        else:
+            self.stream.write(json_util.dumps(doc).encode() + b'\n')
+        self.documents += 1
+        if self.first_id is None:
+            self.first_id = doc['_id']
+        self.last_id = doc['_id']
+
+    def commit(self):
+        """Flush and fsync the part, then move it to its final name. Returns its manifest entry."""
+        self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        self.raw.close()
+        os.replace(self.tmp_path, self.path)
+        fsync_directory(os.path.dirname(self.path))
+        return {'file': self.path, 'documents': self.documents, 'bytes': self.hasher.size,
+                'sha256': self.hasher.sha256.hexdigest(), 'first_id': str(self.first_id), 'last_id': str(self.last_id)}
+
+    def abort(self):
+        self.raw.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class Archiver:
+    """
+    Streams every batch that is about to be deleted into compressed JSONL or
+    BSON parts below `directory`, partitioned by collection and the month of
+    createdAt: <directory>/<collection>/<YYYY-MM>/<collection>-<YYYY-MM>-<run>-<batch>.jsonl.gz
+    Parts are fsynced before they are recorded with their sha256 in
+    <directory>/manifest.jsonl and only then does the delete of the batch
+    go ahead. Only the current batch is held open, so memory use does not
+    grow with the number of purged documents.
+    """
+
+    def __init__(self, directory, fmt='jsonl', compression='gzip'):
+        self.directory = directory
+        self.fmt = fmt
+        self.compression = compression
+        self.run = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self.extension = f".{fmt}.{'zst' if compression == 'zstd' else 'gz'}"
+        self.batches = 0
+        self.documents = 0
+        os.makedirs(directory, exist_ok=True)
+        if compression == 'zstd':
+            open_compressor(io.BytesIO(), compression)  # fail early if zstandard is missing
+
+    def __call__(self, collection, batch_filter):
+        self.batches += 1
+        parts = {}
+        try:
+            for doc in collection.find(batch_filter).sort('_id', 1):
+                created = doc.get('createdAt')
+                month = created.strftime('%Y-%m') if isinstance(created, datetime.datetime) else 'unknown'
+                if month not in parts:
+                    directory = os.path.join(self.directory, collection.name, month)
+                    os.makedirs(directory, exist_ok=True)
+                    name = f"{collection.name}-{month}-{self.run}-{self.batches:06d}{self.extension}"
+                    parts[month] = ArchivePart(os.path.join(directory, name), self.fmt, self.compression)
+                parts[month].write(doc)
+            entries = [dict(part.commit(), collection=collection.name, month=month, format=self.fmt)
+                       for month, part in parts.items()]
+        except BaseException:
+            for part in parts.values():
+                part.abort()
+            raise
+        self.write_manifest(entries)
+        self.documents += sum(entry['documents'] for entry in entries)
+
+    def write_manifest(self, entries):
+        path = os.path.join(self.directory, 'manifest.jsonl')
+        with open(path, 'a') as f:
+            for entry in entries:
+                entry['file'] = os.path.relpath(entry['file'], self.directory)
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_archive_part(path):
+    """Yield the documents of one archive part."""
+    with open_decompressor(path) as f:
+        if '.bson' in os.path.basename(path):
+            yield from bson.decode_file_iter(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def restore_archive(db, path, batch_size=1000, verbose=True):
+    """
+    Bulk-insert an archive directory (all parts of its manifest) or a single
+    part back into the database. Checksums are verified against the
+    manifest first; documents that already exist are skipped. Returns
+    {collection: restored count}.
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'manifest.jsonl')) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            entry['file'] = os.path.join(path, entry['file'])
+    else:
+        # A single part, the collection name is the file name up to the month
+        entries = [{'file': path, 'collection': os.path.basename(path).split('-')[0]}]
+
+    for entry in entries:
+        if entry.get('sha256') and file_sha256(entry['file']) != entry['sha256']:
+            print(f"Checksum mismatch, not restoring anything: {entry['file']}", file=sys.stderr)
+            sys.exit(1)
+
+    totals = {}
+    for entry in entries:
+        collection = db[entry['collection']]
+        restored = 0
+        batch = []
+        for doc in read_archive_part(entry['file']):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                restored += insert_batch(collection, batch)
+                batch = []
+        if batch:
+            restored += insert_batch(collection, batch)
+        totals[collection.name] = totals.get(collection.name, 0) + restored
+        if verbose:
+            print(f"{collection.name}: restored {restored} from {entry['file']}", flush=True)
+    return totals
+
+
+def insert_batch(collection, docs):
+    """insert_many that skips documents already present. Returns the inserted count."""
+    try:
+        return len(collection.insert_many(docs, ordered=False).inserted_ids)
+    except pymongo.errors.BulkWriteError as e:
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+        return e.details['nInserted']
+
+
+def read_env_file(path):
+    """Return the active KEY=value settings of a .env file as a dict, {} if it doesn't exist."""
+    settings = {}
+    if not os.path.exists(path):
+        return settings
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                settings[key.strip()] = value.strip().strip('"\'')
+    return settings
+
+
+class MeiliSync:
+    """
+    Removes purged messages and conversations from the Meilisearch indexes
+    LibreChat maintains when SEARCH=true (`messages` keyed by messageId,
+    `convos` keyed by conversationId). IDs are read before a batch is
+    deleted, queued once the delete succeeded and sent in delete-batch calls
+    of `batch_size` IDs. Each call's task is polled until it finishes or
+    `task_timeout` seconds pass; failed requests, tasks and timeouts are
+    retried with exponential backoff.
+    """
+
+    # Mongo collection -> (Meilisearch index, primary key)
+    INDEXES = {'messages': ('messages', 'messageId'), 'conversations': ('convos', 'conversationId')}
+
+    def __init__(self, host, key='', batch_size=10000, retries=5, timeout=30, poll_interval=0.5, task_timeout=300,
+                 verbose=True):
+        self.host = host.rstrip('/')
+        self.key = key
+        self.batch_size = batch_size
+        self.retries = retries
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self.verbose = verbose
+        self.pending = {index: [] for index, _ in self.INDEXES.values()}
+        self.deleted = {index: 0 for index in self.pending}
+        self.failed = {index: 0 for index in self.pending}
+
+    def __call__(self, collection, batch_filter):
+        """Read the IDs of a batch before it is deleted; returns the callable that queues them."""
+        if collection.name not in self.INDEXES:
+            return lambda: None
+        index, field = self.INDEXES[collection.name]
+        ids = [doc[field] for doc in collection.find(batch_filter, {field: 1}) if doc.get(field)]
+        return lambda: self.add(index, ids)
+
+    def add(self, index, ids):
+        self.pending[index].extend(ids)
+        if len(self.pending[index]) >= self.batch_size:
+            self.flush(index)
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"{self.host}{path}", data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.key:
+            request.add_header('Authorization', f"Bearer {self.key}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read() or b'{}')
+
+    def wait_for_task(self, task_uid):
+        deadline = time.monotonic() + self.task_timeout
+        while True:
+            task = self.request('GET', f"/tasks/{task_uid}")
+            if task.get('status') in ('succeeded', 'failed', 'canceled'):
+                return task
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"task {task_uid} still {task.get('status')} after {self.task_timeout:g}s")
+            time.sleep(self.poll_interval)
+
+    def flush(self, index=None):
+        """Send the pending IDs of one index (or all) to Meilisearch."""
+        for name in [index] if index else list(self.pending):
+            ids, self.pending[name] = self.pending[name], []
+            if ids:
+                self.delete_batch(name, ids)
+
+    def delete_batch(self, index, ids):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(30, 2 ** attempt * 0.5))
+            try:
+                task = self.request('POST', f"/indexes/{quote(index)}/documents/delete-batch", ids)
+                task = self.wait_for_task(task['taskUid'])
+                if task['status'] == 'succeeded':
+                    self.deleted[index] += len(ids)
+                    if self.verbose:
+                        print(f"meilisearch {index}: removed {len(ids)} documents", flush=True)
+                    return True
+                error = (task.get('error') or {}).get('message', task['status'])
+                if (task.get('error') or {}).get('code') == 'index_not_found':
+                    break
+            except urllib.error.HTTPError as e:
+                error = f"HTTP {e.code}: {e.read().decode(errors='replace')[:200]}"
+                # Client errors other than rate limiting won't get better by retrying
+                if 400 <= e.code < 500 and e.code != 429:
+                    break
+            except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+                error = str(e)
+        self.failed[index] += len(ids)
+        print(f"Could not remove {len(ids)} documents from meilisearch index {index}: {error}", file=sys.stderr)
+        return False
+
+
+def plan_stages(plan):
+    """Yield every stage name of an explain() plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+def query_plan(cursor):
+    """The stages of the winning plan of a find cursor, e.g. ['LIMIT', 'FETCH', 'IXSCAN'] or ['COLLSCAN']."""
+    explain = cursor.explain()
+    return list(plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {})))
+
+
+def add_bucket(buckets, key, documents, size):
+    bucket = buckets.setdefault(key, {'documents': 0, 'bytes': 0})
+    bucket['documents'] += documents
+    bucket['bytes'] += size
+
+
+def plan_purge(collection, cutoff, batch_size=1000, allow_collscan=False):
+    """
+    Dry run of purge_collection: explain the batch query exactly as the
+    purge sends it (sorted by _id, limited to batch_size, with the _id bound
+    of a later batch) and, unless selecting by createdAt would be a full
+    collection scan, count the documents to delete and their BSON size per
+    user and month with one aggregation. Neither user nor the document size
+    is in the createdAt index, so the aggregation FETCHes every counted
+    document; 'fetched' reports that cost. For files the uploaded blobs
+    (local or S3) and their size are counted too. Returns a report dict.
+    """
+    query = {"createdAt": {"$lt": cutoff}}
+    stages = query_plan(batch_cursor(collection, cutoff, bson.min_key.MinKey(), batch_size))
+    count_stages = query_plan(collection.find(query, {'_id': 1}))
+    report = {'collection': collection.name, 'plan': '>'.join(stages), 'collscan': 'COLLSCAN' in count_stages,
+              'documents': None, 'bytes': None, 'fetched': 0, 'blobs': None, 'blob_bytes': None,
+              'users': {}, 'months': {}}
+    if report['collscan'] and not allow_collscan:
+        return report
+
+    group = {"_id": {"user": "$user", "month": {"$dateToString": {"format": "%Y-%m", "date": "$createdAt"}}},
+             "count": {"$sum": 1}, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}
+    if collection.name == 'files':
+        # Same selection as BlobRemover: a filepath stored locally or in S3
+        is_blob = {"$and": [{"$gt": ["$filepath", None]},
+                            {"$in": [{"$ifNull": ["$source", "local"]}, ["local", "s3"]]}]}
+        group["blobs"] = {"$sum": {"$cond": [is_blob, 1, 0]}}
+        group["blob_bytes"] = {"$sum": {"$cond": [is_blob, {"$ifNull": ["$bytes", 0]}, 0]}}
+        report['blobs'] = report['blob_bytes'] = 0
+    report['documents'] = report['bytes'] = 0
+    for row in collection.aggregate([{"$match": query}, {"$group": group}], allowDiskUse=True):
+        user, month = str(row['_id'].get('user')), row['_id'].get('month')
+        add_bucket(report['users'], user, row['count'], row['bytes'])
+        add_bucket(report['months'], month, row['count'], row['bytes'])
+        report['documents'] += row['count']
+        report['bytes'] += row['bytes']
+        if 'blobs' in row:
+            report['blobs'] += row['blobs']
+            report['blob_bytes'] += row['blob_bytes']
+    report['fetched'] = report['documents']
+    return report
+
+
+def plan_cascade(db, cutoff):
+    """
+    Dry run of purge_orphans after the message purge: count the
+    conversations created before cutoff that would have no messages left
+    and the shared links to conversations that would be gone, with their
+    BSON size per user and month. Reads the conversationIds of all messages
+    the purge keeps and every conversation and shared link once, like the
+    cascade itself. Returns one report dict per collection.
+    """
+    live = set()
+    fetched = 0
+    kept = {"$match": {"createdAt": {"$not": {"$lt": cutoff}}}}
+    for doc in db['messages'].aggregate([kept, {"$group": {"_id": "$conversationId", "count": {"$sum": 1}}}],
+                                        allowDiskUse=True):
+        live.add(doc['_id'])
+        fetched += doc['count']
+
+    def sized(collection):
+        return collection.aggregate([{"$project": {"conversationId": 1, "createdAt": 1, "user": 1,
+                                                   "size": {"$bsonSize": "$$ROOT"}}}], allowDiskUse=True)
+
+    def new_report(name, fetched):
+        return {'collection': name, 'plan': 'cascade', 'collscan': False, 'documents': 0, 'bytes': 0,
+                'fetched': fetched, 'blobs': None, 'blob_bytes': None, 'users': {}, 'months': {}}
+
+    def count(report, doc):
+        created = doc.get('createdAt')
+        month = created.strftime('%Y-%m') if isinstance(created, datetime.datetime) else 'unknown'
+        add_bucket(report['users'], str(doc.get('user')), 1, doc['size'])
+        add_bucket(report['months'], month, 1, doc['size'])
+        report['documents'] += 1
+        report['bytes'] += doc['size']
+
+    conversations = new_report('conversations', fetched + db['conversations'].estimated_document_count())
+    remaining = set()
+    for doc in sized(db['conversations']):
+        created = doc.get('createdAt')
+        if doc.get('conversationId') not in live and created is not None and _before(created, cutoff):
+            count(conversations, doc)
+        else:
+            remaining.add(doc.get('conversationId'))
+    del live
+
+    links = new_report('sharedlinks', db['sharedlinks'].estimated_document_count())
+    for doc in sized(db['sharedlinks']):
+        if doc.get('conversationId') and doc['conversationId'] not in remaining:
+            count(links, doc)
+    return [conversations, links]
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def print_purge_plan(reports, cutoff, batch_size, max_ops, sleep, top=10):
+    print(f"Documents created before {cutoff:%Y-%m-%d %H:%M:%S} UTC would be purged:\n")
+    print(f"{'COLLECTION':<16} {'DOCUMENTS':>10} {'SIZE':>10} {'BATCHES':>8} {'DURATION':>10}  PLAN")
+    for r in reports:
+        if r['documents'] is None:
+            print(f"{r['collection']:<16} {'?':>10} {'?':>10} {'?':>8} {'?':>10}  {r['plan']}")
+            continue
+        batches = math.ceil(r['documents'] / batch_size)
+        seconds = max(r['documents'] / max_ops if max_ops else 0, max(batches - 1, 0) * sleep)
+        duration = str(datetime.timedelta(seconds=round(seconds))) if max_ops or sleep else 'unthrottled'
+        print(f"{r['collection']:<16} {r['documents']:>10} {format_bytes(r['bytes']):>10} {batches:>8} "
+              f"{duration:>10}  {r['plan']}")
+    for r in reports:
+        if r['blobs'] is not None:
+            print(f"\n{r['collection']}: {r['blobs']} uploaded blobs (local or S3) of "
+                  f"{format_bytes(r['blob_bytes'])} would be removed")
+    fetched = [f"{r['fetched']} for {r['collection']}" for r in reports if r['fetched']]
+    if fetched:
+        print(f"\nThis dry run FETCHed {sum(r['fetched'] for r in reports)} documents ({', '.join(fetched)}): "
+              f"users and document sizes are not in the createdAt index"
+              + (", and the cascade reads the kept messages, all conversations and all shared links."
+                 if any(r['plan'] == 'cascade' for r in reports) else "."))
+    for r in reports:
+        if r['collscan']:
+            print(f"\nWARNING: {r['collection']} has no index on createdAt, selecting documents by createdAt "
+                  f"is a COLLSCAN over the whole collection." + ('' if r['documents'] is not None else
+                                                   ' Counts skipped, use --allow-collscan to count anyway.'))
+
+    def cell(bucket):
+        return f"{bucket['documents']} {format_bytes(bucket['bytes'])}" if bucket else '0'
+
+    months = {}
+    for r in reports:
+        for month, bucket in r['months'].items():
+            months.setdefault(month, {})[r['collection']] = bucket
+    if months:
+        names = [r['collection'] for r in reports if r['documents'] is not None]
+        print(f"\n{'MONTH':<10}" + ''.join(f" {name:>20}" for name in names))
+        for month in sorted(months, key=str):
+            print(f"{str(month):<10}" + ''.join(f" {cell(months[month].get(name)):>20}" for name in names))
+
+    for r in reports:
+        if r['users']:
+            print(f"\nTop {min(top, len(r['users']))} of {len(r['users'])} users in {r['collection']}:")
+            for user, bucket in sorted(r['users'].items(), key=lambda item: -item[1]['documents'])[:top]:
+                print(f"  {user:<26} {bucket['documents']:>10} {format_bytes(bucket['bytes']):>10}")
+
+
+def find_created_at_indexes(collection):
+    """Return {name: info} of all indexes whose key starts with createdAt."""
+    return {name: info for name, info in collection.index_information().items()
+            if info['key'][0][0] == 'createdAt'}
+
+
+def manage_ttl_index(collection, days, apply=False):
+    """
+    Verify that `collection` has a TTL index on createdAt expiring documents
+    after `days` days. With apply, create the index or migrate an existing
+    createdAt index to it with collMod. Returns a dict with the status, the
+    action taken or needed, any conflicts found and the number of documents
+    the TTL monitor will remove once the index is in place.
+    """
+    seconds = int(days * 86400)
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=seconds)
+    report = {'collection': collection.name, 'status': 'missing', 'action': '', 'conflicts': [],
+              'expire_now': collection.count_documents({"createdAt": {"$lt": cutoff}}),
+              'never_expire': collection.count_documents({"createdAt": {"$not": {"$type": "date"}}})}
+    single, compound = [], []
+    for name, info in find_created_at_indexes(collection).items():
+        (single if len(info['key']) == 1 else compound).append((name, info))
+
+    for name, info in compound:
+        if 'expireAfterSeconds' in info:
+            report['conflicts'].append(f"{name}: TTL is ignored on compound indexes")
+    for name, info in single:
+        if info.get('partialFilterExpression'):
+            report['conflicts'].append(f"{name}: partial index, only matching documents would expire")
+    if len(single) > 1:
+        report['conflicts'].append('several single-field createdAt indexes: ' + ', '.join(n for n, _ in single))
+    if report['conflicts']:
+        report['status'] = 'conflict'
+        report['action'] = 'resolve conflicts manually'
+        return report
+
+    if not single:
+        report['action'] = f"create {TTL_INDEX_NAME} expireAfterSeconds={seconds}"
+        if apply:
+            collection.create_index([('createdAt', 1)], name=TTL_INDEX_NAME, expireAfterSeconds=seconds)
+            report['status'] = 'created'
+        return report
+
+    name, info = single[0]
+    current = info.get('expireAfterSeconds')
+    if current == seconds:
+        report['status'] = 'ok'
+        return report
+    report['status'] = 'mismatch' if current is not None else 'not ttl'
+    # Changing expireAfterSeconds, or adding it to a plain index (MongoDB 5.1+), works in place
+    report['action'] = f"collMod {name} expireAfterSeconds={seconds}" + (f" (was {current})" if current is not None else '')
+    if apply:
+        try:
+            collection.database.command({'collMod': collection.name,
+                                         'index': {'name': name, 'expireAfterSeconds': seconds}})
+            report['status'] = 'migrated'
+        except pymongo.errors.OperationFailure as e:
+            report['status'] = 'failed'
+            report['conflicts'].append(f"collMod failed ({e.details.get('errmsg', e) if e.details else e}), "
+                                       f"drop {name} and re-run to recreate it as TTL index")
+    return report
+
+
+def print_ttl_report(reports):
+    print(f"{'COLLECTION':<16} {'STATUS':<10} {'TO EXPIRE':>10} {'NO DATE':>8}  ACTION")
+    for r in reports:
+        print(f"{r['collection']:<16} {r['status']:<10} {r['expire_now']:>10} {r['never_expire']:>8}  {r['action']}")
+        for conflict in r['conflicts']:
+            print(f"  ! {conflict}")
+    backlog = sum(r['expire_now'] for r in reports)
+    if backlog:
+        print(f"The TTL monitor will remove {backlog} documents once the indexes exist. Run a batched purge "
+              f"first to avoid one large burst of deletes.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Purge LibreChat messages and files older than X days in small, throttled batches')
+    parser.add_argument('--days', type=int, default=DAYSAGO,
+                        help=f'Delete documents created more than this many days ago (default: {DAYSAGO})')
+    add_connection_arguments(parser)
+    parser.add_argument('--collections', type=str, default=','.join(COLLECTIONS),
+                        help=f"Comma-separated collections to purge (default: {','.join(COLLECTIONS)})")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Documents deleted per batch (default: 1000)')
+    parser.add_argument('--max-ops', type=float, default=0,
+                        help='Maximum documents deleted per second (default: 0 = unlimited)')
+    parser.add_argument('--sleep', type=float, default=0,
+                        help='Seconds to pause between batches (default: 0)')
+    parser.add_argument('--no-cascade', action='store_true',
+                        help="Don't delete old conversations without messages and shared links to deleted "
+                             "conversations after the purge")
+    parser.add_argument('--blob-root', type=str, default=os.path.expanduser('~/LibreChat'),
+                        help='LibreChat directory holding uploads/ and client/public/images/ (default: ~/LibreChat)')
+    parser.add_argument('--blob-workers', type=int, default=8,
+                        help='Threads removing local upload files (default: 8)')
+    parser.add_argument('--s3-bucket', type=str, default=os.environ.get('AWS_BUCKET_NAME', ''),
+                        help='Bucket of uploads stored in S3 (default: $AWS_BUCKET_NAME)')
+    parser.add_argument('--s3-endpoint-url', type=str, default='',
+                        help='S3 endpoint, e.g. for MinIO or a local test server')
+    parser.add_argument('--blob-failures', type=str, default=DEFAULT_BLOB_FAILURES,
+                        help=f'Blobs that could not be removed are logged here (default: {DEFAULT_BLOB_FAILURES})')
+    parser.add_argument('--retry-blobs', action='store_true',
+                        help='Only retry removing the blobs listed in --blob-failures')
+    parser.add_argument('--keep-blobs', action='store_true',
+                        help="Delete the files records but keep the uploaded blobs")
+    parser.add_argument('--archive', type=str, default='',
+                        help='Archive every batch to this directory before it is deleted')
+    parser.add_argument('--archive-format', choices=['jsonl', 'bson'], default='jsonl',
+                        help='Archive file format (default: jsonl)')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default='gzip',
+                        help='Archive compression, zstd needs the zstandard module (default: gzip)')
+    parser.add_argument('--restore', type=str, default='',
+                        help='Insert an archive directory or a single archive part back into the database')
+    parser.add_argument('--env-file', type=str, default=os.path.expanduser('~/LibreChat/.env'),
+                        help='LibreChat .env with the SEARCH and MEILI_* settings (default: ~/LibreChat/.env)')
+    parser.add_argument('--meili-host', type=str, default='',
+                        help='Meilisearch URL (default: MEILI_HOST from the environment or --env-file)')
+    parser.add_argument('--meili-batch-size', type=int, default=10000,
+                        help='IDs per Meilisearch delete-batch call (default: 10000)')
+    parser.add_argument('--meili-task-timeout', type=float, default=300,
+                        help='Seconds to wait for a Meilisearch task before the attempt counts as failed (default: 300)')
+    parser.add_argument('--no-meili', action='store_true',
+                        help="Don't remove purged messages and conversations from Meilisearch")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report what would be purged per collection, month and user, don't delete")
+    parser.add_argument('--allow-collscan', action='store_true',
+                        help='Let --dry-run count documents even if that needs a full collection scan')
+    parser.add_argument('--top', type=int, default=10, help='Users listed per collection by --dry-run (default: 10)')
+    parser.add_argument('--checkpoint', type=str, default=DEFAULT_CHECKPOINT,
+                        help=f'Resume state of an interrupted run (default: {DEFAULT_CHECKPOINT})')
+    parser.add_argument('--no-checkpoint', action='store_true', help="Don't read or write a checkpoint")
+    parser.add_argument('--ttl', choices=['check', 'apply'], default='',
+                        help='Instead of purging, verify (check) or create/migrate (apply) TTL indexes on createdAt '
+                             'so MongoDB expires documents older than --days continuously')
+    parser.add_argument('--ttl-collections', type=str, default=','.join(TTL_COLLECTIONS),
+                        help=f"Comma-separated collections managed by --ttl (default: {','.join(TTL_COLLECTIONS)})")
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print the totals, no per-batch progress')
+    args = parser.parse_args()
+
+    remover = None
+    if args.retry_blobs or not args.keep_blobs:
+        remover = BlobRemover(args.blob_root, args.s3_bucket, args.s3_endpoint_url, args.blob_workers,
+                              args.blob_failures, verbose=not args.quiet)
+    if args.retry_blobs:
+        retry_failed_blobs(remover)
+        print_blob_counts(remover)
+        return
+
+    db = connect(args)
+    if args.restore:
+        totals = restore_archive(db, args.restore, args.batch_size, verbose=not args.quiet)
+        for name, count in totals.items():
+            print(f"Restored {count} {name}.")
+        if totals.get('files'):
+            print("Archives hold the files records only, not the uploaded blobs. Restored files work again only "
+                  "if their blobs were kept (--keep-blobs) or are restored from a backup.")
+        return
+
+    settings = dict(read_env_file(args.env_file), **os.environ)
+    meili_host = args.meili_host or settings.get('MEILI_HOST', '')
+    search = not args.no_meili and meili_host and settings.get('SEARCH', 'true').lower() == 'true'
+
+    if args.ttl:
+        ttl_names = [c.strip() for c in args.ttl_collections.split(',') if c.strip()]
+        if args.ttl == 'apply':
+            if 'files' in ttl_names and not args.keep_blobs:
+                print("Refusing a TTL index on files: expired records would leave their uploaded blobs behind "
+                      "(locally or in S3). Purge files in batches, or add --keep-blobs to accept that.")
+                sys.exit(1)
+            if 'conversations' in ttl_names:
+                print("Refusing a TTL index on conversations: it would expire conversations created before --days "
+                      "that are still in use and orphan their recent messages. The cascade after a batched purge "
+                      "removes conversations without messages.")
+                sys.exit(1)
+            if args.archive:
+                print("Refusing --ttl apply with --archive: TTL expired documents are never archived.")
+                sys.exit(1)
+            if search:
+                print("WARNING: SEARCH=true, but TTL expired messages are not removed from the Meilisearch "
+                      "messages index.")
+        reports = [manage_ttl_index(db[name], args.days, apply=args.ttl == 'apply') for name in ttl_names]
+        print_ttl_report(reports)
+        if any(r['conflicts'] for r in reports):
+            sys.exit(1)
+        return
+
+    names = [c.strip() for c in args.collections.split(',') if c.strip()]
+    if args.dry_run:
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=args.days)
+        reports = [plan_purge(db[name], cutoff, args.batch_size, args.allow_collscan) for name in names]
+        if 'messages' in names and not args.no_cascade:
+            reports.extend(plan_cascade(db, cutoff))
+        print_purge_plan(reports, cutoff, args.batch_size, args.max_ops, args.sleep, args.top)
+        return
+
+    checkpoint = Checkpoint(None if args.no_checkpoint else args.checkpoint)
+    cutoff, resumed = checkpoint.cutoff(args.days, db.name)
+    if resumed:
+        print(f"Resuming interrupted purge of documents created before {cutoff:%Y-%m-%d %H:%M:%S} UTC")
+
+    archiver = None
+    if args.archive:
+        archiver = Archiver(args.archive, args.archive_format, args.compression)
+
+    meili = None
+    if search:
+        # MEILI_HOST=http://0.0.0.0:7700 in the .env is the listen address
+        meili = MeiliSync(meili_host.replace('//0.0.0.0', '//127.0.0.1'), settings.get('MEILI_MASTER_KEY', ''),
+                          args.meili_batch_size, task_timeout=args.meili_task_timeout, verbose=not args.quiet)
+
+    def before_delete(collection, batch_filter):
+        # Archive first: documents are only deleted once the archive part is on disk. Blobs and search
+        # entries go after the delete succeeded, so a failed batch keeps them
+        if archiver:
+            archiver(collection, batch_filter)
+        after = []
+        if remover and collection.name == 'files':
+            after.append(remover(collection, batch_filter))
+        if meili:
+            after.append(meili(collection, batch_filter))
+        return lambda: [action() for action in after]
+
+    totals = {}
+    throttle = Throttle(args.max_ops, args.sleep)
+    try:
+        for name in names:
+            totals[name] = purge_collection(db[name], cutoff, args.batch_size, throttle, checkpoint,
+                                            verbose=not args.quiet, before_delete=before_delete)
+        if 'messages' in names and not args.no_cascade:
+            totals.update(purge_orphans(db, cutoff, args.batch_size, throttle, verbose=not args.quiet,
+                                        before_delete=before_delete))
+    finally:
+        # Even after an interruption, the already deleted documents must leave the search index
+        if meili:
+            meili.flush()
+    checkpoint.clear()
+
+    # Output the result of the deletion
+    for name, count in totals.items():
+        print(f"Deleted {count} {name}.")
+    if remover and 'files' in names:
+        print_blob_counts(remover)
+    if archiver:
+        print(f"Archived {archiver.documents} documents to {args.archive}.")
+    if meili:
+        for index, count in meili.deleted.items():
+            failed = f" ({meili.failed[index]} failed)" if meili.failed[index] else ''
+            print(f"Removed {count} documents from meilisearch index {index}{failed}.")
+
+
+def print_blob_counts(remover):
+    counts = remover.counts
+    print(f"Removed {counts['removed']} file blobs ({counts['missing']} already gone, "
+          f"{counts['skipped']} not stored locally or in S3, {counts['failed']} failed).")
+    if counts['failed']:
+        print(f"Failed blobs are listed in {remover.failure_log}, retry with --retry-blobs")
+
+
+if __name__ == '__main__':
+    main()
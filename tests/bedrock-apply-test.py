@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+
+"""
+Offline check of bedrock-model-list.py --apply against the fake Bedrock
+server in tests/bedrock-fake.py: a first run where every invocation is
+throttled must not mark the new models as known, so a clean second run
+still adds them to BEDROCK_AWS_MODELS.
+
+  tests/bedrock-apply-test.py
+"""
+
+import os
+import sys
+import tempfile
+import importlib.util
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+REGION = 'us-west-2'
+CONFIGURED = 'us.anthropic.claude-fake-0-v1:0'
+EXPECTED_NEW = ['us.meta.llama-fake-1-instruct-v1:0', 'us.amazon.nova-fake-2-v1:0', 'amazon.titan-text-fake-3-v1']
+
+
+def load_script(path, name):
+    """Import a script whose file name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def check(condition, message):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    return condition
+
+
+def main():
+    fake_module = load_script(os.path.join(TESTS_DIR, 'bedrock-fake.py'), 'bedrock_fake')
+    fake = fake_module.FakeBedrock(fake_module.generate_catalog(4), connect_latency=0, first_chunk_latency=0,
+                                   chunk_delay=0)
+    server = fake_module.start_server(fake)
+    os.environ.update(fake_module.endpoint_environment(server))
+    # Imported after the endpoint variables are set so every boto3 client uses the fake
+    model_list = load_script(os.path.join(REPO_DIR, 'bedrock-model-list.py'), 'bedrock_model_list')
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        env_path = os.path.join(tmp, '.env')
+        with open(env_path, 'w') as f:
+            f.write(f"BEDROCK_AWS_MODELS={CONFIGURED}\n")
+        cache_path = os.path.join(tmp, 'probes.json')
+
+        def apply():
+            cache = model_list.ProbeCache(cache_path, 3600)
+            updated = model_list.apply_to_env_file(env_path, REGION, [], [], strict=True, cache=cache)
+            model_list.save_cache(cache)
+            return updated
+
+        # A plain listing run must not mark anything as known for --apply
+        cache = model_list.ProbeCache(cache_path, 3600)
+        model_list.probe_region(REGION, [], strict=True, cache=cache)
+        model_list.save_cache(cache)
+
+        fake.throttle_rate = 1.0
+        updated = apply()
+        ok &= check(updated == [CONFIGURED], f"throttled run keeps the .env unchanged: {updated}")
+        applied = model_list.ProbeCache(cache_path, 3600).applied_models(REGION)
+        ok &= check(applied == set(), f"throttled run records no decided models: {applied}")
+
+        fake.throttle_rate = 0.0
+        updated = apply()
+        ok &= check(updated == [CONFIGURED] + EXPECTED_NEW, f"clean run adds the new models: {updated}")
+        ok &= check(model_list.read_env_models(env_path) == updated, "clean run rewrites BEDROCK_AWS_MODELS")
+
+        applied = model_list.ProbeCache(cache_path, 3600).applied_models(REGION)
+        ok &= check(applied == {m['modelId'] for m in fake.catalog}, f"clean run records every model: {applied}")
+        updated = apply()
+        ok &= check(updated == [CONFIGURED] + EXPECTED_NEW, f"third run keeps the list: {updated}")
+
+    server.shutdown()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
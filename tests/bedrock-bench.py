@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+"""
+Probe throughput benchmark for bedrock-model-list.py, run entirely offline
+against the fake Bedrock server in tests/bedrock-fake.py.
+
+For every catalog size (default 50, 200 and 1000 models) and worker count it
+runs a full find_working_models pass through real boto3 clients and reports
+the wall time, model invocations per second and models per second.
+Append the results to a JSONL file with --output to track performance of the
+generator across changes:
+
+  tests/bedrock-bench.py --sizes 50,200,1000 --jobs 1,8,32 --output bench.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+INVOKE_OPERATIONS = ['InvokeModel', 'InvokeModelWithResponseStream', 'Converse', 'ConverseStream']
+
+
+def load_script(path, name):
+    """Import a script whose file name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run_case(model_list, fake_module, fake, size, jobs, args):
+    """Run one full probe pass over a fresh catalog of `size` models."""
+    fake.catalog = fake_module.generate_catalog(size, args.access_denied_rate, args.seed)
+    fake.requests.clear()
+
+    start = time.monotonic()
+    models = model_list.get_foundation_models(args.region)
+    client = model_list.create_runtime_client(args.region, jobs)
+    profile_index = None
+    if args.resolve == 'metadata':
+        profile_index = model_list.build_profile_index(model_list.get_inference_profiles(args.region))
+    scheduler = model_list.ProbeScheduler(args.max_rps, args.model_rps, 0, args.max_retries, backoff_base=0.1)
+    working = model_list.find_working_models(models, client, strict=not args.loose, jobs=jobs,
+                                             profile_index=profile_index, api=args.api, scheduler=scheduler)
+    wall = time.monotonic() - start
+
+    invocations = sum(fake.requests.get(op, 0) for op in INVOKE_OPERATIONS)
+    return {
+        'models': size,
+        'jobs': jobs,
+        'mode': f"{'loose' if args.loose else 'strict'}/{args.resolve}/{args.api}",
+        'working': len(working),
+        'invocations': invocations,
+        'wall_seconds': round(wall, 3),
+        'invocations_per_sec': round(invocations / wall, 1) if wall else None,
+        'models_per_sec': round(size / wall, 1) if wall else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline probe throughput benchmark for bedrock-model-list.py')
+    parser.add_argument('--sizes', default='50,200,1000', help='Comma-separated catalog sizes (default: 50,200,1000)')
+    parser.add_argument('--jobs', default='8', help='Comma-separated worker counts to compare (default: 8)')
+    parser.add_argument('--loose', action='store_true', help='Benchmark loose (non-streaming) probing')
+    parser.add_argument('--resolve', choices=['probe', 'metadata'], default='probe', help='Prefix resolution mode')
+    parser.add_argument('--api', choices=['invoke', 'converse'], default='invoke', help='Bedrock API used for probes')
+    parser.add_argument('--region', default='us-west-2')
+    parser.add_argument('--max-rps', type=float, default=0, help='Scheduler rate limit per region (default: 0 = unlimited)')
+    parser.add_argument('--model-rps', type=float, default=0, help='Scheduler rate limit per model (default: 0 = unlimited)')
+    parser.add_argument('--max-retries', type=int, default=4, help='Re-queue rounds for throttled models (default: 4)')
+    parser.add_argument('--first-chunk-latency', type=float, default=50, help='Fake time to first chunk in ms (default: 50)')
+    parser.add_argument('--connect-latency', type=float, default=10, help='Fake time to response headers in ms (default: 10)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fake throttling probability (default: 0)')
+    parser.add_argument('--access-denied-rate', type=float, default=0.05, help='Fraction of models without access')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='', help='Append the results as JSON lines to this file')
+    args = parser.parse_args()
+
+    fake_module = load_script(os.path.join(TESTS_DIR, 'bedrock-fake.py'), 'bedrock_fake')
+    fake = fake_module.FakeBedrock(
+        [],
+        connect_latency=args.connect_latency / 1000,
+        first_chunk_latency=args.first_chunk_latency / 1000,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    )
+    server = fake_module.start_server(fake)
+    os.environ.update(fake_module.endpoint_environment(server))
+    # Imported after the endpoint variables are set so every boto3 client uses the fake
+    model_list = load_script(os.path.join(REPO_DIR, 'bedrock-model-list.py'), 'bedrock_model_list')
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    jobs_list = [int(j) for j in args.jobs.split(',') if j.strip()]
+    revision = git_revision()
+
+    print(f"{'MODELS':>7} {'JOBS':>5} {'WORKING':>8} {'CALLS':>7} {'WALL s':>8} {'CALLS/s':>8} {'MODELS/s':>9}")
+    results = []
+    for size in sizes:
+        for jobs in jobs_list:
+            result = run_case(model_list, fake_module, fake, size, jobs, args)
+            result.update({'revision': revision, 'timestamp': int(time.time())})
+            results.append(result)
+            print(f"{result['models']:>7} {result['jobs']:>5} {result['working']:>8} {result['invocations']:>7} "
+                  f"{result['wall_seconds']:>8.2f} {result['invocations_per_sec']:>8} {result['models_per_sec']:>9}")
+
+    server.shutdown()
+    if args.output:
+        with open(args.output, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,535 @@
+#! /usr/bin/env python3
+
+"""
+Offline stand-in for the AWS Bedrock control plane (bedrock) and runtime
+(bedrock-runtime) APIs. It is a local HTTP server that speaks the same REST
+and event-stream wire formats, so boto3 can be pointed at it unchanged:
+
+  tests/bedrock-fake.py --port 8777 --models 200 &
+  export AWS_ENDPOINT_URL_BEDROCK=http://127.0.0.1:8777
+  export AWS_ENDPOINT_URL_BEDROCK_RUNTIME=http://127.0.0.1:8777
+  export AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake AWS_DEFAULT_REGION=us-west-2
+  ./bedrock-model-list.py -v
+
+Supported: ListFoundationModels, ListInferenceProfiles, InvokeModel,
+InvokeModelWithResponseStream, Converse and ConverseStream, with
+configurable latency, streamed chunks, per-prefix availability and a mix
+of ValidationException / AccessDeniedException / ThrottlingException.
+Titan and Cohere embedding models answer InvokeModel with vectors, and
+--max-concurrency throttles invocations beyond that many in flight, like an
+account quota does.
+"""
+
+import sys
+import json
+import time
+import base64
+import random
+import struct
+import zlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (provider model ID template, prefixes it can be invoked with, output modality)
+# '' means on-demand invocation without an inference profile prefix
+MODEL_FAMILIES = [
+    ('anthropic.claude-fake-{i}-v1:0', ['us.', 'global.'], 'TEXT'),
+    ('meta.llama-fake-{i}-instruct-v1:0', ['us.'], 'TEXT'),
+    ('amazon.nova-fake-{i}-v1:0', ['us.'], 'TEXT'),
+    ('amazon.titan-text-fake-{i}-v1', [''], 'TEXT'),
+    ('mistral.mistral-fake-{i}-v1:0', [''], 'TEXT'),
+    ('cohere.command-fake-{i}-v1:0', [''], 'TEXT'),
+    ('deepseek.r-fake-{i}-v1:0', ['us.'], 'TEXT'),
+    ('openai.gpt-oss-fake-{i}-1:0', [''], 'TEXT'),
+    ('anthropic.claude-fake-global-{i}-v1:0', ['global.'], 'TEXT'),
+    ('amazon.titan-embed-fake-{i}-v2:0', [''], 'EMBEDDING'),
+    ('stability.sd-fake-{i}-v1:0', [''], 'IMAGE'),
+]
+
+# Real embedding model IDs served next to the generated catalog, so the RAG
+# settings (EMBEDDINGS_MODEL) can be benchmarked offline
+EMBEDDING_MODELS = ['amazon.titan-embed-text-v2:0', 'amazon.titan-embed-text-v1', 'cohere.embed-english-v3',
+                    'cohere.embed-multilingual-v3']
+
+ERROR_STATUS = {
+    'ValidationException': 400,
+    'AccessDeniedException': 403,
+    'ResourceNotFoundException': 404,
+    'ThrottlingException': 429,
+    'ServiceUnavailableException': 503,
+}
+
+
+def generate_catalog(count, access_denied_rate=0.0, seed=42):
+    """
+    Build a deterministic catalog of `count` fake models cycling through
+    MODEL_FAMILIES. A fraction of the models (access_denied_rate) is marked
+    as not granted to the account.
+    """
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(count):
+        template, prefixes, modality = MODEL_FAMILIES[i % len(MODEL_FAMILIES)]
+        catalog.append({
+            'modelId': template.format(i=i),
+            'prefixes': list(prefixes),
+            'outputModality': modality,
+            'access': rng.random() >= access_denied_rate,
+        })
+    return catalog
+
+
+def encode_header(name, value):
+    """Encode one event-stream string header (type 7)."""
+    name = name.encode()
+    value = value.encode()
+    return struct.pack('!B', len(name)) + name + struct.pack('!BH', 7, len(value)) + value
+
+
+def encode_event(headers, payload):
+    """Encode one AWS event-stream message with prelude and message CRCs."""
+    header_bytes = b''.join(encode_header(k, v) for k, v in headers.items())
+    total_length = 12 + len(header_bytes) + len(payload) + 4
+    prelude = struct.pack('!II', total_length, len(header_bytes))
+    prelude += struct.pack('!I', zlib.crc32(prelude) & 0xffffffff)
+    message = prelude + header_bytes + payload
+    return message + struct.pack('!I', zlib.crc32(message) & 0xffffffff)
+
+
+def event_message(event_type, body):
+    return encode_event({
+        ':event-type': event_type,
+        ':content-type': 'application/json',
+        ':message-type': 'event',
+    }, json.dumps(body).encode())
+
+
+def exception_message(error_code, message):
+    # Exception events use the lower camel case member name of the stream shape
+    return encode_event({
+        ':exception-type': error_code[0].lower() + error_code[1:],
+        ':content-type': 'application/json',
+        ':message-type': 'exception',
+    }, json.dumps({'message': message}).encode())
+
+
+def requested_max_tokens(body):
+    """Find the output token limit in any provider's request body."""
+    for key in ('max_tokens', 'max_gen_len', 'maxTokens', 'max_completion_tokens'):
+        if key in body:
+            return body[key]
+    for config in ('textGenerationConfig', 'inferenceConfig'):
+        if config in body:
+            return requested_max_tokens(body[config])
+    return None
+
+
+class FakeBedrock:
+    """
+    Model catalog plus behaviour knobs shared by all request handlers.
+    Latencies are in seconds; error rates are per-request probabilities.
+    """
+
+    def __init__(self, catalog, connect_latency=0.01, first_chunk_latency=0.05, chunk_delay=0.005, chunks=20,
+                 tokens_per_chunk=3, throttle_rate=0.0, validation_rate=0.0, stream_error_rate=0.0, jitter=0.2,
+                 embed_dimensions=1024, embed_latency_per_kchar=0.01, max_concurrency=0, seed=None):
+        self.catalog = catalog
+        self.connect_latency = connect_latency
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.tokens_per_chunk = tokens_per_chunk
+        self.throttle_rate = throttle_rate
+        self.validation_rate = validation_rate
+        self.stream_error_rate = stream_error_rate
+        self.jitter = jitter
+        self.embed_dimensions = embed_dimensions
+        self.embed_latency_per_kchar = embed_latency_per_kchar
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    @property
+    def catalog(self):
+        return self._catalog
+
+    @catalog.setter
+    def catalog(self, catalog):
+        self._catalog = catalog
+        self.by_id = {model['modelId']: model for model in catalog}
+
+    def count(self, operation):
+        with self.lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def chance(self, rate):
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def enter(self):
+        """Count an invocation in flight, False if max_concurrency are already running."""
+        with self.lock:
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self.lock:
+                factor = 1 + self.rng.uniform(-self.jitter, self.jitter)
+            time.sleep(seconds * factor)
+
+    def foundation_models(self):
+        return [{
+            'modelId': model['modelId'],
+            'modelArn': f"arn:aws:bedrock:us-west-2::foundation-model/{model['modelId']}",
+            'providerName': model['modelId'].split('.')[0],
+            'inputModalities': ['TEXT'],
+            'outputModalities': [model['outputModality']],
+            'responseStreamingSupported': model['outputModality'] == 'TEXT',
+            'inferenceTypesSupported': ['ON_DEMAND'] if '' in model['prefixes'] else ['INFERENCE_PROFILE'],
+            'modelLifecycle': {'status': 'ACTIVE'},
+        } for model in self.catalog]
+
+    def inference_profiles(self):
+        return [{
+            'inferenceProfileId': f"{prefix}{model['modelId']}",
+            'inferenceProfileName': f"{prefix}{model['modelId']}",
+            'inferenceProfileArn': f"arn:aws:bedrock:us-west-2::inference-profile/{prefix}{model['modelId']}",
+            'models': [{'modelArn': f"arn:aws:bedrock:us-west-2::foundation-model/{model['modelId']}"}],
+            'status': 'ACTIVE',
+            'type': 'SYSTEM_DEFINED',
+        } for model in self.catalog for prefix in model['prefixes'] if prefix]
+
+    def check_invocation(self, invoked_id):
+        """Return (error_code, message) for an invocation, or None if it may proceed."""
+        prefix = ''
+        base_id = invoked_id
+        for candidate in ('us.', 'global.'):
+            if invoked_id.startswith(candidate):
+                prefix, base_id = candidate, invoked_id[len(candidate):]
+        model = self.by_id.get(base_id)
+        if model is None:
+            return 'ValidationException', 'The provided model identifier is invalid.'
+        if prefix not in model['prefixes']:
+            if prefix:
+                return 'ValidationException', 'The provided model identifier is invalid.'
+            return ('ValidationException', f"Invocation of model ID {base_id} with on-demand throughput isn't "
+                    "supported. Retry your request with the ID or ARN of an inference profile that contains this model.")
+        if not model['access']:
+            return 'AccessDeniedException', "You don't have access to the model with the specified model ID."
+        if self.chance(self.throttle_rate):
+            return 'ThrottlingException', 'Too many requests, please wait before trying again.'
+        if self.chance(self.validation_rate):
+            return 'ValidationException', 'Malformed input request, please reformat your input and try again.'
+        return None
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeBedrock/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_code(self, error_code, message):
+        self.send_json(ERROR_STATUS.get(error_code, 400), {'message': message}, {'x-amzn-ErrorType': error_code})
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(data) if data else {}
+        except ValueError:
+            return {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/foundation-models':
+            self.fake.count('ListFoundationModels')
+            self.send_json(200, {'modelSummaries': self.fake.foundation_models()})
+        elif url.path == '/inference-profiles':
+            self.fake.count('ListInferenceProfiles')
+            profiles = self.fake.inference_profiles()
+            start = int(query.get('nextToken', ['0'])[0])
+            page_size = int(query.get('maxResults', ['100'])[0])
+            page = {'inferenceProfileSummaries': profiles[start:start + page_size]}
+            if start + page_size < len(profiles):
+                page['nextToken'] = str(start + page_size)
+            self.send_json(200, page)
+        else:
+            self.send_error_code('ResourceNotFoundException', f"Unknown path {url.path}")
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.split('/')
+        if len(parts) != 4 or parts[1] != 'model':
+            self.send_error_code('ResourceNotFoundException', f"Unknown path {self.path}")
+            return
+        model_id = unquote(parts[2])
+        operation = parts[3]
+        body = self.read_body()
+        operations = {
+            'invoke': ('InvokeModel', self.invoke),
+            'invoke-with-response-stream': ('InvokeModelWithResponseStream', self.invoke_stream),
+            'converse': ('Converse', self.converse),
+            'converse-stream': ('ConverseStream', self.converse_stream),
+        }
+        if operation not in operations:
+            self.send_error_code('ResourceNotFoundException', f"Unknown operation {operation}")
+            return
+        name, handler = operations[operation]
+        self.fake.count(name)
+
+        self.fake.sleep(self.fake.connect_latency)
+        error = self.fake.check_invocation(model_id)
+        if error:
+            self.send_error_code(*error)
+            return
+        if not self.fake.enter():
+            self.send_error_code('ThrottlingException', 'Too many concurrent requests, please wait before trying again.')
+            return
+        try:
+            handler(model_id, body)
+        finally:
+            self.fake.leave()
+
+    def output_chunks(self, body):
+        max_tokens = requested_max_tokens(body) or self.fake.chunks * self.fake.tokens_per_chunk
+        return max(1, min(self.fake.chunks, -(-max_tokens // self.fake.tokens_per_chunk)))
+
+    def is_embedding(self, model_id):
+        model = self.fake.by_id.get(model_id.split('.', 1)[1] if model_id.startswith(('us.', 'global.')) else model_id)
+        return model is not None and model['outputModality'] == 'EMBEDDING'
+
+    def invoke(self, model_id, body):
+        if self.is_embedding(model_id):
+            # Titan embeds one inputText, Cohere a list of texts
+            texts = body['texts'] if 'texts' in body else [body.get('inputText', '')]
+            chars = sum(len(text) for text in texts)
+            self.fake.sleep(self.fake.first_chunk_latency + self.fake.embed_latency_per_kchar * chars / 1000)
+            dimensions = body.get('dimensions', self.fake.embed_dimensions)
+            vectors = [[rng.uniform(-1, 1) for _ in range(dimensions)] for rng in map(random.Random, texts)]
+            if 'texts' in body:
+                self.send_json(200, {'embeddings': vectors, 'texts': texts, 'response_type': 'embeddings_floats'})
+            else:
+                self.send_json(200, {'embedding': vectors[0], 'inputTextTokenCount': max(1, chars // 4)})
+            return
+        chunks = self.output_chunks(body)
+        self.fake.sleep(self.fake.first_chunk_latency + self.fake.chunk_delay * (chunks - 1))
+        text = ', '.join(str(n) for n in range(1, chunks + 1))
+        self.send_json(200, {
+            'content': [{'type': 'text', 'text': text}],
+            'outputText': text,
+            'generation': text,
+            'stop_reason': 'end_turn',
+        }, {
+            'X-Amzn-Bedrock-Input-Token-Count': '10',
+            'X-Amzn-Bedrock-Output-Token-Count': str(chunks * self.fake.tokens_per_chunk),
+        })
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.amazon.eventstream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def invoke_stream(self, model_id, body):
+        chunks = self.output_chunks(body)
+        self.start_stream()
+        try:
+            self.fake.sleep(self.fake.first_chunk_latency)
+            for n in range(1, chunks + 1):
+                payload = {
+                    'type': 'content_block_delta',
+                    'delta': {'type': 'text_delta', 'text': f"{n}, "},
+                    'outputText': f"{n}, ",
+                    'generation': f"{n}, ",
+                }
+                if n == chunks:
+                    # Final chunk: every provider's end marker plus Bedrock's invocation metrics
+                    payload.update({
+                        'type': 'message_stop',
+                        'stop_reason': 'stop',
+                        'completionReason': 'FINISH',
+                        'choices': [{'finish_reason': 'stop', 'stop_reason': 'stop'}],
+                        'amazon-bedrock-invocationMetrics': {
+                            'inputTokenCount': 10,
+                            'outputTokenCount': chunks * self.fake.tokens_per_chunk,
+                        },
+                    })
+                chunk = {'bytes': base64.b64encode(json.dumps(payload).encode()).decode()}
+                self.write_chunk(event_message('chunk', chunk))
+                if n == 1 and n < chunks and self.fake.chance(self.fake.stream_error_rate):
+                    # Bedrock can also throttle in the middle of a stream
+                    self.write_chunk(exception_message('ThrottlingException', 'Too many tokens, please wait.'))
+                    self.end_stream()
+                    return
+                if n < chunks:
+                    self.fake.sleep(self.fake.chunk_delay)
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            # Probes hang up after the first chunk
+            self.close_connection = True
+
+    def converse(self, model_id, body):
+        chunks = self.output_chunks(body)
+        self.fake.sleep(self.fake.first_chunk_latency + self.fake.chunk_delay * (chunks - 1))
+        self.send_json(200, {
+            'output': {'message': {'role': 'assistant', 'content': [
+                {'text': ', '.join(str(n) for n in range(1, chunks + 1))}]}},
+            'stopReason': 'end_turn',
+            'usage': {'inputTokens': 10, 'outputTokens': chunks * self.fake.tokens_per_chunk,
+                      'totalTokens': 10 + chunks * self.fake.tokens_per_chunk},
+            'metrics': {'latencyMs': int(self.fake.first_chunk_latency * 1000)},
+        })
+
+    def converse_stream(self, model_id, body):
+        chunks = self.output_chunks(body)
+        start = time.monotonic()
+        self.start_stream()
+        try:
+            self.write_chunk(event_message('messageStart', {'role': 'assistant'}))
+            self.fake.sleep(self.fake.first_chunk_latency)
+            for n in range(1, chunks + 1):
+                self.write_chunk(event_message('contentBlockDelta', {'contentBlockIndex': 0, 'delta': {'text': f"{n}, "}}))
+                if n < chunks:
+                    self.fake.sleep(self.fake.chunk_delay)
+            self.write_chunk(event_message('contentBlockStop', {'contentBlockIndex': 0}))
+            self.write_chunk(event_message('messageStop', {'stopReason': 'end_turn'}))
+            self.write_chunk(event_message('metadata', {
+                'usage': {'inputTokens': 10, 'outputTokens': chunks * self.fake.tokens_per_chunk,
+                          'totalTokens': 10 + chunks * self.fake.tokens_per_chunk},
+                'metrics': {'latencyMs': int((time.monotonic() - start) * 1000)},
+            }))
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class FakeBedrockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up (probes closing their stream early) are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+def start_server(fake, host='127.0.0.1', port=0, verbose=False):
+    """Serve `fake` in a background thread; returns the server (server.server_address has the port)."""
+    server = FakeBedrockServer((host, port), FakeBedrockHandler)
+    server.fake = fake
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def endpoint_environment(server):
+    """Environment variables that point boto3 at the fake server."""
+    host, port = server.server_address[:2]
+    url = f"http://{host}:{port}"
+    return {
+        'AWS_ENDPOINT_URL_BEDROCK': url,
+        'AWS_ENDPOINT_URL_BEDROCK_RUNTIME': url,
+        'AWS_ACCESS_KEY_ID': 'fake',
+        'AWS_SECRET_ACCESS_KEY': 'fake',
+        'AWS_DEFAULT_REGION': 'us-west-2',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline stand-in for the AWS Bedrock APIs')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8777, help='Port to listen on (default: 8777)')
+    parser.add_argument('--models', type=int, default=100, help='Number of generated fake models (default: 100)')
+    parser.add_argument('--catalog', type=str, default='',
+                        help='JSON file with a model list instead of generated models: '
+                             '[{"modelId": ..., "prefixes": ["us.", ""], "outputModality": "TEXT", "access": true}]')
+    parser.add_argument('--access-denied-rate', type=float, default=0.05,
+                        help='Fraction of generated models the account has no access to (default: 0.05)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Probability that an invocation gets a ThrottlingException (default: 0)')
+    parser.add_argument('--validation-rate', type=float, default=0.0,
+                        help='Probability that an invocation gets a payload ValidationException (default: 0)')
+    parser.add_argument('--stream-error-rate', type=float, default=0.0,
+                        help='Probability that a stream is cut off by a throttlingException event (default: 0)')
+    parser.add_argument('--connect-latency', type=float, default=10, help='Milliseconds before response headers (default: 10)')
+    parser.add_argument('--first-chunk-latency', type=float, default=50, help='Milliseconds to the first chunk (default: 50)')
+    parser.add_argument('--chunk-delay', type=float, default=5, help='Milliseconds between streamed chunks (default: 5)')
+    parser.add_argument('--chunks', type=int, default=20, help='Max chunks per streamed response (default: 20)')
+    parser.add_argument('--embed-latency', type=float, default=10,
+                        help='Milliseconds per 1000 characters embedded, on top of --first-chunk-latency (default: 10)')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='Throttle invocations beyond this many in flight (default: 0 = unlimited)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the generated catalog and error mix')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    if args.catalog:
+        with open(args.catalog) as f:
+            catalog = json.load(f)
+    else:
+        catalog = generate_catalog(args.models, args.access_denied_rate, args.seed)
+        catalog += [{'modelId': model_id, 'prefixes': [''], 'outputModality': 'EMBEDDING', 'access': True}
+                    for model_id in EMBEDDING_MODELS]
+
+    fake = FakeBedrock(
+        catalog,
+        connect_latency=args.connect_latency / 1000,
+        first_chunk_latency=args.first_chunk_latency / 1000,
+        chunk_delay=args.chunk_delay / 1000,
+        chunks=args.chunks,
+        throttle_rate=args.throttle_rate,
+        validation_rate=args.validation_rate,
+        stream_error_rate=args.stream_error_rate,
+        embed_latency_per_kchar=args.embed_latency / 1000,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+    server = start_server(fake, args.host, args.port, args.verbose)
+
+    print(f"Fake Bedrock serving {len(catalog)} models, point boto3 at it with:", file=sys.stderr)
+    for key, value in endpoint_environment(server).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\nRequests served: {json.dumps(fake.requests)}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
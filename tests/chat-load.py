@@ -0,0 +1,421 @@
+#! /usr/bin/env python3
+
+"""
+Synthetic chat load for LibreChat. Every virtual user logs in, loads the
+conversation list and then chats: a new conversation, a streamed message,
+title generation and a few follow-up turns, with an exponential think time
+between messages. The user count is raised in stages and for each stage the
+tool reports request latency percentiles, SSE time to first byte and first
+token, the 429 rate-limit rejections and whether the stage stayed within
+the service level, so the largest sustainable user count can be read off.
+
+The rate limits of the LibreChat .env are read to predict where the
+limits, rather than the server, will cap the load. With --mock-llm the
+fake Bedrock server of tests/bedrock-fake.py answers the LLM calls of a
+real LibreChat started with AWS_ENDPOINT_URL_BEDROCK_RUNTIME pointing at
+it, so the server is measured without Bedrock cost or quota. --mock
+replaces LibreChat itself with tests/librechat-fake.py; that only tests
+this harness and says nothing about the capacity of the server:
+
+  tests/chat-load.py --base-url https://test-chat.domain.edu --mock-llm --users 10,25,50 --password ...
+  tests/chat-load.py --base-url https://our-chat.domain.edu --users 10,25 --password ...
+  tests/chat-load.py --mock --env-file .env.ochat --users 5,10,20 --duration 60
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import collections
+import importlib.util
+
+try:
+    import aiohttp
+except ImportError:
+    print('aiohttp missing, to install run:\n python3 -m pip install --upgrade aiohttp')
+    sys.exit(1)
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+NULL_UUID = '00000000-0000-0000-0000-000000000000'
+OPERATIONS = ['login', 'convos', 'message', 'ttfb', 'first_token', 'title']
+PROMPTS = [
+    'Summarize the main points of the attached abstract in three bullets.',
+    'Write a Python function that reads a CSV file and prints the column means.',
+    'What is the difference between a process and a thread?',
+    'Suggest a title for a grant proposal about coastal erosion.',
+    'Explain the bias-variance tradeoff to a first year student.',
+]
+
+
+def load_script(path, name):
+    """Import a script whose file name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+class StageStats:
+    """Latency samples in ms, HTTP status and rejection counts of one stage."""
+
+    def __init__(self):
+        self.samples = {op: [] for op in OPERATIONS}
+        self.statuses = collections.Counter()
+        self.rejected = collections.Counter()
+        self.errors = collections.Counter()
+        self.active = 0
+        self.peak_streams = 0
+
+    def record(self, op, seconds):
+        self.samples[op].append(seconds * 1000)
+
+    def status(self, op, status):
+        self.statuses[(op, status)] += 1
+        if status == 429:
+            self.rejected[op] += 1
+
+    def requests(self, op):
+        return sum(count for (name, _), count in self.statuses.items() if name == op)
+
+
+async def timed_json(session, method, url, stats, op, **kwargs):
+    """Send one request and record its latency. Returns (status, JSON body or None)."""
+    start = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = None
+            stats.record(op, time.perf_counter() - start)
+            stats.status(op, response.status)
+            return response.status, body
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        stats.errors[f"{op}: {type(e).__name__}"] += 1
+        return None, None
+
+
+async def send_message(session, url, headers, payload, stats):
+    """
+    Post a chat message and read the SSE stream to the end. Records the time
+    to the first event (LibreChat sends the created message right away), the
+    first token and the whole message. Returns the final event or None.
+    """
+    start = time.perf_counter()
+    stats.active += 1
+    stats.peak_streams = max(stats.peak_streams, stats.active)
+    try:
+        async with session.post(url, json=payload, headers=headers) as response:
+            stats.status('message', response.status)
+            if response.status != 200:
+                await response.read()
+                return None
+            first_event = first_token = final = None
+            async for line in response.content:
+                if not line.startswith(b'data:'):
+                    continue
+                now = time.perf_counter()
+                if first_event is None:
+                    first_event = now
+                    stats.record('ttfb', now - start)
+                try:
+                    data = json.loads(line[5:])
+                except ValueError:
+                    continue
+                if data.get('final'):
+                    final = data
+                elif first_token is None and not data.get('created'):
+                    first_token = now
+                    stats.record('first_token', now - start)
+            if final:
+                stats.record('message', time.perf_counter() - start)
+            else:
+                stats.errors['message: stream ended without final event'] += 1
+            return final
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        stats.errors[f"message: {type(e).__name__}"] += 1
+        return None
+    finally:
+        stats.active -= 1
+
+
+async def log_in(session, args, n, headers, stats):
+    status, body = await timed_json(session, 'POST', args.base_url + '/api/auth/login', stats, 'login',
+                                    json={'email': args.user_template.format(n=n), 'password': args.password},
+                                    headers=headers)
+    return body.get('token') if status == 200 and body else None
+
+
+async def virtual_user(session, args, n, tokens, stats, stop_at, rng):
+    """One simulated user: log in (once per run), load the conversation list, chat until stop_at."""
+    loop = asyncio.get_running_loop()
+    headers = {'X-Forwarded-For': f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}"} if args.spoof_ips else {}
+    if n not in tokens:
+        token = await log_in(session, args, n, headers, stats)
+        if not token:
+            return
+        tokens[n] = token
+    headers['Authorization'] = 'Bearer ' + tokens[n]
+    await timed_json(session, 'GET', args.base_url + '/api/convos?pageSize=25', stats, 'convos', headers=headers)
+
+    chat_url = args.base_url + args.chat_path
+    while loop.time() < stop_at:
+        conversation_id, parent_id = None, NULL_UUID
+        for turn in range(args.turns):
+            payload = {'text': rng.choice(PROMPTS), 'sender': 'User', 'isCreatedByUser': True,
+                       'messageId': str(uuid.uuid4()), 'parentMessageId': parent_id,
+                       'conversationId': conversation_id, 'endpoint': args.endpoint, 'model': args.model}
+            final = await send_message(session, chat_url, headers, payload, stats)
+            if final:
+                conversation_id = final['conversation']['conversationId']
+                parent_id = final['responseMessage']['messageId']
+                if turn == 0:
+                    await timed_json(session, 'GET', f"{args.base_url}/api/convos/gen_title/{conversation_id}",
+                                     stats, 'title', headers=headers)
+            think = rng.expovariate(1 / args.think_time) if args.think_time else 0
+            await asyncio.sleep(max(0.0, min(think, stop_at - loop.time())))
+            if loop.time() >= stop_at or not final:
+                break
+
+
+async def run_stage(session, args, users, tokens, rng):
+    """Ramp up to `users` virtual users and keep them chatting for args.duration seconds."""
+    stats = StageStats()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    stop_at = start + args.ramp + args.duration
+    tasks = []
+    for n in range(users):
+        tasks.append(asyncio.create_task(virtual_user(session, args, n, tokens, stats, stop_at, rng)))
+        if args.ramp and n < users - 1:
+            await asyncio.sleep(args.ramp / users)
+    await asyncio.gather(*tasks)
+    return stats, loop.time() - start
+
+
+def mock_llm_catalog(model_ids):
+    """Fake Bedrock catalog entries for the model IDs LibreChat sends, each invocable with any prefix."""
+    catalog = {}
+    for model_id in model_ids:
+        base_id = model_id
+        for prefix in ('us.', 'global.'):
+            if model_id.startswith(prefix):
+                base_id = model_id[len(prefix):]
+        catalog[base_id] = {'modelId': base_id, 'prefixes': ['', 'us.', 'global.'], 'outputModality': 'TEXT',
+                            'access': True}
+    return list(catalog.values())
+
+
+def start_mock_llm(args, settings):
+    """Serve the models of BEDROCK_AWS_MODELS and --model from tests/bedrock-fake.py in a thread."""
+    bedrock_fake = load_script(os.path.join(TESTS_DIR, 'bedrock-fake.py'), 'bedrock_fake')
+    model_ids = [args.model] + [m.strip() for m in settings.get('BEDROCK_AWS_MODELS', '').split(',') if m.strip()]
+    fake = bedrock_fake.FakeBedrock(mock_llm_catalog(model_ids), first_chunk_latency=args.mock_first_token / 1000,
+                                    chunk_delay=args.mock_chunk_delay / 1000, chunks=args.mock_chunks)
+    host, _, port = args.mock_llm_listen.rpartition(':')
+    server = bedrock_fake.start_server(fake, host or '0.0.0.0', int(port))
+    print(f"Fake Bedrock on {host or '0.0.0.0'}:{server.server_address[1]} serving {len(fake.catalog)} models. "
+          f"LibreChat must run with AWS_ENDPOINT_URL_BEDROCK_RUNTIME=http://<this host>:{server.server_address[1]}")
+    return fake, server
+
+
+def predicted_limits(limits, args, spoof_ips):
+    """Which .env limit caps the load first, assuming a message takes args.message_time seconds."""
+    notes = []
+    minutes_per_message = (args.think_time + args.message_time) / 60
+    if limits['ip_max'] and not spoof_ips:
+        per_minute = limits['ip_max'] / (limits['ip_window'] / 60)
+        notes.append(f"MESSAGE_IP_MAX={limits['ip_max']} per {limits['ip_window'] / 60:g} min: all virtual users share "
+                     f"one IP, so at most {per_minute:.0f} messages/min, about "
+                     f"{per_minute * minutes_per_message:.0f} users at {args.think_time:g}s think time")
+    if limits['login_max'] and not spoof_ips:
+        notes.append(f"LOGIN_MAX={limits['login_max']} per {limits['login_window'] / 60:g} min per IP: "
+                     f"only {limits['login_max']} virtual users can log in from this machine, "
+                     f"use --spoof-ips against the mock or a test instance with higher limits")
+    if limits['user_max']:
+        per_minute = limits['user_max'] / (limits['user_window'] / 60)
+        notes.append(f"MESSAGE_USER_MAX={limits['user_max']}: {per_minute:.0f} messages/min per user, "
+                     f"a user at {args.think_time:g}s think time sends {1 / minutes_per_message:.1f}")
+    if limits['concurrent_max']:
+        notes.append(f"CONCURRENT_MESSAGE_MAX={limits['concurrent_max']}: virtual users send one message at a "
+                     f"time and never hit it, browsers with several tabs can")
+    return notes
+
+
+def summarize(stats, users, wall, args):
+    """The stage results as a dict, with `ok` set if the stage met the service level."""
+    latencies = {}
+    for op in OPERATIONS:
+        values = sorted(stats.samples[op])
+        if values:
+            latencies[op] = {'count': len(values), 'p50': round(percentile(values, 50), 1),
+                             'p90': round(percentile(values, 90), 1), 'p95': round(percentile(values, 95), 1),
+                             'p99': round(percentile(values, 99), 1), 'max': round(values[-1], 1)}
+    messages = stats.requests('message')
+    rejection_rate = stats.rejected['message'] / messages if messages else 0
+    p95_first_token = latencies.get('first_token', {}).get('p95', 0) / 1000
+    completed = latencies.get('message', {}).get('count', 0)
+    # Users whose login was rejected never chatted, so the stage didn't run at its user count
+    ok = (completed > 0 and rejection_rate <= args.max_rejections and p95_first_token <= args.slo_first_token
+          and not stats.rejected['login'] and not stats.errors)
+    return {'users': users, 'seconds': round(wall, 1), 'messages': messages, 'completed': completed,
+            'messages_per_min': round(completed / wall * 60, 1) if wall else 0, 'peak_streams': stats.peak_streams,
+            'rejected': dict(stats.rejected), 'rejection_rate': round(rejection_rate, 4),
+            'errors': dict(stats.errors), 'latency_ms': latencies, 'ok': ok}
+
+
+def print_stage(result):
+    print(f"\n{result['users']} users, {result['seconds']}s: {result['completed']}/{result['messages']} messages "
+          f"completed ({result['messages_per_min']}/min), {result['peak_streams']} concurrent streams at peak, "
+          f"{'OK' if result['ok'] else 'NOT SUSTAINABLE'}")
+    if result['rejected']:
+        print('  429 rejections: ' + ', '.join(f"{op}={count}" for op, count in sorted(result['rejected'].items())) +
+              f" ({result['rejection_rate']:.1%} of messages)")
+    for error, count in sorted(result['errors'].items()):
+        print(f"  error: {error} x{count}")
+    print(f"  {'REQUEST':<12} {'COUNT':>7} {'P50 ms':>9} {'P90 ms':>9} {'P95 ms':>9} {'P99 ms':>9} {'MAX ms':>9}")
+    for op, latency in result['latency_ms'].items():
+        print(f"  {op:<12} {latency['count']:>7} {latency['p50']:>9.1f} {latency['p90']:>9.1f} "
+              f"{latency['p95']:>9.1f} {latency['p99']:>9.1f} {latency['max']:>9.1f}")
+
+
+async def run(args, limits, fake_module):
+    runner = fake = None
+    if fake_module:
+        fake = fake_module.FakeLibreChat(limits, args.chat_path, args.mock_first_token / 1000,
+                                         args.mock_chunk_delay / 1000, args.mock_chunks, args.mock_title / 1000)
+        runner, args.base_url = await fake_module.start_server(fake)
+        print(f"Fake LibreChat on {args.base_url}", file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    tokens = {}
+    results = []
+    connector = aiohttp.TCPConnector(limit=0, ssl=False if args.insecure else None)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            for users in args.users:
+                stats, wall = await run_stage(session, args, users, tokens, rng)
+                result = summarize(stats, users, wall, args)
+                results.append(result)
+                print_stage(result)
+                if not result['ok'] and not args.keep_going:
+                    break
+    finally:
+        if runner:
+            await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Synthetic LibreChat chat load in stages of virtual users, reporting latency, SSE time to '
+                    'first byte, rate-limit rejections and the largest sustainable user count')
+    parser.add_argument('--base-url', type=str, default='https://localhost', help='LibreChat URL (default: https://localhost)')
+    parser.add_argument('--env-file', type=str, default=os.path.join(REPO_DIR, '.env.ochat'),
+                        help='LibreChat .env with the rate limits (default: .env.ochat)')
+    parser.add_argument('--users', type=str, default='5,10,20,50',
+                        help='Comma-separated virtual user counts, one stage each (default: 5,10,20,50)')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds per stage after ramp up (default: 60)')
+    parser.add_argument('--ramp', type=float, default=10, help='Seconds to start all users of a stage (default: 10)')
+    parser.add_argument('--think-time', type=float, default=20,
+                        help='Mean seconds between a reply and the next message (default: 20)')
+    parser.add_argument('--turns', type=int, default=3, help='Messages per conversation (default: 3)')
+    parser.add_argument('--user-template', type=str, default='loadtest{n}@domain.edu',
+                        help='Login of virtual user n (default: loadtest{n}@domain.edu)')
+    parser.add_argument('--password', type=str, default='test-password', help='Password of the virtual users')
+    parser.add_argument('--chat-path', type=str, default='/api/agents/chat/bedrock',
+                        help='Chat route of the LibreChat version (default: /api/agents/chat/bedrock)')
+    parser.add_argument('--endpoint', type=str, default='bedrock', help='Endpoint sent with messages (default: bedrock)')
+    parser.add_argument('--model', type=str, default='us.anthropic.claude-3-5-haiku-20241022-v1:0',
+                        help='Model sent with messages')
+    parser.add_argument('--spoof-ips', action='store_true',
+                        help='Send a different X-Forwarded-For per virtual user, only honored by the mock '
+                             'or a server that trusts the header')
+    parser.add_argument('--slo-first-token', type=float, default=5,
+                        help='A stage is sustainable if the p95 time to first token stays below this many seconds '
+                             '(default: 5)')
+    parser.add_argument('--max-rejections', type=float, default=0.01,
+                        help='... and at most this fraction of messages is rejected with 429 (default: 0.01)')
+    parser.add_argument('--message-time', type=float, default=5,
+                        help='Expected seconds per reply for the rate-limit prediction (default: 5)')
+    parser.add_argument('--keep-going', action='store_true', help='Run all stages even after one failed')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds before a request is abandoned (default: 300)')
+    parser.add_argument('--insecure', action='store_true', help="Don't verify the TLS certificate")
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for prompts and think times')
+    parser.add_argument('--json', type=str, default='', help='Write the stage results to this JSON file')
+    parser.add_argument('--mock', action='store_true',
+                        help='Harness self-test against tests/librechat-fake.py started in-process instead of '
+                             'LibreChat, --base-url is ignored')
+    parser.add_argument('--mock-llm', action='store_true',
+                        help='Answer the LLM calls of the LibreChat at --base-url with tests/bedrock-fake.py, '
+                             'started in-process; LibreChat must use it via AWS_ENDPOINT_URL_BEDROCK_RUNTIME')
+    parser.add_argument('--mock-llm-listen', type=str, default='0.0.0.0:8777',
+                        help='Address of the fake Bedrock for --mock-llm (default: 0.0.0.0:8777)')
+    parser.add_argument('--mock-first-token', type=float, default=800,
+                        help='Mock time to first token in ms, also for --mock-llm (default: 800)')
+    parser.add_argument('--mock-chunk-delay', type=float, default=30, help='Mock delay between chunks in ms (default: 30)')
+    parser.add_argument('--mock-chunks', type=int, default=40, help='Mock chunks per reply (default: 40)')
+    parser.add_argument('--mock-title', type=float, default=600, help='Mock title generation time in ms (default: 600)')
+    args = parser.parse_args()
+    if args.mock and args.mock_llm:
+        parser.error('--mock replaces LibreChat and its LLM, use either --mock or --mock-llm')
+    args.base_url = args.base_url.rstrip('/')
+    args.users = [int(n) for n in args.users.split(',') if n.strip()]
+
+    fake_module = load_script(os.path.join(TESTS_DIR, 'librechat-fake.py'), 'librechat_fake')
+    settings = fake_module.read_env_file(args.env_file) if os.path.exists(args.env_file) else {}
+    limits = fake_module.rate_limits(settings)
+    print(f"Rate limits from {args.env_file if settings else 'LibreChat defaults'}:")
+    for note in predicted_limits(limits, args, args.spoof_ips):
+        print(f"  {note}")
+    mode = 'self-test' if args.mock else 'mock-llm' if args.mock_llm else 'live'
+    if args.mock:
+        print("Harness self-test: --mock replaces LibreChat with tests/librechat-fake.py, "
+              "the results are not a capacity figure for the server")
+    bedrock_fake = bedrock_server = None
+    if args.mock_llm:
+        bedrock_fake, bedrock_server = start_mock_llm(args, settings)
+
+    try:
+        results = asyncio.run(run(args, limits, fake_module if args.mock else None))
+    finally:
+        if bedrock_server:
+            bedrock_server.shutdown()
+
+    sustainable = [result['users'] for result in results if result['ok']]
+    if bedrock_fake:
+        print(f"\nFake Bedrock requests: {json.dumps(bedrock_fake.requests)}")
+        if not any(op in bedrock_fake.requests for op in ('ConverseStream', 'InvokeModelWithResponseStream')):
+            print("WARNING: LibreChat never called the fake Bedrock, check AWS_ENDPOINT_URL_BEDROCK_RUNTIME "
+                  "in its environment; the replies did not come from the fake")
+    if args.mock:
+        print(f"\nHarness self-test against the fake LibreChat: "
+              + (f"{max(sustainable)} virtual users sustained" if sustainable else "no stage was sustainable")
+              + ". This checks the load generator, it is not a capacity figure for the server.")
+    elif sustainable:
+        print(f"\nMax sustainable: {max(sustainable)} concurrent users "
+              f"(p95 first token <= {args.slo_first_token:g}s, <= {args.max_rejections:.0%} rejected)")
+    else:
+        print("\nNo stage was sustainable.")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'base_url': args.base_url, 'mode': mode, 'limits': limits, 'think_time': args.think_time,
+                       'stages': results, 'max_sustainable_users': max(sustainable) if sustainable else 0}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 
-import sys, os
+import sys, os, re, csv, json, time, queue, base64, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import ldap3
@@ -8,9 +9,24 @@ except ImportError:
     print('ldap3 missing, to install run:\n python3 -m pip install --upgrade ldap3')
     sys.exit(1)
 
-testuser = ''
-if len(sys.argv) > 1:
-    testuser = sys.argv[1]
+# Settings used with --mock when no .env file is given, matching the
+# Active Directory examples in .env.ochat and tests/ldap-fixture.ldif
+MOCK_ENV = {
+    'LDAP_URL': 'ldap://mock',
+    'LDAP_USER_SEARCH_BASE': 'OU=User Accounts,DC=domain,DC=edu',
+    'LDAP_BIND_DN': 'CN=myserviceaccount,OU=Service Accounts,OU=User Accounts,DC=domain,DC=edu',
+    'LDAP_BIND_CREDENTIALS': 'ad-password',
+    'LDAP_LOGIN_USES_USERNAME': 'true',
+    'LDAP_FULL_NAME': 'displayName',
+    'LDAP_SEARCH_FILTER': '(sAMAccountName={{username}})',
+}
+MOCK_PASSWORD = 'test-password'
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ldap-fixture.ldif')
+# Upper bounds in ms of the load test latency histogram
+LATENCY_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+STEPS = ['connect', 'service_bind', 'search', 'user_bind']
+# Active Directory's LDAP_MATCHING_RULE_IN_CHAIN, matches nested group membership
+IN_CHAIN_RULE = '1.2.840.113556.1.4.1941'
 
 def load_env_file(env_file_path):
     if not os.path.exists(env_file_path):
@@ -102,31 +118,599 @@ def eval_search_filter(conn, search_base, search_filter, username):
 
     return conn.entries
 
+def read_ldif(path):
+    """Yield (dn, {attribute: [values]}) for every record of an LDIF file."""
+    record, lines = {}, []
+
+    def parse(lines):
+        dn, attributes = None, {}
+        for line in lines:
+            key, sep, value = line.partition(':')
+            if not sep:
+                continue
+            if value.startswith(':'):
+                value = base64.b64decode(value[1:].strip()).decode()
+            else:
+                value = value.strip()
+            if key.lower() == 'dn':
+                dn = value
+            elif key.lower() != 'version':
+                attributes.setdefault(key, []).append(value)
+        return dn, attributes
+
+    with open(path) as f:
+        for raw in f:
+            raw = raw.rstrip('\n')
+            if raw.startswith('#'):
+                continue
+            if raw.startswith(' ') and lines:
+                lines[-1] += raw[1:]
+            elif raw.strip():
+                lines.append(raw)
+            elif lines:
+                dn, attributes = parse(lines)
+                if dn:
+                    yield dn, attributes
+                lines = []
+    if lines:
+        dn, attributes = parse(lines)
+        if dn:
+            yield dn, attributes
+
+
+def create_mock_server(ldif_path):
+    """An ldap3 server whose directory is loaded from an LDIF file, for MOCK_SYNC connections."""
+    server = ldap3.Server('mock')
+    loader = ldap3.Connection(server, client_strategy=ldap3.MOCK_SYNC)
+    for dn, attributes in read_ldif(ldif_path):
+        loader.strategy.add_entry(dn, attributes)
+    return server
+
+
+def new_connection(server, user=None, password=None, mock=False):
+    strategy = ldap3.MOCK_SYNC if mock else ldap3.SYNC
+    conn = ldap3.Connection(server, user=user, password=password, client_strategy=strategy)
+    conn.open()
+    return conn
+
+
+class ConnectionPool:
+    """
+    A fixed number of open connections shared by the load test threads,
+    like the connection reuse of LibreChat's LDAP client. Connections are
+    opened on first use and the time is recorded as the 'connect' step.
+    """
+
+    def __init__(self, server, size, mock=False, stats=None):
+        self.server = server
+        self.mock = mock
+        self.stats = stats
+        self.idle = queue.LifoQueue()
+        self.available = threading.Semaphore(size)
+
+    def get(self):
+        self.available.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            conn = new_connection(self.server, mock=self.mock)
+            if self.stats:
+                self.stats.record('connect', time.perf_counter() - start)
+            return conn
+
+    def put(self, conn):
+        self.idle.put(conn)
+        self.available.release()
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().unbind()
+
+
+class LatencyStats:
+    """Thread-safe latency samples per login step."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {step: [] for step in STEPS}
+        self.outcomes = {}
+
+    def record(self, step, seconds):
+        with self.lock:
+            self.samples[step].append(seconds * 1000)
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+def simulate_latency(mock_latency):
+    if mock_latency:
+        time.sleep(mock_latency / 1000)
+
+
+def login(username, password, service_pool, user_pool, bind_dn, bind_credentials, search_base, search_filter,
+          stats, mock_latency=0):
+    """
+    Replay LibreChat's LDAP login path: service bind, search for the user
+    with LDAP_SEARCH_FILTER, bind as the user. Returns the outcome.
+    """
+    conn = service_pool.get()
+    try:
+        start = time.perf_counter()
+        simulate_latency(mock_latency)
+        bound = conn.rebind(bind_dn, bind_credentials)
+        stats.record('service_bind', time.perf_counter() - start)
+        if not bound:
+            return 'service_bind_failed'
+
+        start = time.perf_counter()
+        simulate_latency(mock_latency)
+        conn.search(search_base, search_filter.replace('{{username}}', ldap3.utils.conv.escape_filter_chars(username)),
+                    attributes=[os.getenv('LDAP_FULL_NAME', 'displayName')], size_limit=2)
+        stats.record('search', time.perf_counter() - start)
+        if len(conn.entries) != 1:
+            return 'not_found' if not conn.entries else 'ambiguous'
+        user_dn = conn.entries[0].entry_dn
+    finally:
+        service_pool.put(conn)
+
+    conn = user_pool.get()
+    try:
+        start = time.perf_counter()
+        simulate_latency(mock_latency)
+        try:
+            bound = conn.rebind(user_dn, password)
+        except ldap3.core.exceptions.LDAPBindError:
+            bound = False
+        stats.record('user_bind', time.perf_counter() - start)
+        return 'ok' if bound else 'bad_password'
+    finally:
+        user_pool.put(conn)
+
+
+def read_users(path, default_password):
+    """Read 'username' or 'username:password' lines."""
+    users = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                username, sep, password = line.partition(':')
+                users.append((username, password if sep else default_password))
+    return users
+
+
+def fixture_users(ldif_path, password):
+    return [(attributes['sAMAccountName'][0], password) for dn, attributes in read_ldif(ldif_path)
+            if 'sAMAccountName' in attributes and dn != MOCK_ENV['LDAP_BIND_DN']]
+
+
+def run_load_test(server, users, concurrency, pool_size, repeat=1, mock=False, mock_latency=0):
+    """Log in every user `repeat` times with `concurrency` threads. Returns (stats, wall seconds)."""
+    stats = LatencyStats()
+    service_pool = ConnectionPool(server, pool_size, mock, stats)
+    user_pool = ConnectionPool(server, pool_size, mock, stats)
+    args = (service_pool, user_pool, os.getenv('LDAP_BIND_DN'), os.getenv('LDAP_BIND_CREDENTIALS'),
+            os.getenv('LDAP_USER_SEARCH_BASE'), os.getenv('LDAP_SEARCH_FILTER'), stats, mock_latency)
+
+    def one(user):
+        try:
+            stats.outcome(login(user[0], user[1], *args))
+        except ldap3.core.exceptions.LDAPException as e:
+            stats.outcome(type(e).__name__)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, users * repeat))
+    wall = time.perf_counter() - start
+    service_pool.close()
+    user_pool.close()
+    return stats, wall
+
+
+def print_load_report(stats, wall, concurrency, pool_size):
+    logins = sum(stats.outcomes.values())
+    print(f"{logins} logins in {wall:.2f}s with {concurrency} threads and {pool_size} pooled connections "
+          f"per pool: {logins / wall if wall else 0:.1f} logins/s")
+    print('Outcomes: ' + ', '.join(f"{name}={count}" for name, count in sorted(stats.outcomes.items())))
+    print(f"\n{'STEP':<14} {'COUNT':>7} {'P50 ms':>8} {'P90 ms':>8} {'P99 ms':>8} {'MAX ms':>8}")
+    for step in STEPS:
+        values = sorted(stats.samples[step])
+        if values:
+            print(f"{step:<14} {len(values):>7} {percentile(values, 50):>8.2f} {percentile(values, 90):>8.2f} "
+                  f"{percentile(values, 99):>8.2f} {values[-1]:>8.2f}")
+    for step in STEPS:
+        values = stats.samples[step]
+        if not values:
+            continue
+        print(f"\n{step} latency histogram:")
+        counts, lower = [], 0
+        for bound in LATENCY_BUCKETS + [float('inf')]:
+            counts.append((lower, bound, sum(1 for v in values if lower <= v < bound)))
+            lower = bound
+        largest = max(count for _, _, count in counts)
+        for lower, bound, count in counts:
+            if count:
+                label = f"{lower:g}-{bound:g} ms" if bound != float('inf') else f">= {lower:g} ms"
+                print(f"  {label:>16} {count:>7} {'#' * max(1, round(40 * count / largest))}")
+
+
+def normalize_dn(dn):
+    """Compare DNs case-insensitively and ignore spaces around separators."""
+    return re.sub(r'\s*([,=])\s*', r'\1', dn.strip()).lower()
+
+
+def unescape_filter_value(value):
+    return re.sub(r'\\([0-9a-fA-F]{2})', lambda m: chr(int(m.group(1), 16)), value)
+
+
+def parse_filter(text):
+    """
+    Parse an LDAP search filter into nested tuples:
+    ('&', [..]), ('|', [..]), ('!', f), ('=', attr, value), ('>=', ...),
+    ('<=', ...), ('~=', ...), ('present', attr), ('substring', attr, parts)
+    and ('extensible', attr, rule, value).
+    """
+    pos = 0
+
+    def parse():
+        nonlocal pos
+        if text[pos] != '(':
+            raise ValueError(f"expected '(' at {pos} in {text}")
+        pos += 1
+        if text[pos] in '&|':
+            op = text[pos]
+            pos += 1
+            children = []
+            while text[pos] == '(':
+                children.append(parse())
+            node = (op, children)
+        elif text[pos] == '!':
+            pos += 1
+            node = ('!', parse())
+        else:
+            end = pos
+            while text[end] != ')':
+                end += 1
+            item = text[pos:end]
+            pos = end
+            node = parse_item(item)
+        if text[pos] != ')':
+            raise ValueError(f"expected ')' at {pos} in {text}")
+        pos += 1
+        return node
+
+    def parse_item(item):
+        match = re.match(r'^([^=~<>:]+)(?::([^:=]+))?:=(.*)$', item)
+        if match:
+            return ('extensible', match.group(1).lower(), match.group(2), unescape_filter_value(match.group(3)))
+        for op in ('>=', '<=', '~='):
+            if op in item:
+                attr, value = item.split(op, 1)
+                return (op, attr.lower(), unescape_filter_value(value))
+        attr, value = item.split('=', 1)
+        if value == '*':
+            return ('present', attr.lower())
+        if '*' in value:
+            return ('substring', attr.lower(), [unescape_filter_value(part) for part in value.split('*')])
+        return ('=', attr.lower(), unescape_filter_value(value))
+
+    node = parse()
+    if pos != len(text):
+        raise ValueError(f"trailing characters in filter {text}")
+    return node
+
+
+def unsupported_filter_items(node):
+    """
+    The items of a parsed filter match_filter can't evaluate the way the
+    directory does: ordering (>=, <=) and approximate (~=) matches depend
+    on the attribute syntax, and extensible matches on the matching rule.
+    Only the in-chain rule on memberOf is supported.
+    """
+    kind = node[0]
+    if kind in '&|':
+        return [item for child in node[1] for item in unsupported_filter_items(child)]
+    if kind == '!':
+        return unsupported_filter_items(node[1])
+    if kind in ('>=', '<=', '~='):
+        return [f"({node[1]}{kind}{node[2]})"]
+    if kind == 'extensible' and not (node[1] == 'memberof' and node[2] == IN_CHAIN_RULE):
+        return [f"({node[1]}:{node[2] or ''}:={node[3]})"]
+    return []
+
+
+def match_filter(node, attributes, nested_groups=None, nested=False):
+    """
+    Evaluate a parsed filter against {lowercase attribute: [values]},
+    case-insensitively. Only equality, presence, substring and memberOf
+    (in-chain) items are supported, see unsupported_filter_items; this is
+    a what-if check, the directory's own answer comes from server_eligible.
+    nested_groups is the set of normalized DNs of all groups the entry is a
+    direct or nested member of, used by the in-chain matching rule, and
+    with nested=True by plain memberOf comparisons as well.
+    """
+    kind = node[0]
+    if kind == '&':
+        return all(match_filter(child, attributes, nested_groups, nested) for child in node[1])
+    if kind == '|':
+        return any(match_filter(child, attributes, nested_groups, nested) for child in node[1])
+    if kind == '!':
+        return not match_filter(node[1], attributes, nested_groups, nested)
+    attr = node[1]
+    values = attributes.get(attr, [])
+    if kind == 'present':
+        return bool(values)
+    if kind == 'substring':
+        pattern = '.*'.join(re.escape(part.lower()) for part in node[2])
+        return any(re.fullmatch(pattern, str(v).lower()) for v in values)
+    if kind == 'extensible' and attr == 'memberof' and node[2] == IN_CHAIN_RULE:
+        return normalize_dn(node[3]) in (nested_groups or set())
+    if kind != '=':
+        raise ValueError(f"can't evaluate {unsupported_filter_items(node)[0]} locally")
+    if attr == 'memberof':
+        groups = nested_groups if nested else {normalize_dn(v) for v in values}
+        return normalize_dn(node[2]) in groups
+    return any(str(v).lower() == node[2].lower() for v in values)
+
+
+def filter_attributes(node):
+    """All attribute names a parsed filter refers to."""
+    if node[0] in '&|':
+        return set().union(*[filter_attributes(child) for child in node[1]]) if node[1] else set()
+    if node[0] == '!':
+        return filter_attributes(node[1])
+    return {node[1]}
+
+
+class GroupCache:
+    """
+    Memoized expansion of nested groups: each group's own memberOf is
+    fetched once with a base search, and the transitive closure of a
+    group is computed once no matter how many users are in it.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.parents = {}
+        self.closures = {}
+        self.lookups = 0
+
+    def parents_of(self, group_dn):
+        key = normalize_dn(group_dn)
+        if key not in self.parents:
+            self.lookups += 1
+            self.conn.search(group_dn, '(objectClass=*)', search_scope=ldap3.BASE, attributes=['memberOf'])
+            parents = []
+            if self.conn.entries:
+                parents = [str(dn) for dn in self.conn.entries[0]['memberOf'].values] \
+                    if 'memberOf' in self.conn.entries[0] else []
+            self.parents[key] = parents
+        return self.parents[key]
+
+    def expand(self, group_dn):
+        """The normalized DNs of group_dn and every group it is nested in."""
+        key = normalize_dn(group_dn)
+        if key in self.closures:
+            return self.closures[key]
+        closure, stack = set(), [group_dn]
+        while stack:
+            dn = stack.pop()
+            dn_key = normalize_dn(dn)
+            if dn_key in closure:
+                continue
+            closure.add(dn_key)
+            if dn_key in self.closures:
+                closure |= self.closures[dn_key]
+                continue
+            stack.extend(self.parents_of(dn))
+        self.closures[key] = closure
+        return closure
+
+
+def username_attribute(search_filter):
+    """The attribute LDAP_SEARCH_FILTER compares with {{username}}, e.g. sAMAccountName."""
+    match = re.search(r'\(([^()=]+)=\{\{username\}\}\)', search_filter)
+    return match.group(1) if match else 'sAMAccountName'
+
+
+def server_eligible(conn, search_base, search_filter, user_filter, page_size):
+    """
+    Normalized DNs of the users the directory itself matches with
+    LDAP_SEARCH_FILTER, from one paged search for (&user_filter filter)
+    in which (attr={{username}}) becomes the presence test (attr=*): an
+    entry passes that exactly when it passes with its own username.
+    """
+    server_filter = re.sub(r'=\{\{username\}\}\)', '=*)', search_filter)
+    if '{{username}}' in server_filter:
+        raise ValueError(f"{{{{username}}}} is only supported as a whole value in LDAP_SEARCH_FILTER: {search_filter}")
+    dns = set()
+    for entry in conn.extend.standard.paged_search(search_base, f"(&{user_filter}{server_filter})",
+                                                   attributes=ldap3.NO_ATTRIBUTES, paged_size=page_size,
+                                                   generator=True):
+        if entry.get('type') == 'searchResEntry':
+            dns.add(normalize_dn(entry['dn']))
+    return dns
+
+
+def bulk_check(search_conn, group_conn, search_base, search_filter, user_filter, page_size, writer):
+    """
+    Stream every user below search_base with paged searches. `eligible`
+    is the directory's own evaluation of LDAP_SEARCH_FILTER (see
+    server_eligible). `eligible_nested` evaluates the filter locally with
+    memberOf including nested groups, resolved through a GroupCache; it is
+    None if the filter has items match_filter can't evaluate faithfully.
+    Each result is handed to writer(row) right away, so memory is bounded
+    by the page size, the number of groups and the eligible DNs. Returns
+    (users, eligible, eligible_nested, mismatches, cache), where mismatches
+    counts users the local evaluation without nesting disagrees on.
+    """
+    user_attr = username_attribute(search_filter)
+    template = search_filter.replace('{{username}}', '\x00')
+    parsed = parse_filter(template.replace('\x00', 'x'))
+    local = not unsupported_filter_items(parsed)
+    attributes = list(filter_attributes(parsed) | {user_attr.lower(), 'memberof'})
+    eligible_dns = server_eligible(search_conn, search_base, search_filter, user_filter, page_size)
+    cache = GroupCache(group_conn)
+    users = eligible = eligible_nested = mismatches = 0
+
+    for entry in search_conn.extend.standard.paged_search(search_base, user_filter, attributes=attributes,
+                                                          paged_size=page_size, generator=True):
+        if entry.get('type') != 'searchResEntry':
+            continue
+        values = {k.lower(): v if isinstance(v, list) else [v] for k, v in entry['attributes'].items()}
+        usernames = values.get(user_attr.lower())
+        if not usernames:
+            continue
+        username = str(usernames[0])
+        direct = [str(g) for g in values.get('memberof', [])]
+        nested = set()
+        for group in direct:
+            nested |= cache.expand(group)
+        passes = normalize_dn(entry['dn']) in eligible_dns
+        passes_nested = None
+        if local:
+            node = parse_filter(template.replace('\x00', ldap3.utils.conv.escape_filter_chars(username)))
+            passes_nested = match_filter(node, values, nested, nested=True)
+            mismatches += match_filter(node, values, nested) != passes
+            eligible_nested += passes_nested
+        users += 1
+        eligible += passes
+        writer({'username': username, 'dn': entry['dn'], 'eligible': passes, 'eligible_nested': passes_nested,
+                'groups': len(direct), 'nested_groups': len(nested)})
+    return users, eligible, eligible_nested, mismatches, cache
+
+
+def open_result_writer(path, fmt):
+    """A writer(row) for CSV or JSON lines output, and the file to close afterwards."""
+    f = open(path, 'w', newline='') if path else sys.stdout
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=['username', 'dn', 'eligible', 'eligible_nested', 'groups',
+                                               'nested_groups'])
+        writer.writeheader()
+        return writer.writerow, f
+    return lambda row: f.write(json.dumps(row) + '\n'), f
+
+
 if __name__ == "__main__":
-    env_file_path = os.path.expanduser('~/.env')
-    if len(sys.argv) == 3:
-        env_file_path = sys.argv[2]
-    if not os.path.isfile(env_file_path):
-        if len(sys.argv) != 3:
-            print(f"{env_file_path} not found. Usage: python script.py <testuser> </folder/.env>")
-            sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description='Test the LDAP settings of a LibreChat .env file, or load test the LDAP login path')
+    parser.add_argument('testuser', nargs='?', default='', help='Username to evaluate LDAP_SEARCH_FILTER for')
+    parser.add_argument('env_file', nargs='?', default='', help='Path to the .env file (default: ~/.env)')
+    parser.add_argument('--load-test', action='store_true',
+                        help='Replay logins (service bind, filter search, user bind) concurrently and report '
+                             'latency per step and throughput')
+    parser.add_argument('--users', type=str, default='',
+                        help="File with one 'username' or 'username:password' per line for --load-test "
+                             "(default with --mock: all users of the fixture)")
+    parser.add_argument('--password', type=str, default=MOCK_PASSWORD,
+                        help='Password for users listed without one (default: the fixture password)')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent logins (default: 50)')
+    parser.add_argument('--pool-size', type=int, default=10,
+                        help='Open connections per pool, one pool for service and one for user binds (default: 10)')
+    parser.add_argument('--repeat', type=int, default=20, help='Times every user logs in (default: 20)')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Evaluate LDAP_SEARCH_FILTER for every user below LDAP_USER_SEARCH_BASE')
+    parser.add_argument('--user-filter', type=str, default='(&(objectClass=user)(!(objectClass=computer)))',
+                        help='Filter selecting the users for --bulk (default: all AD user objects)')
+    parser.add_argument('--page-size', type=int, default=500, help='Paged search page size for --bulk (default: 500)')
+    parser.add_argument('--output', type=str, default='', help='Write the --bulk results to this file (default: stdout)')
+    parser.add_argument('--output-format', choices=['csv', 'json'], default='',
+                        help='--bulk result format (default: json, or csv for a .csv --output)')
+    parser.add_argument('--mock', nargs='?', const=DEFAULT_FIXTURE, default='', metavar='LDIF',
+                        help='Run against an in-memory ldap3 MOCK_SYNC directory loaded from this LDIF file '
+                             '(default: tests/ldap-fixture.ldif) instead of LDAP_URL')
+    parser.add_argument('--mock-latency', type=float, default=0,
+                        help='Milliseconds added to every mock LDAP operation to emulate a network (default: 0)')
+    args = parser.parse_args()
+    testuser = args.testuser
 
-    if not env_file_path.endswith('.env'):
-        env_file_path = os.path.join(env_file_path, '.env')
+    env_file_path = args.env_file or os.path.expanduser('~/.env')
+    if args.mock and not args.env_file and not os.path.isfile(env_file_path):
+        os.environ.update(MOCK_ENV)
+    else:
+        if not os.path.isfile(env_file_path):
+            if not args.env_file:
+                print(f"{env_file_path} not found. Usage: python script.py <testuser> </folder/.env>")
+                sys.exit(1)
 
-    load_env_file(env_file_path)
+        if not env_file_path.endswith('.env'):
+            env_file_path = os.path.join(env_file_path, '.env')
 
-    ldap_url = os.getenv('LDAP_URL')
-    server, port, use_ssl = parse_ldap_url(ldap_url)
+        load_env_file(env_file_path)
+
+    if args.mock:
+        server = create_mock_server(args.mock)
+    else:
+        ldap_url = os.getenv('LDAP_URL')
+        server, port, use_ssl = parse_ldap_url(ldap_url)
 
-    server = ldap3.Server(server, port=port, use_ssl=use_ssl, get_info=ldap3.ALL)
+        server = ldap3.Server(server, port=port, use_ssl=use_ssl, get_info=ldap3.ALL)
 
     bind_dn = os.getenv('LDAP_BIND_DN')
     bind_credentials = os.getenv('LDAP_BIND_CREDENTIALS')
     search_base = os.getenv('LDAP_USER_SEARCH_BASE')
     search_filter = os.getenv('LDAP_SEARCH_FILTER')
 
-    conn = ldap_authn(server, bind_dn, bind_credentials)
+    if args.load_test:
+        if args.users:
+            users = read_users(args.users, args.password)
+        elif args.mock:
+            users = fixture_users(args.mock, args.password)
+        else:
+            print('--load-test needs a list of users, use --users <file>')
+            sys.exit(1)
+        stats, wall = run_load_test(server, users, args.concurrency, args.pool_size, args.repeat,
+                                    mock=bool(args.mock), mock_latency=args.mock_latency)
+        print_load_report(stats, wall, args.concurrency, args.pool_size)
+        sys.exit(0)
+
+    if args.bulk:
+        # Group lookups use their own connection so they don't disturb the paged search
+        connections = []
+        for _ in range(2):
+            if args.mock:
+                conn = new_connection(server, bind_dn, bind_credentials, mock=True)
+                conn = conn if conn.bind() else None
+            else:
+                conn = ldap_authn(server, bind_dn, bind_credentials)
+            if not conn:
+                sys.exit(1)
+            connections.append(conn)
+        fmt = args.output_format or ('csv' if args.output.endswith('.csv') else 'json')
+        writer, output = open_result_writer(args.output, fmt)
+        start = time.perf_counter()
+        unsupported = unsupported_filter_items(parse_filter(search_filter.replace('{{username}}', 'x')))
+        users, eligible, eligible_nested, mismatches, cache = bulk_check(
+            connections[0], connections[1], search_base, search_filter, args.user_filter, args.page_size, writer)
+        if output is not sys.stdout:
+            output.close()
+        print(f"{users} users checked in {time.perf_counter() - start:.1f}s, {len(cache.parents)} groups "
+              f"looked up once each", file=sys.stderr)
+        print(f"{eligible} users pass LDAP_SEARCH_FILTER (evaluated by the directory)", file=sys.stderr)
+        if unsupported:
+            print(f"eligible_nested left empty, the local evaluation can't match {', '.join(unsupported)} "
+                  f"like the directory does", file=sys.stderr)
+        else:
+            print(f"{eligible_nested} would pass with nested group membership (local evaluation)", file=sys.stderr)
+        if mismatches:
+            print(f"WARNING: the local evaluation disagrees with the directory for {mismatches} users, "
+                  f"eligible_nested may be off as well", file=sys.stderr)
+        sys.exit(0)
+
+    if args.mock:
+        conn = new_connection(server, bind_dn, bind_credentials, mock=True)
+        conn = conn if conn.bind() else None
+    else:
+        conn = ldap_authn(server, bind_dn, bind_credentials)
     if not conn:
         sys.exit(1)
 
@@ -0,0 +1,261 @@
+#! /usr/bin/env python3
+
+"""
+Offline stand-in for the parts of the LibreChat API a chat session uses:
+login, the conversation list, a streamed (SSE) chat message and title
+generation. Replies come from a fake LLM with configurable time to first
+token and streaming speed, and the rate limits of a LibreChat .env
+(LOGIN_MAX, CONCURRENT_MESSAGE_MAX, MESSAGE_IP_MAX, MESSAGE_USER_MAX, ...)
+are enforced with 429 responses like LibreChat does:
+
+  tests/librechat-fake.py --port 3080 --env-file .env.ochat &
+  tests/chat-load.py --base-url http://127.0.0.1:3080 --users 10,50
+"""
+
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import collections
+
+try:
+    from aiohttp import web
+except ImportError:
+    print('aiohttp missing, to install run:\n python3 -m pip install --upgrade aiohttp')
+    sys.exit(1)
+
+DEFAULT_CHAT_PATH = '/api/agents/chat/bedrock'
+# LibreChat's defaults for limits that are not set in the .env file
+DEFAULT_LIMITS = {
+    'LOGIN_MAX': '7', 'LOGIN_WINDOW': '5',
+    'LIMIT_CONCURRENT_MESSAGES': 'true', 'CONCURRENT_MESSAGE_MAX': '2',
+    'LIMIT_MESSAGE_IP': 'true', 'MESSAGE_IP_MAX': '40', 'MESSAGE_IP_WINDOW': '1',
+    'LIMIT_MESSAGE_USER': 'false', 'MESSAGE_USER_MAX': '40', 'MESSAGE_USER_WINDOW': '1',
+}
+WORDS = ('the model streams a plausible answer about research computing storage budgets and '
+         'deadlines while the load test measures how long everything takes').split()
+
+
+def read_env_file(path):
+    """Return the active KEY=value settings of a .env file as a dict."""
+    settings = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                settings[key.strip()] = value.strip().strip('"\'')
+    return settings
+
+
+def rate_limits(settings):
+    """The LibreChat rate limits of a .env dict, with LibreChat's defaults for missing ones."""
+    merged = dict(DEFAULT_LIMITS, **{k: v for k, v in settings.items() if k in DEFAULT_LIMITS})
+    enabled = lambda key: merged[key].lower() == 'true'
+    return {
+        'login_max': int(merged['LOGIN_MAX']), 'login_window': float(merged['LOGIN_WINDOW']) * 60,
+        'concurrent_max': int(merged['CONCURRENT_MESSAGE_MAX']) if enabled('LIMIT_CONCURRENT_MESSAGES') else 0,
+        'ip_max': int(merged['MESSAGE_IP_MAX']) if enabled('LIMIT_MESSAGE_IP') else 0,
+        'ip_window': float(merged['MESSAGE_IP_WINDOW']) * 60,
+        'user_max': int(merged['MESSAGE_USER_MAX']) if enabled('LIMIT_MESSAGE_USER') else 0,
+        'user_window': float(merged['MESSAGE_USER_WINDOW']) * 60,
+    }
+
+
+class SlidingWindow:
+    """Counts events per key within the last `window` seconds."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.events = collections.defaultdict(collections.deque)
+
+    def allow(self, key):
+        if not self.limit:
+            return True
+        now = time.monotonic()
+        events = self.events[key]
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if len(events) >= self.limit:
+            return False
+        events.append(now)
+        return True
+
+
+class FakeLibreChat:
+    """
+    The fake LibreChat server state. `requests` counts requests per route
+    and `rejected` the 429 responses per limit, for the load test report.
+    """
+
+    def __init__(self, limits, chat_path=DEFAULT_CHAT_PATH, first_token_latency=0.8, chunk_delay=0.03, chunks=40,
+                 title_latency=0.6, login_latency=0.05, jitter=0.2, seed=42):
+        self.limits = limits
+        self.chat_path = chat_path
+        self.first_token_latency = first_token_latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.title_latency = title_latency
+        self.login_latency = login_latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.logins = SlidingWindow(limits['login_max'], limits['login_window'])
+        self.ip_messages = SlidingWindow(limits['ip_max'], limits['ip_window'])
+        self.user_messages = SlidingWindow(limits['user_max'], limits['user_window'])
+        self.active = collections.Counter()
+        self.tokens = {}
+        self.conversations = collections.defaultdict(dict)
+        self.requests = collections.Counter()
+        self.rejected = collections.Counter()
+
+    def delay(self, seconds):
+        return asyncio.sleep(max(0.0, seconds * (1 + self.random.uniform(-self.jitter, self.jitter))))
+
+    @staticmethod
+    def client_ip(request):
+        forwarded = request.headers.get('X-Forwarded-For')
+        return forwarded.split(',')[0].strip() if forwarded else request.remote
+
+    def reject(self, kind, message):
+        self.rejected[kind] += 1
+        return web.json_response({'type': kind, 'message': message}, status=429)
+
+    def user_of(self, request):
+        header = request.headers.get('Authorization', '')
+        return self.tokens.get(header[7:]) if header.startswith('Bearer ') else None
+
+    async def login(self, request):
+        self.requests['login'] += 1
+        if not self.logins.allow(self.client_ip(request)):
+            return self.reject('logins', 'Too many login attempts, please try again later.')
+        body = await request.json()
+        if not body.get('email') or not body.get('password'):
+            return web.json_response({'message': 'Missing credentials'}, status=400)
+        await self.delay(self.login_latency)
+        token = uuid.uuid4().hex
+        self.tokens[token] = body['email']
+        return web.json_response({'token': token, 'user': {'id': body['email'], 'username': body['email']}})
+
+    async def conversations_list(self, request):
+        self.requests['convos'] += 1
+        user = self.user_of(request)
+        if not user:
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        convos = list(self.conversations[user].values())[-25:]
+        return web.json_response({'conversations': convos, 'nextCursor': None})
+
+    async def chat(self, request):
+        self.requests['message'] += 1
+        user = self.user_of(request)
+        if not user:
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        if self.limits['concurrent_max'] and self.active[user] >= self.limits['concurrent_max']:
+            return self.reject('concurrent', f"Only {self.limits['concurrent_max']} messages at a time. "
+                                             f"Please allow any other responses to complete before sending another message.")
+        if not self.ip_messages.allow(self.client_ip(request)):
+            return self.reject('message_limit', 'Too many messages from this IP, please try again later.')
+        if not self.user_messages.allow(user):
+            return self.reject('message_limit', 'Too many messages, please try again later.')
+
+        body = await request.json()
+        conversation_id = body.get('conversationId') or str(uuid.uuid4())
+        request_message = {'messageId': body.get('messageId') or str(uuid.uuid4()), 'text': body.get('text', ''),
+                           'parentMessageId': body.get('parentMessageId'), 'conversationId': conversation_id,
+                           'isCreatedByUser': True}
+        response_id = str(uuid.uuid4())
+
+        self.active[user] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        try:
+            await response.prepare(request)
+            await response.write(b'event: message\ndata: ' +
+                                 json.dumps({'created': True, 'message': request_message}).encode() + b'\n\n')
+            await self.delay(self.first_token_latency)
+            text = []
+            for i in range(self.chunks):
+                if i:
+                    await self.delay(self.chunk_delay)
+                word = self.random.choice(WORDS)
+                text.append(word)
+                await response.write(b'event: message\ndata: ' + json.dumps(
+                    {'event': 'on_message_delta', 'data': {'id': response_id, 'delta': {'content': [
+                        {'type': 'text', 'text': word + ' '}]}}}).encode() + b'\n\n')
+            conversation = self.conversations[user].setdefault(
+                conversation_id, {'conversationId': conversation_id, 'title': 'New Chat', 'endpoint': 'bedrock'})
+            conversation['updatedAt'] = time.time()
+            final = {'final': True, 'conversation': conversation, 'title': conversation['title'],
+                     'requestMessage': request_message,
+                     'responseMessage': {'messageId': response_id, 'conversationId': conversation_id,
+                                         'parentMessageId': request_message['messageId'], 'text': ' '.join(text)}}
+            await response.write(b'event: message\ndata: ' + json.dumps(final).encode() + b'\n\n')
+            await response.write_eof()
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.active[user] -= 1
+        return response
+
+    async def gen_title(self, request):
+        self.requests['title'] += 1
+        user = self.user_of(request)
+        if not user:
+            return web.json_response({'message': 'Unauthorized'}, status=401)
+        if request.method == 'POST':
+            conversation_id = (await request.json()).get('conversationId')
+        else:
+            conversation_id = request.match_info['conversation_id']
+        conversation = self.conversations[user].get(conversation_id)
+        if not conversation:
+            return web.json_response({'message': 'Title not found'}, status=404)
+        await self.delay(self.title_latency)
+        conversation['title'] = ' '.join(self.random.choice(WORDS) for _ in range(4)).title()
+        return web.json_response({'title': conversation['title']})
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.post('/api/auth/login', self.login),
+            web.get('/api/convos', self.conversations_list),
+            web.post(self.chat_path, self.chat),
+            web.post('/api/convos/gen_title', self.gen_title),
+            web.get('/api/convos/gen_title/{conversation_id}', self.gen_title),
+        ])
+        return app
+
+
+async def start_server(fake, host='127.0.0.1', port=0):
+    """Start the fake in the running event loop. Returns (runner, base URL)."""
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline stand-in for the LibreChat chat API with a fake LLM')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3080)
+    parser.add_argument('--env-file', default='', help='LibreChat .env whose rate limits are enforced '
+                                                       '(default: the LibreChat defaults)')
+    parser.add_argument('--chat-path', default=DEFAULT_CHAT_PATH, help=f'Chat route (default: {DEFAULT_CHAT_PATH})')
+    parser.add_argument('--first-token-latency', type=float, default=800, help='Time to first token in ms (default: 800)')
+    parser.add_argument('--chunk-delay', type=float, default=30, help='Delay between streamed chunks in ms (default: 30)')
+    parser.add_argument('--chunks', type=int, default=40, help='Chunks per reply (default: 40)')
+    parser.add_argument('--title-latency', type=float, default=600, help='Title generation time in ms (default: 600)')
+    args = parser.parse_args()
+
+    limits = rate_limits(read_env_file(args.env_file) if args.env_file else {})
+    fake = FakeLibreChat(limits, args.chat_path, args.first_token_latency / 1000, args.chunk_delay / 1000,
+                         args.chunks, args.title_latency / 1000)
+    print(f"Fake LibreChat on http://{args.host}:{args.port} with limits {limits}", file=sys.stderr)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#! /usr/bin/env python3
+
+import os, re, sys, csv, argparse, datetime
+try:
+    import pymongo
+    from bson import ObjectId
+except:
+    print('pymongo missing, to install run:\n python3 -m pip install --upgrade pymongo')
+    sys.exit(1)
+
+from purge_old_messages import add_connection_arguments, connect, read_env_file
+
+"""
+ # Token and cost usage per user, model and day for chargeback, rolled up
+ # from LibreChat's transactions collection into a small collection that
+ # survives the purge of the raw data. Each run only reads the
+ # transactions added since the stored watermark.
+"""
+
+ROLLUP_COLLECTION='usagerollups'
+WATERMARK_COLLECTION='usagewatermarks'
+# LibreChat stores token costs in credits, 1,000,000 credits are 1 USD
+CREDITS_PER_USD=1000000
+# Transactions newer than this are left for the next run, so documents
+# still being inserted with a slightly older _id are never skipped
+SETTLE_SECONDS=60
+REGION_PREFIX=re.compile(r'^(us|eu|apac|global|us-gov|ca|jp|au)\.')
+FIELDS=['day', 'user', 'email', 'model', 'token_type', 'tokens', 'cost_usd', 'transactions']
+
+
+def base_model_id(model_id):
+    """The model ID without a cross-region inference profile prefix."""
+    return REGION_PREFIX.sub('', model_id or '')
+
+
+def model_matcher(configured):
+    """Return a function mapping a transaction's model to its ID in BEDROCK_AWS_MODELS (or itself)."""
+    by_base = {base_model_id(model_id): model_id for model_id in configured}
+
+    def match(model):
+        return by_base.get(base_model_id(model), model or 'unknown')
+    return match
+
+
+def get_watermark(db):
+    doc = db[WATERMARK_COLLECTION].find_one({'_id': 'transactions'})
+    return doc['last_id'] if doc else None
+
+
+def set_watermark(db, last_id, processed):
+    db[WATERMARK_COLLECTION].update_one(
+        {'_id': 'transactions'},
+        {'$set': {'last_id': last_id, 'updated': datetime.datetime.now(datetime.timezone.utc)},
+         '$inc': {'processed': processed}},
+        upsert=True)
+
+
+def apply_chunk(rollup, chunk):
+    """
+    Add the transactions of one chunk, {key: [(_id, tokens, credits), ...]},
+    to the rollup. Every row remembers the last transaction _id it counted
+    and older transactions are skipped, so re-reading transactions after a
+    crash between the rollup update and the watermark doesn't count them twice.
+    """
+    days = list({key[0] for key in chunk})
+    counted = {}
+    for row in rollup.find({'day': {'$in': days}}, {'day': 1, 'user': 1, 'model': 1, 'token_type': 1, 'last_id': 1}):
+        counted[(row['day'], row['user'], row['model'], row['token_type'])] = row.get('last_id')
+
+    requests = []
+    for key, transactions in chunk.items():
+        last_counted = counted.get(key)
+        new = [t for t in transactions if last_counted is None or t[0] > last_counted]
+        if not new:
+            continue
+        day, user, model, token_type = key
+        requests.append(pymongo.UpdateOne(
+            {'day': day, 'user': user, 'model': model, 'token_type': token_type},
+            {'$inc': {'tokens': sum(t[1] for t in new), 'credits': sum(t[2] for t in new), 'transactions': len(new)},
+             '$set': {'last_id': max(t[0] for t in new)}},
+            upsert=True))
+    if requests:
+        rollup.bulk_write(requests, ordered=False)
+
+
+def update_rollup(db, match_model, chunk_size=10000, verbose=True):
+    """
+    Read the transactions after the watermark in _id order and add their
+    tokens and cost to the rollup per day, user, model and token type.
+    The watermark moves forward after every chunk. Returns the number of
+    transactions read.
+    """
+    rollup = db[ROLLUP_COLLECTION]
+    rollup.create_index([('day', 1), ('user', 1), ('model', 1), ('token_type', 1)], unique=True)
+    last_id = get_watermark(db)
+    upper = ObjectId.from_datetime(datetime.datetime.now(datetime.timezone.utc) -
+                                   datetime.timedelta(seconds=SETTLE_SECONDS))
+    query = {'_id': {'$gt': last_id, '$lte': upper} if last_id else {'$lte': upper}}
+    projection = {'user': 1, 'model': 1, 'tokenType': 1, 'rawAmount': 1, 'tokenValue': 1, 'createdAt': 1}
+
+    processed, read, chunk = 0, 0, {}
+    for doc in db['transactions'].find(query, projection).sort('_id', 1):
+        last_id = doc['_id']
+        read += 1
+        # Balance top-ups and refills are not usage
+        if doc.get('tokenType') in ('prompt', 'completion'):
+            created = doc.get('createdAt') or doc['_id'].generation_time
+            key = (created.strftime('%Y-%m-%d'), str(doc.get('user')), match_model(doc.get('model')), doc['tokenType'])
+            chunk.setdefault(key, []).append(
+                (doc['_id'], abs(doc.get('rawAmount') or 0), abs(doc.get('tokenValue') or 0)))
+        if read >= chunk_size:
+            apply_chunk(rollup, chunk)
+            set_watermark(db, last_id, read)
+            processed += read
+            if verbose:
+                print(f"transactions: {processed} rolled up", flush=True)
+            read, chunk = 0, {}
+    if read:
+        apply_chunk(rollup, chunk)
+        set_watermark(db, last_id, read)
+        processed += read
+    return processed
+
+
+def read_rollup(db, since='', until='', user_emails=True):
+    """The rollup rows between the days since and until (inclusive) as dicts with FIELDS."""
+    query = {}
+    if since or until:
+        query['day'] = {}
+        if since:
+            query['day']['$gte'] = since
+        if until:
+            query['day']['$lte'] = until
+    rows = list(db[ROLLUP_COLLECTION].find(query, {'_id': 0}).sort([('day', 1), ('user', 1), ('model', 1)]))
+
+    emails = {}
+    if user_emails and rows:
+        ids = [ObjectId(row['user']) for row in rows if ObjectId.is_valid(row['user'])]
+        for user in db['users'].find({'_id': {'$in': list(set(ids))}}, {'email': 1}):
+            emails[str(user['_id'])] = user.get('email', '')
+    for row in rows:
+        row['email'] = emails.get(row['user'], '')
+        row['cost_usd'] = round(row.get('credits', 0) / CREDITS_PER_USD, 6)
+    return [{field: row.get(field) for field in FIELDS} for row in rows]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_parquet(path, rows):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except:
+        print('pyarrow missing, to install run:\n python3 -m pip install --upgrade pyarrow')
+        sys.exit(1)
+    table = pyarrow.Table.from_pylist(rows, schema=pyarrow.schema([
+        ('day', pyarrow.string()), ('user', pyarrow.string()), ('email', pyarrow.string()),
+        ('model', pyarrow.string()), ('token_type', pyarrow.string()), ('tokens', pyarrow.int64()),
+        ('cost_usd', pyarrow.float64()), ('transactions', pyarrow.int64())]))
+    pyarrow.parquet.write_table(table, path)
+
+
+def print_summary(rows, by):
+    totals = {}
+    for row in rows:
+        key = (row['email'] or row['user']) if by == 'user' else row[by]
+        tokens, cost = totals.get(key, (0, 0.0))
+        totals[key] = (tokens + row['tokens'], cost + row['cost_usd'])
+    width = max([len(by)] + [len(str(key)) for key in totals]) + 2
+    print(f"{by.upper():<{width}} {'TOKENS':>14} {'COST USD':>12}")
+    for key, (tokens, cost) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print(f"{str(key):<{width}} {tokens:>14} {cost:>12.2f}")
+    print(f"{'TOTAL':<{width}} {sum(t for t, _ in totals.values()):>14} {sum(c for _, c in totals.values()):>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Roll up LibreChat token usage and cost per user, model and day from the transactions '
+                    'collection, incrementally, and report or export it')
+    add_connection_arguments(parser)
+    parser.add_argument('--env-file', type=str, default=os.path.expanduser('~/LibreChat/.env'),
+                        help='LibreChat .env with BEDROCK_AWS_MODELS, used to match model IDs '
+                             '(default: ~/LibreChat/.env)')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='Transactions per rollup update and watermark step (default: 10000)')
+    parser.add_argument('--no-update', action='store_true', help='Only report from the existing rollup')
+    parser.add_argument('--since', type=str, default='', help='First day to report, YYYY-MM-DD')
+    parser.add_argument('--until', type=str, default='', help='Last day to report, YYYY-MM-DD')
+    parser.add_argument('--by', choices=['user', 'model', 'day'], default='user',
+                        help='Summary printed to the terminal (default: user)')
+    parser.add_argument('--csv', type=str, default='', help='Export the daily rollup rows to this CSV file')
+    parser.add_argument('--parquet', type=str, default='',
+                        help='Export the daily rollup rows to this Parquet file (needs pyarrow)')
+    parser.add_argument('-q', '--quiet', action='store_true', help="Don't print progress")
+    args = parser.parse_args()
+
+    db = connect(args)
+    if not args.no_update:
+        configured = [m.strip() for m in read_env_file(args.env_file).get('BEDROCK_AWS_MODELS', '').split(',')
+                      if m.strip()]
+        processed = update_rollup(db, model_matcher(configured), args.chunk_size, verbose=not args.quiet)
+        if not args.quiet:
+            print(f"Rolled up {processed} new transactions.", file=sys.stderr)
+
+    rows = read_rollup(db, args.since, args.until)
+    if args.csv:
+        write_csv(args.csv, rows)
+    if args.parquet:
+        write_parquet(args.parquet, rows)
+    print_summary(rows, args.by)
+
+
+if __name__ == '__main__':
+    main()